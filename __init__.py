@@ -23,6 +23,14 @@ if "bpy" in locals():
     importlib.reload(bae_panels)
     importlib.reload(bae_ops)
     importlib.reload(bae_globals)
+    importlib.reload(bae_trace)
+    importlib.reload(bae_encoder)
+    importlib.reload(bae_keyframes)
+    importlib.reload(bae_output)
+    importlib.reload(bae_brres)
+    importlib.reload(bae_patch)
+    importlib.reload(bae_engine)
+    importlib.reload(bae_cache)
     importlib.reload(bae_helpers)
 
 import bpy
@@ -30,6 +38,14 @@ from . import bae_main
 from . import bae_panels
 from . import bae_ops
 from . import bae_globals
+from . import bae_trace
+from . import bae_encoder
+from . import bae_keyframes
+from . import bae_output
+from . import bae_brres
+from . import bae_patch
+from . import bae_engine
+from . import bae_cache
 from . import bae_helpers
 
 bl_info = {
@@ -48,7 +64,9 @@ bl_info = {
 classes = (
     bae_main.BrresAnimationExporterProperties,
     bae_panels.BRRESANIMATIONEXPORTER_PT_All,
-    bae_ops.BRRESANIMATIONEXPORTER_OT_All
+    bae_ops.BRRESANIMATIONEXPORTER_OT_All,
+    bae_ops.BRRESANIMATIONEXPORTER_OT_Armature,
+    bae_ops.BRRESANIMATIONEXPORTER_OT_Materials
 )
 
 
@@ -60,8 +78,13 @@ def register():
     bpy.types.Scene.brres_animation_exporter_properties = bpy.props.PointerProperty(
         type=bae_main.BrresAnimationExporterProperties)
 
+    bae_panels.registerPanelState()
+
 
 def unregister():
+    bae_panels.unregisterPanelState()
+    bae_engine.shutdownEncodingEngine()
+
     for cls in classes:
         bpy.utils.unregister_class(cls)
 
@@ -0,0 +1,263 @@
+#  ***** GPL LICENSE BLOCK *****
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#  ***** GPL LICENSE BLOCK *****
+
+# <pep8 compliant>
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+# The encoder does not need Blender, so import its modules on their own
+# rather than with the add-on
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bae_globals import *
+from bae_keyframes import *
+from bae_encoder import *
+
+USAGE = """
+Time every stage of the encoder on synthetic curves and save the results:
+    python bae_bench.py --save bench.json
+
+Compare against a baseline, failing if any stage got slower than allowed:
+    python bae_bench.py --baseline bench.json --threshold 0.1
+
+Each CHR0 format (i4, i6, i12, l1, l4) is timed on every kind of curve:
+extraction (analyseKeyframeList and extractKeyframes), formatting
+(ChrAnimData.formatData, including statistics and format selection) and
+writing (combineSRT). get_srt_node and get_clr_node are timed on their own.
+"""
+
+# Kinds of synthetic curves.
+CURVES = ('bezier', 'constant', 'linear', 'vertical', 'baked')
+
+# Longest curve, in frames, each interpolated format can store.
+FORMAT_FRAMES = {'i4': 255, 'i6': 2047}
+
+
+def getArguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="bae_bench.py",
+        description="Benchmark the stages of the BRRES animation encoder.",
+        epilog=USAGE,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=1000,
+                        help="length of the curves in frames (shortened for "
+                        "formats that cannot store them)")
+    parser.add_argument('--baked-frames', type=int, default=20000,
+                        help="length of the baked curves in frames")
+    parser.add_argument('--repeat', type=int, default=20,
+                        help="number of times each stage is timed")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', help="only run benchmarks whose name "
+                        "contains this text")
+    parser.add_argument('--save', help="write the results to this JSON file")
+    parser.add_argument('--baseline', help="JSON file of earlier results to "
+                        "compare against")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="largest slowdown of a stage's median time, "
+                        "relative to the baseline, before it counts as a "
+                        "regression (default 0.1)")
+    return parser.parse_args()
+
+
+# Synthetic curves
+
+def makeCurve(kind: str, length: int, rng: random.Random) -> KeyframeSnapshot:
+    """
+    Returns a snapshot of a synthetic F-Curve 'length' frames long, starting
+    at frame 1:
+    - bezier: a keyframe every 5 frames, with automatic tangents on most
+      keyframes and broken (different left and right) tangents on every
+      third keyframe
+    - constant: steps held with constant interpolation
+    - linear: ramps with linear interpolation
+    - vertical: Bezier keyframes whose handles are vertical
+    - baked: a Bezier keyframe on every frame, as left by baking an action
+    """
+    step = 1 if kind == 'baked' else 5
+    frames = [float(frame) for frame in range(1, length + 1, step)]
+    values = [math.sin(frame / 20) + rng.uniform(-0.1, 0.1) for frame in frames]
+
+    interpolation = {'constant': INTERPOLATION_CONSTANT,
+                     'linear': INTERPOLATION_LINEAR}.get(kind, INTERPOLATION_BEZIER)
+    third = step / 3
+    left_x, left_y, right_x, right_y = [], [], [], []
+
+    for i, (frame, value) in enumerate(zip(frames, values)):
+        if kind == 'vertical':
+            left_x.append(frame)
+            left_y.append(value - 0.5)
+            right_x.append(frame)
+            right_y.append(value + 0.5)
+            continue
+
+        previous = values[max(i - 1, 0)]
+        following = values[min(i + 1, len(values) - 1)]
+        slope = (following - previous) / (2 * step)
+        left_slope = slope if kind != 'bezier' or i % 3 else -slope
+        left_x.append(frame - third)
+        left_y.append(value - left_slope * third)
+        right_x.append(frame + third)
+        right_y.append(value + slope * third)
+
+    return KeyframeSnapshot(frames, values, left_x, left_y, right_x, right_y,
+                            [interpolation] * len(frames))
+
+
+def sampleCurve(length: int, rng: random.Random) -> list:
+    """
+    Returns one value per frame, as sampled for the l1 and l4 formats.
+    """
+    return [math.sin(frame / 20) + rng.uniform(-0.1, 0.1)
+            for frame in range(length)]
+
+
+def extract(snapshot: KeyframeSnapshot, length: int) -> list:
+    left, right, count = analyseKeyframeList(snapshot, 1, length)
+    return extractKeyframes(left, right, snapshot, 1, length)
+
+
+# Timing
+
+def timeStage(setup, function, repeat: int) -> dict:
+    """
+    Times function(*setup()) 'repeat' times, calling setup outside of the
+    timed region, and returns the fastest and median time in seconds.
+    """
+    times = []
+    for i in range(repeat):
+        arguments = setup()
+        started = time.perf_counter()
+        function(*arguments)
+        times.append(time.perf_counter() - started)
+    return {'min': min(times), 'median': statistics.median(times)}
+
+
+def getChrAnimData(axes: list, format: str) -> ChrAnimData:
+    anim_data = ChrAnimData()
+    anim_data.updateFormat(format)
+    for axis, data in enumerate(axes):
+        anim_data.updateData(axis, list(data))
+    anim_data.updateFlags()
+    return anim_data
+
+
+def runBenchmarks(arguments: argparse.Namespace) -> dict:
+    rng = random.Random(arguments.seed)
+    settings = EncoderSettings()
+    repeat = arguments.repeat
+    results = {}
+
+    def run(name: str, setup, function, **info):
+        if arguments.only is None or arguments.only in name:
+            results[name] = dict(timeStage(setup, function, repeat), **info)
+            print("%-32s %10.3f ms" % (name, 1000 * results[name]['median']))
+
+    for format in CHR0_INTERPOLATED_FORMATS + CHR0_LINEAR_FORMATS:
+        for kind in CURVES:
+            if format in CHR0_LINEAR_FORMATS and kind != 'baked':
+                continue
+
+            length = arguments.baked_frames if kind == 'baked' else arguments.frames
+            length = min(length, FORMAT_FRAMES.get(format, length))
+            name = "chr0/%s/%s" % (format, kind)
+
+            if format in CHR0_LINEAR_FORMATS:
+                axes = [sampleCurve(length, rng) for axis in range(3)]
+            else:
+                snapshots = [makeCurve(kind, length, rng) for axis in range(3)]
+                run(name + "/extract", lambda: (snapshots[0], length), extract,
+                    keyframes=len(snapshots[0]))
+                axes = [extract(snapshot, length) for snapshot in snapshots]
+
+            # rotation, so values are converted to degrees
+            run(name + "/format", lambda: (getChrAnimData(axes, format), 1, settings),
+                ChrAnimData.formatData)
+
+            rotation = getChrAnimData(axes, format)
+            rotation.formatData(1, settings)
+            s, t = ChrAnimData(), ChrAnimData()
+            s.formatData(0, settings)
+            t.formatData(2, settings)
+            run(name + "/write", lambda: (s, rotation, t), combineSRT,
+                format=rotation.format(), bytes=len(combineSRT(s, rotation, t)))
+
+    for kind in CURVES:
+        length = arguments.baked_frames if kind == 'baked' else arguments.frames
+        data_all = [extract(makeCurve(kind, length, rng), length) for i in range(5)]
+        run("srt0/%s/write" % kind, lambda: ([list(data) for data in data_all],),
+            get_srt_node, keyframes=len(data_all[0]))
+
+    for length in (arguments.frames, arguments.baked_frames):
+        channels = [[rng.random() for frame in range(length)] for i in range(3)]
+        channels.append([1.0])
+        run("clr0/%s/write" % length, lambda: (channels, (0, 0, 0, 0), length),
+            get_clr_node)
+
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Returns a line for each stage whose median time exceeds its time in the
+    baseline by more than 'threshold' (relative).
+    """
+    regressions = []
+    for name, result in results.items():
+        if name in baseline:
+            before = baseline[name]['median']
+            after = result['median']
+            if before and after > before * (1 + threshold):
+                regressions.append("%s: %.3f ms -> %.3f ms (%+.0f%%)" % (
+                    name, 1000 * before, 1000 * after, 100 * (after / before - 1)))
+    return regressions
+
+
+def main() -> int:
+    arguments = getArguments()
+    results = runBenchmarks(arguments)
+
+    if arguments.save:
+        with open(arguments.save, 'w') as file:
+            json.dump({
+                'python': platform.python_version(),
+                'numpy': np.__version__ if np is not None else None,
+                'arguments': vars(arguments),
+                'results': results
+            }, file, indent=2)
+
+    if arguments.baseline:
+        with open(arguments.baseline, 'r') as file:
+            baseline = json.load(file)['results']
+        regressions = compare(results, baseline, arguments.threshold)
+        if regressions:
+            print("\nSlower than the baseline:\n%s" % '\n'.join(regressions))
+            return 1
+        print("\nNo stage is more than %.0f%% slower than the baseline"
+              % (100 * arguments.threshold))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
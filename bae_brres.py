@@ -0,0 +1,425 @@
+#  ***** GPL LICENSE BLOCK *****
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#  ***** GPL LICENSE BLOCK *****
+
+# <pep8 compliant>
+
+import struct
+
+# This module must not import bpy, so that complete files can be written
+# outside of Blender. When it is not loaded as part of the add-on package, fall
+# back to importing its siblings from the same directory.
+try:
+    from .bae_globals import *
+    from .bae_encoder import *
+    from .bae_trace import traced
+except ImportError:
+    from bae_globals import *
+    from bae_encoder import *
+    from bae_trace import traced
+
+
+def align(offset: int, alignment: int = 4) -> int:
+    return offset + (alignment - offset % alignment) % alignment
+
+
+def calcBrresId(object_name: bytes, subject_name: bytes) -> int:
+    """
+    Returns the index of the highest bit in which subject_name differs from
+    object_name, as (character index << 3 | bit index). If object_name is
+    shorter, returns the highest set bit of the last character of
+    subject_name. Returns 0xFFFF if the names are equal.
+    """
+    if len(object_name) < len(subject_name):
+        i = len(subject_name) - 1
+        return i << 3 | (subject_name[i].bit_length() - 1)
+
+    for i in range(len(subject_name) - 1, -1, -1):
+        difference = object_name[i] ^ subject_name[i]
+        if difference:
+            return i << 3 | (difference.bit_length() - 1)
+
+    return 0xFFFF
+
+
+def getBrresIdBit(name: bytes, id: int) -> int:
+    i = id >> 3
+    return i < len(name) and name[i] >> (id & 7) & 1
+
+
+def buildIndexGroup(names: list) -> list:
+    """
+    Builds the Patricia tree of a BRRES index group from a list of names
+    (bytes). Returns a list of [id, left index, right index, name] for the
+    root entry followed by an entry for each name, in the order given.
+    """
+    entries = [[0xFFFF, 0, 0, b'']]
+
+    for index, name in enumerate(names, 1):
+        item = [0, index, index, name]
+        entries.append(item)
+
+        prev = entries[0]
+        current_index = prev[1]
+        current = entries[current_index]
+        id = calcBrresId(b'', name)
+        is_right = False
+
+        while id <= current[0] < prev[0]:
+            if id == current[0]:
+                id = calcBrresId(current[3], name)
+                if getBrresIdBit(current[3], id):
+                    item[1], item[2] = index, current_index
+                else:
+                    item[1], item[2] = current_index, index
+
+            prev = current
+            is_right = getBrresIdBit(name, current[0])
+            current_index = current[2] if is_right else current[1]
+            current = entries[current_index]
+
+        if len(current[3]) == len(name) and getBrresIdBit(current[3], id):
+            item[2] = current_index
+        else:
+            item[1] = current_index
+
+        item[0] = id
+
+        if is_right:
+            prev[2] = index
+        else:
+            prev[1] = index
+
+    return entries
+
+
+def findIndexGroupEntry(entries: list, name: bytes) -> int:
+    """
+    Returns the index of the entry with the given name by walking the tree the
+    way the game does, or None if there is no such entry.
+    """
+    entry = entries[0]
+    next_index = entry[1]
+    while entry[0] > entries[next_index][0]:
+        entry = entries[next_index]
+        next_index = entry[2] if getBrresIdBit(name, entry[0]) else entry[1]
+    return next_index if next_index and entries[next_index][3] == name else None
+
+
+def get_index_group_size(count: int) -> int:
+    return 8 + 16 * (count + 1)
+
+
+def writeIndexGroup(buffer: bytearray, offset: int, names: list,
+                    data_offsets: list, string_offsets: list) -> None:
+    """
+    Writes an index group at 'offset'. data_offsets and string_offsets contain
+    the absolute offset in 'buffer' of the data and name of each entry.
+    """
+    entries = buildIndexGroup(names)
+    struct.pack_into('>II', buffer, offset,
+                     get_index_group_size(len(names)), len(names))
+
+    entry_offset = offset + 8
+    for i, (id, left, right, name) in enumerate(entries):
+        if i:
+            name_offset = string_offsets[i - 1] - offset
+            data_offset = data_offsets[i - 1] - offset
+        else:
+            name_offset = data_offset = 0
+        struct.pack_into('>HHHHii', buffer, entry_offset,
+                         id, 0, left, right, name_offset, data_offset)
+        entry_offset += 16
+
+
+class StringTable():
+    """
+    A BRRES string table. Each name is stored once, preceded by its length and
+    followed by at least one null byte, with every string aligned to 4 bytes.
+    Offsets of names point to their first character.
+    """
+
+    def __init__(self):
+        self.__names = {}
+        self.__size = 0
+
+    def add(self, name: bytes):
+        if name not in self.__names:
+            self.__names[name] = self.__size + 4
+            self.__size += align(4 + len(name) + 1)
+
+    def size(self) -> int:
+        return self.__size
+
+    def offset(self, name: bytes) -> int:
+        """
+        Returns the offset of the name relative to the start of the table.
+        """
+        return self.__names[name]
+
+    def write(self, buffer: bytearray, offset: int) -> None:
+        for name, name_offset in self.__names.items():
+            struct.pack_into('>I', buffer, offset + name_offset - 4, len(name))
+            buffer[offset + name_offset: offset + name_offset + len(name)] = name
+
+
+def encodeName(name: str) -> bytes:
+    return remove_non_ascii(name).encode('ascii')
+
+
+def encodeEntryNames(names: list, kind: str) -> list:
+    """
+    Returns the names of the entries of an index group, encoded with
+    encodeName. Raises a ValueError if a name is empty, or two names are the
+    same, once non-ASCII characters are removed, as the game finds entries by
+    name. 'kind' describes the entries in the error, e.g. "Bone".
+    """
+    encoded = {}
+    for name in names:
+        name_bytes = encodeName(name)
+        if not name_bytes:
+            raise ValueError("%s name '%s' is empty once non-ASCII characters "
+                             "are removed" % (kind, name))
+        elif name_bytes in encoded:
+            raise ValueError("%s names '%s' and '%s' are the same once "
+                             "non-ASCII characters are removed"
+                             % (kind, encoded[name_bytes], name))
+        encoded[name_bytes] = name
+    return list(encoded)
+
+
+@traced('encoding', file='CHR0')
+def get_chr0_file(name: str, bones: list, frame_count: int,
+                  loop: bool = False) -> bytearray:
+    """
+    Returns a complete CHR0 file (version 4) containing a CHR0 node for each
+    bone. bones is a list of (bone name, (s, r, t)), where s, r and t are the
+    formatted ChrAnimData of the bone returned by encodeChrBone. Frame data
+    blocks with identical contents are stored once and shared by all nodes
+    that use them. Raises a ValueError if the bone names are not valid entry
+    names (see encodeEntryNames).
+    """
+    strings = StringTable()
+    names = encodeEntryNames([bone_name for bone_name, anim_data in bones],
+                             "Bone")
+    file_name = encodeName(name)
+    for bone_name in names:
+        strings.add(bone_name)
+    strings.add(file_name)
+
+    group_offset = CHR0_HEADER_SIZE
+    node_offset = group_offset + get_index_group_size(len(bones))
+
+    # First pass: place the nodes, followed by the distinct frame data blocks
+    nodes = []
+    for bone_name, anim_data in bones:
+        node = combineSRT(*anim_data)
+        size, slots, name_offset = get_chr_node_layout(*anim_data)
+        blocks = []
+        for chr_anim_data, data, stats, slot_offset, offset in slots:
+            if offset is not None:
+                format = chr_anim_data.format()
+                blocks.append((slot_offset, bytes(node[
+                    offset: offset + CHR0_FRAME_HEADER_SIZES[format]
+                    + CHR0_KEYFRAME_SIZES[format] * len(data)])))
+        header_size = 8 + 4 * len(slots)
+        nodes.append((node[:header_size], node_offset, blocks))
+        node_offset += header_size
+
+    block_offsets = {}
+    data_end = node_offset
+    for header, node_offset, blocks in nodes:
+        for slot_offset, block in blocks:
+            if block not in block_offsets:
+                block_offsets[block] = data_end
+                data_end = align(data_end + len(block))
+
+    string_offset = data_end
+    size = string_offset + strings.size()
+
+    # Second pass: write everything into a single buffer
+    file = bytearray(size)
+    struct.pack_into('>4sIIiiiiHHII', file, 0,
+                     b'CHR0',
+                     size,
+                     CHR0_FILE_VERSION,
+                     0,  # offset to BRRES (none for a standalone file)
+                     group_offset,
+                     string_offset + strings.offset(file_name),
+                     0,  # original path
+                     frame_count,
+                     len(bones),
+                     loop,
+                     0  # scaling rule
+                     )
+
+    writeIndexGroup(file, group_offset, names,
+                    [node_offset for header, node_offset, blocks in nodes],
+                    [string_offset + strings.offset(bone_name) for bone_name in names])
+
+    for bone_name, (header, node_offset, blocks) in zip(names, nodes):
+        file[node_offset: node_offset + len(header)] = header
+        struct.pack_into('>i', file, node_offset,
+                         string_offset + strings.offset(bone_name) - node_offset)
+        for slot_offset, block in blocks:
+            struct.pack_into('>i', file, node_offset + slot_offset,
+                             block_offsets[block] - node_offset)
+
+    for block, block_offset in block_offsets.items():
+        file[block_offset: block_offset + len(block)] = block
+
+    strings.write(file, string_offset)
+
+    return file
+
+
+@traced('encoding', file='material')
+def get_material_file(magic: bytes, version: int, header_size: int,
+                      header_format: str, header_values: tuple, name: str,
+                      materials: list) -> bytearray:
+    """
+    Returns a complete SRT0 or CLR0 file. The header starts with the fields
+    common to all BRRES sub-files, followed by header_values packed with
+    header_format. materials is a list of (material name, entry), where entry
+    is the material entry returned by get_srt0_material or get_clr0_material.
+    Raises a ValueError if the material names are not valid entry names (see
+    encodeEntryNames).
+    """
+    strings = StringTable()
+    names = encodeEntryNames([material_name for material_name, entry in materials],
+                             "Material")
+    file_name = encodeName(name)
+    for material_name in names:
+        strings.add(material_name)
+    strings.add(file_name)
+
+    group_offset = header_size
+    entry_offsets = []
+    string_offset = group_offset + get_index_group_size(len(materials))
+    for material_name, entry in materials:
+        entry_offsets.append(string_offset)
+        string_offset += len(entry)
+    size = string_offset + strings.size()
+
+    file = bytearray(size)
+    struct.pack_into('>4sIIiiii' + header_format.lstrip('>'), file, 0,
+                     magic,
+                     size,
+                     version,
+                     0,  # offset to BRRES (none for a standalone file)
+                     group_offset,
+                     string_offset + strings.offset(file_name),
+                     0,  # original path
+                     *header_values
+                     )
+
+    writeIndexGroup(file, group_offset, names, entry_offsets,
+                    [string_offset + strings.offset(material_name)
+                     for material_name in names])
+
+    for material_name, entry_offset, (unused, entry) in zip(names, entry_offsets,
+                                                            materials):
+        file[entry_offset: entry_offset + len(entry)] = entry
+        struct.pack_into('>i', file, entry_offset,
+                         string_offset + strings.offset(material_name) - entry_offset)
+
+    strings.write(file, string_offset)
+
+    return file
+
+
+def get_srt0_material(textures: list) -> bytearray:
+    """
+    Returns an SRT0 material entry. textures is a list of (texture index,
+    node), where node is the texture entry returned by get_srt_node. The name
+    offset of the entry is left for the file writer to fill in.
+    """
+    textures = sorted(textures, key=lambda texture: texture[0])
+    entry = bytearray(12 + 4 * len(textures))
+
+    flags = 0
+    for i, (index, node) in enumerate(textures):
+        flags |= 1 << index
+        struct.pack_into('>I', entry, 12 + 4 * i, len(entry))
+        entry += node
+
+    # texture flags, indirect texture flags
+    struct.pack_into('>II', entry, 4, flags, 0)
+
+    return entry
+
+
+def get_clr0_material(targets: list, count: int) -> bytearray:
+    """
+    Returns a CLR0 material entry. targets is a list of (target index,
+    data_all, mask), where data_all and mask are as for get_clr_node. A target
+    whose colour never changes is stored as a single constant colour. The name
+    offset of the entry is left for the file writer to fill in.
+    """
+    targets = sorted(targets, key=lambda target: target[0])
+    entry = bytearray(8 + 8 * len(targets))
+
+    flags = 0
+    for i, (index, data_all, mask) in enumerate(targets):
+        field_offset = 8 + 8 * i
+        channels = [scaleColourValues(data_all[rgba]) for rgba in range(4)]
+
+        entry[field_offset: field_offset + 4] = bytes(
+            scaleColourValue(mask[rgba]) for rgba in range(4))
+
+        if all(min(channel) == max(channel) for channel in channels):
+            flags |= CLR0_TARGET_CONSTANT << 2 * index
+            entry[field_offset + 4: field_offset + 8] = bytes(
+                channel[0] for channel in channels)
+        else:
+            flags |= CLR0_TARGET_EXISTS << 2 * index
+            # relative to the offset itself
+            struct.pack_into('>i', entry, field_offset + 4,
+                             len(entry) - (field_offset + 4))
+            entry += get_clr_colours(channels, count)
+
+    struct.pack_into('>I', entry, 4, flags)
+
+    return entry
+
+
+def get_srt0_file(name: str, materials: list, frame_count: int,
+                  loop: bool = False) -> bytearray:
+    """
+    Returns a complete SRT0 file (version 4). materials is a list of (material
+    name, textures), with textures as for get_srt0_material.
+    """
+    return get_material_file(
+        b'SRT0', SRT0_FILE_VERSION, SRT0_HEADER_SIZE, '>HHII',
+        (frame_count, len(materials), 0, loop),  # matrix mode: Maya
+        name,
+        [(material_name, get_srt0_material(textures))
+         for material_name, textures in materials])
+
+
+def get_clr0_file(name: str, materials: list, frame_count: int,
+                  loop: bool = False) -> bytearray:
+    """
+    Returns a complete CLR0 file (version 3). materials is a list of (material
+    name, targets), with targets as for get_clr0_material. Every colour that
+    changes is stored for each of the frame_count frames.
+    """
+    return get_material_file(
+        b'CLR0', CLR0_FILE_VERSION, CLR0_HEADER_SIZE, '>HHI',
+        (frame_count, len(materials), loop),
+        name,
+        [(material_name, get_clr0_material(targets, frame_count))
+         for material_name, targets in materials])
@@ -0,0 +1,367 @@
+#  ***** GPL LICENSE BLOCK *****
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#  ***** GPL LICENSE BLOCK *****
+
+# <pep8 compliant>
+
+import hashlib
+import json
+import os
+import pickle
+import re
+import stat
+import struct
+import sys
+
+# This module must not import bpy, so that the cache can be used outside of
+# Blender. When it is not loaded as part of the add-on package, fall back to
+# importing its siblings from the same directory.
+try:
+    from .bae_globals import *
+    from .bae_encoder import ChrAnimData
+    from .bae_engine import runToEnd
+    from .bae_trace import span
+except ImportError:
+    from bae_globals import *
+    from bae_encoder import ChrAnimData
+    from bae_engine import runToEnd
+    from bae_trace import span
+
+# Header of a stored result: magic, byte order of the machine that stored it
+# (keyframe arrays are stored in that order), whether it has data, the report
+# and the size of the error message.
+ENTRY_HEADER = '>4s1s?qqI'
+ENTRY_MAGIC = b'BAEC'
+
+# Record of the index of stored results: the key and the size of the entry.
+INDEX_RECORD = '>20sI'
+
+
+def getDigest(*parts) -> str:
+    """
+    Returns a hash of the given picklable objects. Equal objects built the
+    same way have the same hash.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    for part in parts:
+        digest.update(pickle.dumps(part, protocol=4))
+    return digest.hexdigest()
+
+
+def packResult(task: str, result: tuple) -> bytes:
+    """
+    Returns the result of an encoding task (see bae_engine.TASKS) packed into
+    bytes that unpackResult reads back, or None if results of the task cannot
+    be stored.
+    """
+    data, report, error = result
+    if task == 'chr0':
+        body = b'' if data is None else b''.join(
+            anim_data.toBytes() for anim_data in data)
+    elif task == 'srt0':
+        body = b'' if data is None else bytes(data)
+    else:
+        return None
+
+    error = b'' if error is None else error.encode('utf-8')
+    return struct.pack(ENTRY_HEADER, ENTRY_MAGIC, sys.byteorder[0].encode('ascii'),
+                       data is not None, report['keys_removed'],
+                       report['bytes_saved'], len(error)) + error + body
+
+
+def unpackResult(task: str, entry: bytes) -> tuple:
+    """
+    Returns the result of an encoding task packed by packResult. Raises a
+    ValueError or struct.error if 'entry' is not a valid result of the task.
+    """
+    magic, byte_order, has_data, keys_removed, bytes_saved, error_size = (
+        struct.unpack_from(ENTRY_HEADER, entry))
+    if magic != ENTRY_MAGIC or byte_order != sys.byteorder[0].encode('ascii'):
+        raise ValueError("Not a result stored on this machine")
+
+    offset = struct.calcsize(ENTRY_HEADER)
+    error = entry[offset: offset + error_size].decode('utf-8') or None
+    offset += error_size
+
+    if not has_data:
+        data = None
+    elif task == 'chr0':
+        data = []
+        for srt in range(3):
+            anim_data, offset = ChrAnimData.fromBytes(entry, offset)
+            data.append(anim_data)
+    else:
+        data = bytearray(entry[offset:])
+        offset = len(entry)
+
+    if offset != len(entry):
+        raise ValueError("Stored result has the wrong size")
+    return data, {'keys_removed': keys_removed, 'bytes_saved': bytes_saved}, error
+
+
+class ExportCache():
+    """
+    Results of encoding tasks stored on disk, keyed by a hash of the task, its
+    payload (extracted keyframes, formats and encoding settings) and
+    ENCODER_VERSION, so results are reused across exports and sessions.
+    Results are packed with packResult rather than pickled, so reading a
+    stored result cannot run code. An index lists the size of every result in
+    the order they were written, and the least recently written results are
+    deleted once they take more than max_bytes. Also remembers the hash of
+    the files written by the add-on, so an export identical to an earlier one
+    can reference the earlier file.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = EXPORT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.__files = None
+        self.__index = None
+        self.__size = 0
+        self.__pruned = False
+
+    def __getPath(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + '.entry')
+
+    def __getIndexPath(self) -> str:
+        return os.path.join(self.directory, 'index')
+
+    def __write(self, path: str, data: bytes):
+        # write to a temporary file first, so other processes never read a
+        # partial entry
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = '%s.%s.tmp' % (path, os.getpid())
+        with open(temporary, 'wb') as file:
+            file.write(data)
+        os.replace(temporary, path)
+
+    def __readIndex(self) -> dict:
+        """
+        Returns the size of each stored result by key, least recently written
+        first, as listed by the index file.
+        """
+        try:
+            with open(self.__getIndexPath(), 'rb') as file:
+                data = file.read()
+        except OSError:
+            return {}
+
+        # A record cut short by a crash while it was appended is ignored
+        index = {}
+        data = data[:len(data) - len(data) % struct.calcsize(INDEX_RECORD)]
+        for digest, size in struct.iter_unpack(INDEX_RECORD, data):
+            key = digest.hex()
+            index.pop(key, None)
+            index[key] = size
+        return index
+
+    def __getIndex(self) -> dict:
+        if self.__index is None:
+            self.__index = self.__readIndex()
+            self.__size = sum(self.__index.values())
+        return self.__index
+
+    def get(self, task: str, key: str):
+        """
+        Returns the stored result of the task with the given key, or None.
+        """
+        try:
+            with open(self.__getPath(key), 'rb') as file:
+                result = unpackResult(task, file.read())
+        except (OSError, ValueError, struct.error):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, task: str, key: str, result):
+        entry = packResult(task, result)
+        if entry is None:
+            return
+        try:
+            self.__write(self.__getPath(key), entry)
+            # Records are appended, so processes sharing the cache do not
+            # overwrite each other's records
+            with open(self.__getIndexPath(), 'ab') as file:
+                file.write(struct.pack(INDEX_RECORD, bytes.fromhex(key), len(entry)))
+        except OSError as error:
+            print("Could not write to export cache: %s" % error)
+            return
+
+        index = self.__getIndex()
+        self.__size += len(entry) - index.pop(key, 0)
+        index[key] = len(entry)
+        if self.__size > self.max_bytes:
+            self.__evict()
+
+    def run(self, engine, task: str, payloads: list):
+        """
+        Equivalent to engine.run(task, payloads), but only runs the payloads
+        whose results are not stored, and stores their results.
+        """
+        self.prune()
+        with span('cache lookup', task=task, payloads=len(payloads)) as lookup_span:
+            keys = [getDigest(ENCODER_VERSION, task, payload) for payload in payloads]
+            results = [self.get(task, key) for key in keys]
+            missing = [i for i, result in enumerate(results) if result is None]
+            lookup_span.set(hits=len(payloads) - len(missing))
+        found = len(payloads) - len(missing)
+        yield found
+
+        if missing:
+            generator = engine.run(task, [payloads[i] for i in missing])
+            try:
+                while True:
+                    yield found + next(generator)
+            except StopIteration as stop:
+                computed = stop.value
+            finally:
+                generator.close()
+
+            for i, result in zip(missing, computed):
+                results[i] = result
+                self.put(task, keys[i], result)
+
+        return results
+
+    def map(self, engine, task: str, payloads: list) -> list:
+        return runToEnd(self.run(engine, task, payloads))
+
+    def prune(self):
+        """
+        Deletes the least recently written results if they take more than
+        max_bytes. Runs at most once per cache object; results written through
+        the object are counted as they are written.
+        """
+        if self.__pruned:
+            return
+        self.__pruned = True
+        self.__index = None
+        self.__getIndex()
+        if self.__size > self.max_bytes:
+            self.__evict()
+
+    def __evict(self):
+        # Delete down to three quarters of the budget, so the index is not
+        # rewritten for every result written once the cache is full
+        index = self.__getIndex()
+        evicted = set()
+        for key in list(index):
+            if self.__size <= self.max_bytes * 3 // 4:
+                break
+            self.__size -= index.pop(key)
+            evicted.add(key)
+            try:
+                os.remove(self.__getPath(key))
+            except OSError:
+                pass
+
+        # Other processes may have appended records since the index was
+        # read, so rewrite it from its current contents
+        self.__index = {key: size for key, size in self.__readIndex().items()
+                        if key not in evicted}
+        self.__size = sum(self.__index.values())
+        try:
+            self.__write(self.__getIndexPath(), b''.join(
+                struct.pack(INDEX_RECORD, bytes.fromhex(key), size)
+                for key, size in self.__index.items()))
+        except OSError as error:
+            print("Could not write to export cache: %s" % error)
+
+    def __getFiles(self) -> dict:
+        if self.__files is None:
+            try:
+                with open(os.path.join(self.directory, 'files.json'), 'r') as file:
+                    self.__files = json.load(file)
+            except (OSError, ValueError):
+                self.__files = {}
+        return self.__files
+
+    def findFile(self, directory: str, head: str, extension: str,
+                 data: bytes) -> str:
+        """
+        Returns the path of a file written earlier by the add-on in the given
+        directory, named 'head' or 'head(i)' followed by 'extension', whose
+        contents equal 'data'. Returns None if there is no such file.
+        """
+        pattern = re.compile(re.escape(head) + r'(\(\d+\))?' + re.escape(extension) + '$')
+        directory = os.path.normcase(os.path.abspath(directory))
+
+        for path in self.__getFiles().get(getDigest(bytes(data)), []):
+            if (os.path.normcase(os.path.dirname(path)) == directory
+                    and pattern.match(os.path.basename(path))):
+                try:
+                    with open(path, 'rb') as file:
+                        if file.read() == data:
+                            return path
+                except OSError:
+                    pass
+        return None
+
+    def addFile(self, path: str, data: bytes):
+        """
+        Records that a file with the given contents was written to 'path'.
+        """
+        files = self.__getFiles()
+        paths = files.setdefault(getDigest(bytes(data)), [])
+        path = os.path.abspath(path)
+        if path not in paths:
+            paths.append(path)
+        try:
+            self.__write(os.path.join(self.directory, 'files.json'),
+                         json.dumps(files).encode('utf-8'))
+        except OSError as error:
+            print("Could not write to export cache: %s" % error)
+
+
+def checkCacheDirectory(directory: str):
+    """
+    Creates the directory of an export cache, accessible only by the current
+    user, if it does not exist. Raises an OSError if it cannot be created, or
+    is not a directory owned by the current user, as results stored by
+    another user could change the exported files.
+    """
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode):
+        raise PermissionError("Export cache '%s' is not a directory" % directory)
+
+    # Windows has no user IDs; there the directory is in the user's profile
+    if hasattr(os, 'getuid'):
+        if info.st_uid != os.getuid():
+            raise PermissionError("Export cache '%s' is not owned by the "
+                                  "current user" % directory)
+        if info.st_mode & 0o077:
+            os.chmod(directory, 0o700)
+
+
+_caches = {}
+
+
+def getExportCache(directory: str) -> ExportCache:
+    """
+    Returns the export cache stored in 'directory', checked with
+    checkCacheDirectory the first time it is used. Raises an OSError if the
+    directory fails the check.
+    """
+    key = os.path.normcase(os.path.abspath(directory))
+    cache = _caches.get(key)
+    if cache is None:
+        checkCacheDirectory(directory)
+        cache = _caches[key] = ExportCache(directory)
+    return cache
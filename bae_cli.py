@@ -0,0 +1,373 @@
+#  ***** GPL LICENSE BLOCK *****
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#  ***** GPL LICENSE BLOCK *****
+
+# <pep8 compliant>
+
+import argparse
+import concurrent.futures
+import glob
+import importlib
+import json
+import os
+import subprocess
+import sys
+import traceback
+
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+# Prefix of the line a Blender process prints to pass its results back to the
+# dispatcher.
+RESULT_PREFIX = "BAE_RESULT "
+
+USAGE = """
+Export one blend file:
+    blender --background --python bae_cli.py -- --job job.json --blend scene.blend
+
+Export every blend file of a job with N Blender processes at a time:
+    python bae_cli.py --job job.json --jobs N [--blender path/to/blender]
+    blender --background --python bae_cli.py -- --job job.json --jobs N
+
+Job file (paths are relative to the job file):
+    {
+        "blends": ["levels/*.blend", "characters/mario.blend"],
+        "output": "build/animations",
+        "brres": "build/mario.brres",
+        "settings": {"scale_format": "i6", "loop": true},
+        "exports": [
+            {"type": "CHR0", "object": "Armature", "action": "Walk",
+             "bones": ["Hip", "Spine"], "name": "Walk",
+             "settings": {"start_frame": 1, "end_frame": 60}},
+            {"type": "CLR0", "objects": ["Lamp"], "name": "LampGlow"},
+            {"type": "SRT0"}
+        ]
+    }
+
+"settings" contain values of the add-on's panel settings, by property name.
+Without "output", files are written next to each blend file. Existing files
+are never overwritten: a file whose name is taken is written under the next
+free numbered name (e.g. Walk(1).chr0). With "brres", the files are also
+written into that BRRES file once every blend file has been exported.
+Without "object", a CHR0 export covers every armature with an action, and
+without "objects", an SRT0 or CLR0 export covers every object in the scene.
+"""
+
+
+def getArguments() -> argparse.Namespace:
+    # Blender passes the arguments after '--' on to the script
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else sys.argv[1:]
+
+    parser = argparse.ArgumentParser(
+        prog="bae_cli.py",
+        description="Export BRRES animations from blend files without a UI.",
+        epilog=USAGE,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--job', required=True, help="job file (JSON)")
+    parser.add_argument('--blend', help="export only this blend file")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help="number of Blender processes run at a time")
+    parser.add_argument('--encode-workers', type=int,
+                        help="processes encoding nodes in each Blender process, "
+                        "unless set by the job (default: the cores divided by "
+                        "--jobs)")
+    parser.add_argument('--blender', help="Blender executable used to export "
+                        "blend files (default: $BLENDER or 'blender')")
+    parser.add_argument('--no-brres', action='store_true',
+                        help="do not write into the job's BRRES file")
+    return parser.parse_args(argv)
+
+
+def loadJob(path: str) -> dict:
+    with open(path, 'r') as file:
+        job = json.load(file)
+    job['directory'] = os.path.dirname(os.path.abspath(path))
+    return job
+
+
+def resolvePath(job: dict, path: str) -> str:
+    return os.path.normpath(os.path.join(job['directory'], path))
+
+
+def getBlendFiles(job: dict) -> list:
+    """
+    Returns the blend files of the job, each once, in the order given with
+    the matches of each pattern sorted.
+    """
+    blends = []
+    for pattern in job.get('blends', []):
+        for path in sorted(glob.glob(resolvePath(job, pattern))):
+            if path not in blends:
+                blends.append(path)
+    return blends
+
+
+def writeIntoBrres(job: dict, files: list) -> int:
+    """
+    Writes the exported files into the BRRES file of the job. Returns the
+    number of files that could not be written.
+    """
+    # The patcher does not need Blender, so import it on its own rather than
+    # with the add-on
+    directory = os.path.dirname(os.path.abspath(__file__))
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    import bae_patch
+
+    path = resolvePath(job, job['brres'])
+    errors = 0
+    try:
+        with bae_patch.BrresPatcher(path) as patcher:
+            for filename in files:
+                try:
+                    with open(filename, 'rb') as file:
+                        patcher.replaceSubfile(file.read())
+                except (ValueError, OSError) as error:
+                    print("Error: %s: %s" % (filename, error))
+                    errors += 1
+    except (ValueError, OSError) as error:
+        print("Error: %s" % error)
+        return len(files)
+    print("Wrote %s files into %s" % (len(files) - errors, path))
+    return errors
+
+
+# Dispatcher: runs a Blender process for each blend file
+
+def exportBlendFile(blender: str, job_path: str, blend: str,
+                    encode_workers: int) -> dict:
+    command = [blender, '--background', '--factory-startup', blend,
+               '--python', os.path.abspath(__file__),
+               '--', '--job', job_path, '--blend', blend, '--no-brres',
+               '--encode-workers', str(encode_workers)]
+    process = subprocess.run(command, stdout=subprocess.PIPE,
+                             stderr=subprocess.STDOUT, universal_newlines=True)
+
+    for line in process.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+
+    return {'blend': blend, 'files': [], 'errors': 1, 'failures': [],
+            'summary': ["Error: Blender exited with code %s\n%s"
+                        % (process.returncode, process.stdout[-2000:])]}
+
+
+def dispatch(arguments: argparse.Namespace, job: dict) -> int:
+    blends = getBlendFiles(job)
+    if bpy is not None:
+        blender = bpy.app.binary_path
+    else:
+        blender = arguments.blender or os.environ.get('BLENDER', 'blender')
+
+    # Each Blender process encodes with its own worker processes, so share
+    # the cores between them rather than starting one worker per core in each
+    jobs = max(1, arguments.jobs)
+    encode_workers = arguments.encode_workers
+    if encode_workers is None:
+        encode_workers = max(1, (os.cpu_count() or 1) // jobs)
+
+    files = []
+    errors = 0
+
+    # Results are reported in the order of the blend files, whichever
+    # process finishes first
+    with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+        futures = [executor.submit(exportBlendFile, blender,
+                                   os.path.abspath(arguments.job), blend,
+                                   encode_workers)
+                   for blend in blends]
+        for future in futures:
+            result = future.result()
+            print("\n%s:\n%s" % (result['blend'], '\n'.join(result['summary'])))
+            files += result['files']
+            errors += result['errors']
+
+    if job.get('brres') and not arguments.no_brres and files:
+        errors += writeIntoBrres(job, files)
+
+    print("\nExported %s files from %s blend files with %s errors"
+          % (len(files), len(blends), errors))
+    return 1 if errors else 0
+
+
+# Worker: exports the blend file open in this Blender process
+
+def importAddon():
+    """
+    Imports the add-on from the directory containing this script, and
+    registers it unless it is already registered.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    if os.path.dirname(directory) not in sys.path:
+        sys.path.insert(0, os.path.dirname(directory))
+    addon = importlib.import_module(os.path.basename(directory))
+    if bpy is not None and not hasattr(bpy.types.Scene,
+                                       'brres_animation_exporter_properties'):
+        addon.register()
+    return addon
+
+
+def applySettings(settings, values: dict) -> None:
+    for name, value in values.items():
+        if name not in type(settings).__annotations__:
+            raise ValueError("Unknown setting '%s'" % name)
+        setattr(settings, name, value)
+
+
+def writeFile(addon, output: str, name: str, file_data: bytes) -> str:
+    """
+    Writes a complete CHR0, SRT0 or CLR0 file into 'output' and returns its
+    path. Existing files are never overwritten; the file is numbered instead.
+    """
+    os.makedirs(output, exist_ok=True)
+    return addon.bae_output.writeUniqueFile(
+        output, bpy.path.clean_name(name),
+        '.' + bytes(file_data[:4]).decode('ascii').lower(), file_data)
+
+
+def runExport(addon, job: dict, export: dict, blend: str,
+              defaults: dict) -> (list, list, int):
+    """
+    Runs one export of the job on the open blend file. 'defaults' are setting
+    values used unless the job or the export sets them. Returns the files
+    written, the summary and the number of errors.
+    """
+    helpers = addon.bae_helpers
+    scene = bpy.context.scene
+    settings = scene.brres_animation_exporter_properties
+    values = dict(defaults)
+    values.update(job.get('settings', {}))
+    values.update(export.get('settings', {}))
+    values['node_type'] = export.get('type', 'CHR0')
+    applySettings(settings, values)
+
+    output = resolvePath(job, job['output']) if 'output' in job else os.path.dirname(blend)
+    files = []
+    summary = []
+    errors = 0
+
+    if settings.node_type == 'CHR0':
+        if 'object' in export:
+            objects = [bpy.data.objects.get(export['object'])]
+            if objects[0] is None:
+                return [], ["%s: skipped, not in this blend file" % export['object']], 0
+        else:
+            objects = [obj for obj in scene.objects if obj.type == 'ARMATURE'
+                       and obj.animation_data is not None
+                       and obj.animation_data.action is not None]
+
+        for obj in objects:
+            if 'action' in export:
+                if obj.animation_data is None:
+                    obj.animation_data_create()
+                obj.animation_data.action = bpy.data.actions[export['action']]
+            action = obj.animation_data.action
+
+            if 'start_frame' not in values:
+                settings.start_frame = int(action.frame_range[0])
+            if 'end_frame' not in values:
+                settings.end_frame = int(action.frame_range[1])
+            settings.node_name = export.get('name', action.name)
+
+            encoded, bone_summary, failed = helpers.encodeArmature(
+                settings, obj, export.get('bones'))
+            summary.append("%s (%s):" % (obj.name, action.name))
+            summary += ["  " + line for line in bone_summary]
+            errors += failed
+
+            if encoded:
+                files.append(writeFile(addon, output, settings.node_name, addon.bae_brres.get_chr0_file(
+                    settings.node_name, encoded,
+                    settings.end_frame - settings.start_frame + 1, settings.loop)))
+
+    else:
+        if 'objects' in export:
+            objects = [bpy.data.objects[name] for name in export['objects']
+                       if name in bpy.data.objects]
+        else:
+            objects = list(scene.objects)
+
+        if 'start_frame' not in values:
+            settings.start_frame = scene.frame_start
+        if 'end_frame' not in values:
+            settings.end_frame = scene.frame_end
+        settings.node_name = export.get(
+            'name', os.path.splitext(os.path.basename(blend))[0])
+
+        materials = helpers.getMaterials(objects)
+        entries, material_summary, failed = helpers.encodeMaterials(settings, materials)
+        summary += material_summary
+        errors += failed
+
+        if entries:
+            files.append(writeFile(addon, output, settings.node_name,
+                                   helpers.getMaterialFile(settings, entries)))
+
+    summary += ["-> %s" % filename for filename in files]
+    return files, summary, errors
+
+
+def work(arguments: argparse.Namespace, job: dict) -> int:
+    blend = os.path.abspath(arguments.blend)
+    if os.path.abspath(bpy.data.filepath) != blend:
+        bpy.ops.wm.open_mainfile(filepath=blend)
+
+    addon = importAddon()
+    result = {'blend': blend, 'files': [], 'summary': [], 'errors': 0,
+              'failures': []}
+    defaults = {}
+    if arguments.encode_workers is not None:
+        defaults['encode_workers'] = arguments.encode_workers
+
+    # A failed export is recorded and the remaining exports still run
+    for index, export in enumerate(job.get('exports', [])):
+        try:
+            files, summary, errors = runExport(addon, job, export, blend, defaults)
+        except Exception as error:
+            result['failures'].append({
+                'export': index,
+                'type': export.get('type', 'CHR0'),
+                'error': type(error).__name__,
+                'message': str(error),
+                'traceback': traceback.format_exc()})
+            files, summary, errors = [], ["Error: %s: %s: %s" % (
+                export.get('type', 'CHR0'), type(error).__name__, error)], 1
+        result['files'] += files
+        result['summary'] += summary
+        result['errors'] += errors
+
+    if job.get('brres') and not arguments.no_brres and result['files']:
+        result['errors'] += writeIntoBrres(job, result['files'])
+
+    print(RESULT_PREFIX + json.dumps(result))
+    return 1 if result['errors'] else 0
+
+
+def main() -> int:
+    arguments = getArguments()
+    job = loadJob(arguments.job)
+    if arguments.blend is not None:
+        if bpy is None:
+            print("Exporting a single blend file must be run by Blender")
+            return 2
+        return work(arguments, job)
+    return dispatch(arguments, job)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
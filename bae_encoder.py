@@ -0,0 +1,1414 @@
+#  ***** GPL LICENSE BLOCK *****
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#  ***** GPL LICENSE BLOCK *****
+
+# <pep8 compliant>
+
+import struct
+import math
+from array import array
+import functools
+import itertools
+import bisect
+
+# This module must not import bpy, so that nodes can be encoded outside of
+# Blender. When it is not loaded as part of the add-on package, fall back to
+# importing its siblings from the same directory.
+try:
+    from .bae_globals import *
+    from .bae_trace import span, count, traced
+except ImportError:
+    from bae_globals import *
+    from bae_trace import span, count, traced
+
+# NumPy is bundled with Blender, but may be missing from a plain Python
+# installation. Pure Python fallbacks are used in that case.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class EncoderSettings():
+    """
+    Settings used to encode nodes outside of Blender. Attribute names and
+    defaults match those of BrresAnimationExporterProperties, so either can be
+    passed to the encoding functions.
+    """
+
+    def __init__(self, xyz_to_xzy=True, scale_translation=100.0,
+                 convert_to_degrees=True, error_bounded_format=False,
+                 format_tolerance=0.01, reduce_keyframes=False,
+                 reduction_tolerance=0.001):
+        self.xyz_to_xzy = xyz_to_xzy
+        self.scale_translation = scale_translation
+        self.convert_to_degrees = convert_to_degrees
+        self.error_bounded_format = error_bounded_format
+        self.format_tolerance = format_tolerance
+        self.reduce_keyframes = reduce_keyframes
+        self.reduction_tolerance = reduction_tolerance
+
+    @classmethod
+    def fromSettings(cls, settings):
+        """
+        Returns a copy of the encoding settings of any object with the
+        attributes of EncoderSettings, such as the add-on's scene properties.
+        Unlike the scene properties, the copy can be pickled and sent to
+        another process.
+        """
+        return cls(settings.xyz_to_xzy, settings.scale_translation,
+                   settings.convert_to_degrees, settings.error_bounded_format,
+                   settings.format_tolerance, settings.reduce_keyframes,
+                   settings.reduction_tolerance)
+
+
+class AxisKeyframes():
+    """
+    The keyframes of one axis of CHR0 data, stored as parallel arrays of
+    frames, values and tangents rather than a list of tuples. Frames are
+    integers. Values and tangents are double precision, like the Python floats
+    they are copied from, so nodes are encoded exactly as they were from
+    lists. Constant axes and linear formats only store values, and their
+    frames and tangents are None. Indexing and iterating give (frame, value,
+    tangent) tuples, or values, like the list the keyframes were copied from.
+
+    integer_zeros is None, or the indices of the values and of the tangents
+    that were the integer 0 in that list (such as the tangents of constant
+    segments). Integer zeros stay 0 when multiplied by an integer, where
+    0.0 becomes -0.0, so scale keeps them 0.0 to write the same bytes as
+    when the keyframes were lists.
+    """
+
+    __slots__ = ('frames', 'values', 'tangents', 'integer_zeros')
+
+    def __init__(self, frames: array = None, values: array = None,
+                 tangents: array = None, integer_zeros: tuple = None):
+        self.frames = frames
+        self.values = array('d') if values is None else values
+        self.tangents = tangents
+        self.integer_zeros = integer_zeros
+
+    @classmethod
+    def fromList(cls, data: list):
+        """
+        Copies an empty list, a list of values or a list of (frame, value,
+        tangent) tuples into arrays.
+        """
+        if data and type(data[0]) == tuple:
+            frames, values, tangents = zip(*data)
+            return cls(array('q', map(int, frames)), array('d', values),
+                       array('d', tangents), findIntegerZeros(values, tangents))
+        else:
+            return cls(None, array('d', data), None, findIntegerZeros(data, ()))
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __iter__(self):
+        if self.frames is None:
+            return iter(self.values)
+        else:
+            return zip(self.frames, self.values, self.tangents)
+
+    def __getitem__(self, i: int):
+        if self.frames is None:
+            return self.values[i]
+        else:
+            return self.frames[i], self.values[i], self.tangents[i]
+
+    def __eq__(self, other) -> bool:
+        return (isinstance(other, AxisKeyframes)
+                and self.frames == other.frames
+                and self.values == other.values
+                and self.tangents == other.tangents)
+
+    def isInterpolated(self) -> bool:
+        return self.frames is not None
+
+    def getColumns(self) -> tuple:
+        """
+        Returns NumPy arrays of the frames, values and tangents (None if not
+        stored) sharing memory with the keyframes, so they can be read
+        without copying. Requires NumPy.
+        """
+        if self.frames is None:
+            return None, np.frombuffer(self.values, dtype=np.float64), None
+        else:
+            return (np.frombuffer(self.frames, dtype=np.int64),
+                    np.frombuffer(self.values, dtype=np.float64),
+                    np.frombuffer(self.tangents, dtype=np.float64))
+
+    def scale(self, factor: float):
+        """
+        Multiplies the values and tangents by 'factor' in place, through NumPy
+        views of the arrays when available. Without NumPy, the products are
+        gathered in a temporary list and copied back into the same arrays.
+        """
+        if factor == 1 or not self.values:
+            return
+
+        elif np is not None and len(self) >= VECTORIZE_MIN_KEYFRAMES:
+            for column in self.getColumns()[1:]:
+                if column is not None:
+                    column *= factor
+
+        else:
+            for column in (self.values, self.tangents):
+                if column is not None:
+                    column[:] = array('d', [value * factor for value in column])
+
+        if self.integer_zeros is not None and isinstance(factor, int):
+            for column, indices in zip((self.values, self.tangents),
+                                       self.integer_zeros):
+                for i in indices:
+                    column[i] = 0.0
+
+    def toBytes(self) -> bytes:
+        """
+        Returns the keyframes packed into bytes that fromBytes reads back. The
+        arrays are stored in the machine's byte order.
+        """
+        if self.frames is None:
+            columns = (self.values,)
+        else:
+            columns = (self.frames, self.values, self.tangents)
+        return (struct.pack('=?I', self.frames is not None, len(self))
+                + b''.join(column.tobytes() for column in columns))
+
+    @classmethod
+    def fromBytes(cls, data: bytes, offset: int = 0) -> tuple:
+        """
+        Returns the keyframes packed by toBytes at 'offset' in 'data', and the
+        offset following them. Raises a ValueError or struct.error if the
+        data is not valid.
+        """
+        interpolated, length = struct.unpack_from('=?I', data, offset)
+        offset += struct.calcsize('=?I')
+        columns = []
+        for typecode in ('qdd' if interpolated else 'd'):
+            column = array(typecode)
+            end = offset + column.itemsize * length
+            column.frombytes(data[offset: end])
+            if len(column) != length:
+                raise ValueError("Keyframe data is truncated")
+            columns.append(column)
+            offset = end
+
+        if interpolated:
+            return cls(*columns), offset
+        else:
+            return cls(None, columns[0]), offset
+
+
+def findIntegerZeros(values, tangents) -> tuple:
+    """
+    Returns the integer_zeros of AxisKeyframes copied from the given values
+    and tangents: None if neither contains the integer 0, which is checked
+    without a loop in Python, otherwise the indices of the integer zeros in
+    each as arrays.
+    """
+    if 0 not in values and 0 not in tangents:
+        return None
+    return tuple(array('q', [i for i, value in enumerate(column)
+                             if value == 0 and type(value) is int])
+                 for column in (values, tangents))
+
+
+class ChrTransform():
+    """
+    How the scale, rotation and translation data of every bone is changed
+    when it is formatted: whether the Y and Z axes are swapped, and the factor
+    the values and tangents of each axis are multiplied by after the swap
+    (conversion to degrees, scaling of translations and the sign of the Z
+    axis). Made from the encoding settings once per export, rather than read
+    from them for every bone.
+    """
+
+    __slots__ = ('swap_yz', 'factors')
+
+    def __init__(self, settings):
+        xyz_to_xzy = settings.xyz_to_xzy
+        scale = settings.scale_translation
+        deg_per_rad = 180 / math.pi if settings.convert_to_degrees else 1
+        sign = -1 if xyz_to_xzy else 1
+
+        self.swap_yz = xyz_to_xzy
+        self.factors = (
+            # scale is stored as it is
+            (1, 1, 1),
+            (deg_per_rad, deg_per_rad, deg_per_rad * sign),
+            (scale, scale, scale * sign)
+        )
+
+
+class ChrAnimData():
+    """
+    The scale, rotation or translation data of one bone: the AxisKeyframes of
+    the X, Y and Z axes, the format they are stored in and the flags written
+    to the node.
+    """
+
+    __slots__ = ('__format', '__has', '__axes', '__fixed', '__isotropic',
+                 '__stats')
+
+    def __init__(self):
+        self.__format = 'none'
+        self.__has = False
+        self.__axes = [AxisKeyframes(), AxisKeyframes(), AxisKeyframes()]
+        self.__fixed = [True, True, True]
+        self.__isotropic = True
+        self.__stats = [None, None, None]
+
+    def __str__(self):
+
+        def __format_data(axis):
+            data = self.__axes[axis]
+            if self.__format in CHR0_LINEAR_FORMATS or not data.isInterpolated():
+                return ["%07.3f" % value for value in data]
+            else:
+                return ["(%04s, %07.3f, %07.3f)" % keyframe for keyframe in data]
+
+        lines = [
+            "Format: %s" % self.__format,
+            "Has data: %s" % self.__has,
+            "Is isotropic: %s\n" % self.__isotropic
+        ]
+
+        for axis, name in enumerate("XYZ"):
+            lines += [
+                "%s axis has: %s" % (name, bool(self.__axes[axis])),
+                "%s axis constant: %s" % (name, self.__fixed[axis]),
+                *__format_data(axis), "\n"
+            ]
+
+        return '\n'.join(lines[:-1])
+
+    def updateData(self, axis: int, data):
+        """
+        'axis' should take values 0, 1 or 2 corresponding
+        to the X, Y or Z axis, respectively. 'data' is AxisKeyframes or a list
+        to copy into AxisKeyframes (see AxisKeyframes.fromList). AxisKeyframes
+        are not copied, and are modified when the data is formatted.
+        """
+        if axis not in range(3):
+            raise ValueError("'axis' must be in range(0, 3)")
+
+        elif type(data) == list:
+            self.__axes[axis] = AxisKeyframes.fromList(data)
+
+        elif isinstance(data, AxisKeyframes):
+            self.__axes[axis] = data
+
+        else:
+            raise ValueError("'data' must be a list or AxisKeyframes")
+
+    def updateFormat(self, format):
+        self.__format = format
+
+    def updateFlags(self):
+        x, y, z = self.__axes
+        self.__isotropic = x == y and y == z
+        self.__fixed = [len(data) <= 1 for data in self.__axes]
+        self.__has = bool(x) or bool(y) or bool(z)
+
+    def formatData(self, srt, settings, transform: ChrTransform = None):
+        """
+        'settings' is any object with the attributes of EncoderSettings, such
+        as the add-on's scene properties. 'transform' is the ChrTransform of
+        the settings, made from them if not given.
+        """
+        if transform is None:
+            transform = ChrTransform(settings)
+
+        with span('formatting', srt=srt):
+            self.__transform(srt, transform)
+
+        self.__update_format(srt, settings)
+
+    def __transform(self, srt, transform):
+        # The axes are swapped by reference, and their values and tangents
+        # multiplied in place, so no keyframes are copied
+        axes = self.__axes
+        fixed = self.__fixed
+
+        if transform.swap_yz:
+            axes[1], axes[2] = axes[2], axes[1]
+            fixed[1], fixed[2] = fixed[2], fixed[1]
+
+        for data, factor in zip(axes, transform.factors[srt]):
+            data.scale(factor)
+
+    def __update_format(self, srt, settings):
+
+        if self.__has:
+            axes = self.__axes
+
+            with span('statistics', srt=srt):
+                stats = [AxisStats(data) for data in axes]
+
+            for i in range(3):
+                if stats[i].constant and len(axes[i]) != 1:
+                    axes[i] = AxisKeyframes.fromList(stats[i].constantValue(srt))
+                    self.__fixed[i] = True
+
+            self.__stats = stats
+
+            if all(self.__fixed):
+
+                self.__format = 'none'
+
+                if (axes[0][0] == axes[1][0] and
+                        axes[1][0] == axes[2][0]):
+
+                    self.__isotropic = True
+
+                    if axes[0][0] == (1 if srt == 1 else 0):
+
+                        self.__has = False
+
+            else:
+                animated = [i for i in range(3) if not self.__fixed[i]]
+                combined = AxisStats.combine([stats[i] for i in animated])
+
+                with span('format selection', srt=srt,
+                          requested=self.__format) as format_span:
+                    format = promoteFormat(self.__format, combined)
+
+                    # choose the smallest format that is accurate enough,
+                    # regardless of the requested format
+                    if (settings.error_bounded_format
+                            and format in CHR0_INTERPOLATED_FORMATS):
+                        format = selectFormat([axes[i] for i in animated],
+                                              [stats[i] for i in animated],
+                                              promoteFormat('i4', combined),
+                                              settings.format_tolerance)
+
+                    format_span.set(format=format, keys=combined.count,
+                                    max_frame=combined.max_frame,
+                                    min_tangent=combined.min_tangent,
+                                    max_tangent=combined.max_tangent)
+
+                self.__format = format
+                validateFormat(format, combined, srt)
+
+    def size(self) -> int:
+        if self.__has:
+            if self.__isotropic:
+                return 4
+            else:
+                return 12
+        else:
+            return 0
+
+    def has(self) -> bool:
+        return self.__has
+
+    def fixed(self, axis: int) -> bool:
+        return self.__fixed[axis]
+
+    def xFixed(self) -> bool:
+        return self.__fixed[0]
+
+    def yFixed(self) -> bool:
+        return self.__fixed[1]
+
+    def zFixed(self) -> bool:
+        return self.__fixed[2]
+
+    def isotropic(self) -> bool:
+        return self.__isotropic
+
+    def format(self) -> str:
+        return self.__format
+
+    def stats(self, axis: int):
+        """
+        Returns the AxisStats of the given axis, gathered when the data was
+        formatted, or None if the data has not been formatted.
+        """
+        return self.__stats[axis]
+
+    def data(self, axis: int) -> AxisKeyframes:
+        return self.__axes[axis]
+
+    def xData(self) -> AxisKeyframes:
+        return self.__axes[0]
+
+    def yData(self) -> AxisKeyframes:
+        return self.__axes[1]
+
+    def zData(self) -> AxisKeyframes:
+        return self.__axes[2]
+
+    def toBytes(self) -> bytes:
+        """
+        Returns the data packed into bytes that fromBytes reads back. Unlike a
+        pickle, reading them cannot run code, so the export cache stores
+        formatted data in this form.
+        """
+        parts = [struct.pack('=4s?????', self.__format.encode('ascii'),
+                             self.__has, self.__isotropic, *self.__fixed)]
+        for data, stats in zip(self.__axes, self.__stats):
+            parts.append(data.toBytes())
+            parts.append(b'\0' if stats is None else b'\1' + stats.toBytes())
+        return b''.join(parts)
+
+    @classmethod
+    def fromBytes(cls, data: bytes, offset: int = 0) -> tuple:
+        """
+        Returns the ChrAnimData packed by toBytes at 'offset' in 'data', and
+        the offset following it. Raises a ValueError or struct.error if the
+        data is not valid.
+        """
+        anim_data = cls()
+        format, anim_data.__has, anim_data.__isotropic, *anim_data.__fixed = (
+            struct.unpack_from('=4s?????', data, offset))
+        anim_data.__format = format.rstrip(b'\0').decode('ascii')
+        if anim_data.__format not in (CHR0_INTERPOLATED_FORMATS
+                                      + CHR0_LINEAR_FORMATS + ['none']):
+            raise ValueError("Unknown format '%s'" % anim_data.__format)
+        offset += struct.calcsize('=4s?????')
+
+        for axis in range(3):
+            anim_data.__axes[axis], offset = AxisKeyframes.fromBytes(data, offset)
+            has_stats = struct.unpack_from('=?', data, offset)[0]
+            if has_stats:
+                anim_data.__stats[axis], offset = AxisStats.fromBytes(data, offset + 1)
+            else:
+                offset += 1
+        return anim_data, offset
+
+
+def get_fixed(data: list, srt: int) -> list:
+    """
+    Return a list constaining a constant if the given list is null, empty,
+    contains only one element, or containes one unique element. Otherwise,
+    return an empty list indicating the given list is not constant.
+    """
+    if not data:
+        return [0] if srt else [1]
+    elif len(data) == 1:
+        return [data[0]]
+    elif type(data[0]) == tuple:
+        for tuple_data in data:
+            if tuple_data[1] != data[0][1]:
+                return []
+        return [data[0][1]]
+    else:
+        for value in data:
+            if value != data[0]:
+                return []
+        return [data[0]]
+
+
+class AxisStats():
+    """
+    Statistics of the AxisKeyframes of one axis. Each array of the keyframes
+    is scanned on its own, through a NumPy view of the array when available,
+    without building tuples or copying the keyframes.
+    """
+
+    def __init__(self, data: AxisKeyframes = None):
+        self.count = 0 if data is None else len(data)
+        self.constant = True
+        self.min_value = self.max_value = 0
+        self.min_tangent = self.max_tangent = 0
+        self.min_frame = self.max_frame = 0
+
+        if not self.count:
+            return
+
+        elif np is not None and self.count >= VECTORIZE_MIN_KEYFRAMES:
+            frames, values, tangents = data.getColumns()
+            self.min_value = float(values.min())
+            self.max_value = float(values.max())
+            if frames is not None:
+                self.min_frame = int(frames.min())
+                self.max_frame = int(frames.max())
+                self.min_tangent = float(tangents.min())
+                self.max_tangent = float(tangents.max())
+
+        else:
+            self.min_value = min(data.values)
+            self.max_value = max(data.values)
+            if data.frames is not None:
+                self.min_frame = min(data.frames)
+                self.max_frame = max(data.frames)
+                self.min_tangent = min(data.tangents)
+                self.max_tangent = max(data.tangents)
+
+        self.constant = self.min_value == self.max_value
+
+    def constantValue(self, srt: int) -> list:
+        """
+        Returns a list containing the constant value of a constant axis. Empty
+        axes take the default value of the transformation.
+        """
+        if not self.count:
+            return [0] if srt else [1]
+        else:
+            return [self.min_value]
+
+    @staticmethod
+    def combine(stats_list: list):
+        """
+        Returns the statistics of several axes stored in the same format.
+        """
+        combined = AxisStats()
+        if stats_list:
+            combined.count = max(stats.count for stats in stats_list)
+            combined.constant = all(stats.constant for stats in stats_list)
+            for name in ('min_value', 'min_tangent', 'min_frame'):
+                setattr(combined, name, min(getattr(stats, name) for stats in stats_list))
+            for name in ('max_value', 'max_tangent', 'max_frame'):
+                setattr(combined, name, max(getattr(stats, name) for stats in stats_list))
+        return combined
+
+    # count, constant, values, tangents and frames
+    PACKED_FORMAT = '=q?ddddqq'
+
+    def toBytes(self) -> bytes:
+        return struct.pack(self.PACKED_FORMAT, self.count, self.constant,
+                           self.min_value, self.max_value,
+                           self.min_tangent, self.max_tangent,
+                           self.min_frame, self.max_frame)
+
+    @classmethod
+    def fromBytes(cls, data: bytes, offset: int = 0) -> tuple:
+        """
+        Returns the statistics packed by toBytes at 'offset' in 'data', and
+        the offset following them.
+        """
+        stats = cls()
+        (stats.count, stats.constant, stats.min_value, stats.max_value,
+         stats.min_tangent, stats.max_tangent, stats.min_frame,
+         stats.max_frame) = struct.unpack_from(cls.PACKED_FORMAT, data, offset)
+        return stats, offset + struct.calcsize(cls.PACKED_FORMAT)
+
+
+def promoteFormat(format: str, stats: AxisStats) -> str:
+    """
+    Returns the smallest interpolated format, no smaller than the given
+    format, in which keyframes described by 'stats' can be stored. Linear
+    formats are returned unchanged.
+    """
+    if format == 'i4' or format == 'i6':
+
+        if (stats.count > 65535 or
+            stats.min_frame < 0 or
+            stats.max_frame > 2047 or
+            256 * stats.min_tangent < -32768 or
+                256 * stats.max_tangent >= 32768):
+
+            return 'i12'
+
+        elif format == 'i4':
+            if (stats.max_frame > 255 or
+                32 * stats.min_tangent < -2048 or
+                    32 * stats.max_tangent >= 2048):
+
+                return 'i6'
+
+    return format
+
+
+def validateFormat(format: str, stats: AxisStats, srt: int) -> None:
+    """
+    Raises an OverflowError if keyframes described by 'stats' cannot be stored
+    in the given format, before any bytes of the node are written.
+    """
+    srt_names = ("Scale", "Rotation", "Translation")
+
+    if format in CHR0_INTERPOLATED_FORMATS and stats.count > 65535:
+        raise OverflowError(("%s data has %s keyframes on one axis, but at "
+                             "most 65535 can be stored")
+                            % (srt_names[srt], stats.count))
+
+    if format == 'i4' or format == 'i6':
+        value_bits, tangent_scale, frame_scale, word_size = \
+            CHR0_INTERPOLATED_PACKING[format]
+        frame_bits = word_size * 8 - 2 * value_bits
+        edge = 2**(value_bits - 1)
+
+        if (stats.min_frame < 0 or
+                stats.max_frame * frame_scale >= 2**frame_bits or
+                int(stats.min_tangent * tangent_scale) < -edge or
+                int(stats.max_tangent * tangent_scale) >= edge):
+            raise OverflowError(("%s data cannot be stored in the %s format"
+                                 % (srt_names[srt], format)))
+
+
+def getKeyframeColumns(keyframes) -> tuple:
+    """
+    Returns NumPy arrays of the frames, values and tangents of a list of
+    (frame, value, tangent) tuples (copies) or of AxisKeyframes (views, see
+    AxisKeyframes.getColumns). AxisKeyframes are not checked with isinstance,
+    as those returned by encoding workers are instances of another copy of
+    this module (see EncodingEngine).
+    """
+    if isinstance(keyframes, list):
+        columns = np.array(keyframes, dtype=np.float64).reshape(-1, 3)
+        return columns[:, 0], columns[:, 1], columns[:, 2]
+    else:
+        return keyframes.getColumns()
+
+
+def evaluateHermite(keyframes, frames) -> list:
+    """
+    Evaluates the curve described by interpolated AxisKeyframes, or a list of
+    (frame, value, tangent) tuples, at the given frames, the way CHR0 and SRT0
+    curves are interpolated. Two keyframes with the same frame hold the left
+    and right tangents of one keyframe. Frames outside the curve take the
+    value of the nearest end. Uses NumPy to evaluate all frames at once when
+    available, in which case an array is returned.
+    """
+    if np is not None:
+        key_frames, values, tangents = getKeyframeColumns(keyframes)
+        frames = np.asarray(frames, dtype=np.float64)
+
+        # index of the last keyframe at or before each frame
+        i = np.searchsorted(key_frames, frames, side='right') - 1
+        last = len(key_frames) - 1
+        i0 = np.clip(i, 0, max(last - 1, 0))
+        i1 = np.minimum(i0 + 1, last)
+
+        width = key_frames[i1] - key_frames[i0]
+        safe_width = np.where(width > 0, width, 1)
+        u = (frames - key_frames[i0]) / safe_width
+        u2 = u * u
+        u3 = u2 * u
+
+        result = ((2*u3 - 3*u2 + 1) * values[i0]
+                  + (u3 - 2*u2 + u) * width * tangents[i0]
+                  + (3*u2 - 2*u3) * values[i1]
+                  + (u3 - u2) * width * tangents[i1])
+
+        result = np.where(i < 0, values[0], result)
+        return np.where(i >= last, values[last], result)
+
+    if isinstance(keyframes, list):
+        key_frames = [frame for frame, value, tangent in keyframes]
+    else:
+        key_frames = keyframes.frames
+    result = []
+    for frame in frames:
+        i = bisect.bisect_right(key_frames, frame) - 1
+        if i < 0:
+            result.append(keyframes[0][1])
+        elif i >= len(keyframes) - 1:
+            result.append(keyframes[-1][1])
+        else:
+            f0, v0, t0 = keyframes[i]
+            f1, v1, t1 = keyframes[i + 1]
+            width = f1 - f0
+            u = (frame - f0) / width
+            u2 = u * u
+            u3 = u2 * u
+            result.append((2*u3 - 3*u2 + 1) * v0
+                          + (u3 - 2*u2 + u) * width * t0
+                          + (3*u2 - 2*u3) * v1
+                          + (u3 - u2) * width * t1)
+    return result
+
+
+def reduceKeyframes(keyframes: list, tolerance: float) -> list:
+    """
+    Greedily removes keyframes from a list of (frame, value, tangent) tuples
+    while the curve stays within 'tolerance' of the original curve at every
+    frame. A keyframe is removed if the curve between the last kept keyframe
+    and the next keyframe, using their own tangents, is close enough to the
+    original. The first and last keyframes, and keyframes stored as two tuples
+    (distinct left and right tangents), are always kept. Lists that are not
+    interpolated keyframes are returned unchanged.
+    """
+    if len(keyframes) < 3 or type(keyframes[0]) != tuple:
+        return keyframes
+
+    # group tuples that share a frame, as (first index, last index)
+    groups = []
+    for i, keyframe in enumerate(keyframes):
+        if groups and keyframes[groups[-1][0]][0] == keyframe[0]:
+            groups[-1] = (groups[-1][0], i)
+        else:
+            groups.append((i, i))
+
+    first = int(keyframes[0][0])
+    reference = evaluateHermite(keyframes, range(first, int(keyframes[-1][0]) + 1))
+
+    reduced = keyframes[: groups[0][1] + 1]
+    anchor = keyframes[groups[0][1]]
+
+    for g in range(1, len(groups) - 1):
+        start, end = groups[g]
+        next_keyframe = keyframes[groups[g + 1][0]]
+
+        if start == end and next_keyframe[0] - anchor[0] <= REDUCTION_MAX_SPAN:
+            frames = range(int(anchor[0]) + 1, int(next_keyframe[0]))
+            curve = evaluateHermite([anchor, next_keyframe], frames)
+            expected = reference[frames.start - first: frames.stop - first]
+
+            if np is not None:
+                error = float(np.abs(curve - expected).max()) if len(frames) else 0
+            else:
+                error = max((abs(a - b) for a, b in zip(curve, expected)), default=0)
+
+            if error <= tolerance:
+                continue
+
+        reduced.extend(keyframes[start: end + 1])
+        anchor = keyframes[end]
+
+    reduced.extend(keyframes[groups[-1][0]:])
+    return reduced
+
+
+def to_float32(value: float) -> float:
+    return struct.unpack('>f', struct.pack('>f', value))[0]
+
+
+def decodeKeyframes(keyframes, stats: AxisStats, format: str) -> list:
+    """
+    Returns the (frame, value, tangent) tuples a game would read back after the
+    given keyframes are stored in an interpolated format.
+    """
+    if format == 'i12':
+        return [(to_float32(frame), to_float32(value), to_float32(tangent))
+                for frame, value, tangent in keyframes]
+
+    value_bits, tangent_scale, frame_scale, word_size = \
+        CHR0_INTERPOLATED_PACKING[format]
+    value_max = 2**value_bits - 1
+    step = (stats.max_value - stats.min_value) / value_max
+    base = stats.min_value
+    step_stored = to_float32(step)
+    base_stored = to_float32(base)
+
+    decoded = []
+    for frame, value, tangent in keyframes:
+        value = (value - base) / step if step else 0
+        value = value_max if value == value_max + 1 else int(value)
+        decoded.append((frame,
+                        base_stored + step_stored * value,
+                        int(tangent * tangent_scale) / tangent_scale))
+    return decoded
+
+
+def getFormatError(keyframes, stats: AxisStats, format: str) -> float:
+    """
+    Returns the largest difference, over every frame of the curve, between the
+    curve described by the keyframes and the curve read back after storing
+    them in the given interpolated format.
+    """
+    frames = range(int(math.floor(stats.min_frame)),
+                   int(math.ceil(stats.max_frame)) + 1)
+    expected = evaluateHermite(keyframes, frames)
+    actual = evaluateHermite(decodeKeyframes(keyframes, stats, format), frames)
+
+    if np is not None:
+        return float(np.abs(actual - expected).max())
+    else:
+        return max(abs(a - b) for a, b in zip(actual, expected))
+
+
+def selectFormat(axes: list, stats_list: list, minimum_format: str,
+                 tolerance: float) -> str:
+    """
+    Returns the smallest interpolated format, no smaller than minimum_format,
+    for which the curve of every axis deviates by at most 'tolerance' once
+    stored. i12 is returned if no smaller format is accurate enough.
+    """
+    candidates = CHR0_INTERPOLATED_FORMATS[
+        CHR0_INTERPOLATED_FORMATS.index(minimum_format):]
+
+    for format in candidates[:-1]:
+        error = max(getFormatError(keyframes, stats, format)
+                    for keyframes, stats in zip(axes, stats_list))
+
+        count('format error', **{format: error})
+
+        if error <= tolerance:
+            return format
+
+    return candidates[-1]
+
+
+def get_chr_node_layout(s: ChrAnimData, r: ChrAnimData, t: ChrAnimData,
+                        name_length: int = None) -> (int, list, int):
+    """
+    First pass of the CHR0 node writer. Calculates the exact size of the node
+    and the offset of every data block from the flags, formats and keyframe
+    counts of the given ChrAnimData. Returns the size and a list containing
+    (chr_anim_data, data, stats, slot_offset, data_offset) for each axis
+    stored in the node, where data_offset is None for fixed axes. If name_length is given,
+    room is left for the bone name at the end of the node, and its offset is
+    returned as the third value (otherwise None).
+    """
+    slots = []
+    slot_offset = 8
+    end = 8 + s.size() + r.size() + t.size()
+
+    for chr_anim_data in (s, r, t):
+        if chr_anim_data.has():
+
+            for xyz in range(0, 1 if chr_anim_data.isotropic() else 3):
+                data = chr_anim_data.data(xyz)
+
+                stats = chr_anim_data.stats(xyz)
+
+                if chr_anim_data.fixed(xyz):
+                    slots.append((chr_anim_data, data, stats, slot_offset, None))
+                else:
+                    slots.append((chr_anim_data, data, stats, slot_offset, end))
+                    format = chr_anim_data.format()
+                    end += (CHR0_FRAME_HEADER_SIZES[format]
+                            + CHR0_KEYFRAME_SIZES[format] * len(data))
+
+                slot_offset += 4
+
+    name_offset = None
+    if name_length is not None:
+        name_offset = end + 4
+        end = name_offset + name_length
+        end += (4 - end % 4) % 4
+
+    return end, slots, name_offset
+
+
+@traced('encoding', node='CHR0')
+def combineSRT(s: ChrAnimData, r: ChrAnimData, t: ChrAnimData,
+               bone_name: str = None) -> bytearray:
+    """
+    Second pass of the CHR0 node writer. Writes the node into a single buffer
+    allocated from the layout returned by get_chr_node_layout. If bone_name is
+    given, it is appended to the node and the first word of the node is set to
+    the offset of the name.
+    """
+
+    def get_header_values(stats: AxisStats, bit_length: int) -> (int, int):
+        """
+        Used for I4, I6 and L1 interpolation formats. These formats store the
+        value of each keyframe as an integer* using 'bit_length' bits. The
+        actual value is obtained by step_header * step_frame + base_header,
+        where step_header and base_header are stored in the header and
+        step_frame is the value stored in each frame.
+        Returns (step_header, base_header).
+        Note: step_header and base_header are calculated such that the range of
+        values in the list are normalised to the range of an unsigned integer
+        represented in bit_length bits.
+        *step_frame is actually a float for the L1 format.
+        """
+
+        min, max = stats.min_value, stats.max_value
+
+        step_header = (max - min) / (2**bit_length - 1)
+        base_header = min
+        return step_header, base_header
+
+    def get_frame_value(step_header: float, base_header: float,
+                        value: float) -> float:
+
+        if step_header:
+            return (value - base_header) / step_header
+        else:
+            return 0
+
+    if bone_name is not None:
+        bone_name = remove_non_ascii(bone_name).encode('ascii')
+        size, slots, name_offset = get_chr_node_layout(s, r, t, len(bone_name))
+    else:
+        size, slots, name_offset = get_chr_node_layout(s, r, t)
+
+    node = bytearray(size)
+    view = memoryview(node)
+
+    # type code
+    struct.pack_into('>I', node, 4, (
+        s.isotropic() << 0x04
+        | r.isotropic() << 0x05
+        | t.isotropic() << 0x06
+        | s.xFixed() << 0x0D
+        | s.yFixed() << 0x0E
+        | s.zFixed() << 0x0F
+        | r.xFixed() << 0x10
+        | r.yFixed() << 0x11
+        | r.zFixed() << 0x12
+        | t.xFixed() << 0x13
+        | t.yFixed() << 0x14
+        | t.zFixed() << 0x15
+        | s.has() << 0x16
+        | r.has() << 0x17
+        | t.has() << 0x18
+        | CHR0_FORMAT_INDEXES[s.format()] << 0x19
+        | CHR0_FORMAT_INDEXES[r.format()] << 0x1B
+        | CHR0_FORMAT_INDEXES[t.format()] << 0x1E
+    ))
+
+    for chr_anim_data, data, stats, slot_offset, offset in slots:
+
+        # if axis does not need a frame data structure
+        if offset is None:
+            struct.pack_into('>f', node, slot_offset, data[0])
+            continue
+
+        # if axis needs a frame data structure
+        struct.pack_into('>I', node, slot_offset, offset)
+        format = chr_anim_data.format()
+
+        count('axis', keys=len(data), bytes=CHR0_FRAME_HEADER_SIZES[format]
+              + CHR0_KEYFRAME_SIZES[format] * len(data))
+
+        frame_scale = 1.0  # often 0x3C381703
+
+        # Interpolated 4 and Interpolated 6
+        if format == 'i4' or format == 'i6':
+
+            step, base = get_header_values(
+                stats, CHR0_INTERPOLATED_PACKING[format][0])
+
+            # header
+            struct.pack_into('>HHfff', node, offset,
+                             len(data),  # frame count
+                             0x0000,  # unknown
+                             frame_scale,
+                             step,
+                             base
+                             )
+            offset += 16
+
+            # keyframes
+            packed = packInterpolatedKeyframes(data, step, base, format)
+            view[offset: offset + len(packed)] = packed
+
+        # Interpolated 12
+        elif format == 'i12':
+
+            # header
+            struct.pack_into('>HHf', node, offset,
+                             len(data),  # frame count
+                             0x0000,  # unknown
+                             frame_scale
+                             )
+            offset += 8
+
+            # keyframes
+            packKeyframes(node, offset, data)
+
+        # Linear 1
+        elif format == 'l1':
+
+            step, base = get_header_values(stats, 16)
+
+            # header
+            struct.pack_into('>ff', node, offset, step, base)
+            offset += 8
+
+            # keyframes
+            packFloats(node, offset, len(data),
+                       (get_frame_value(step, base, value) for value in data))
+
+        # Linear 4
+        else:
+
+            # keyframes
+            packFloats(node, offset, len(data), data.values)
+
+    # add bone name to node
+    if bone_name is not None:
+        struct.pack_into('>I', node, 0, name_offset)
+        struct.pack_into('>I', node, name_offset - 4, len(bone_name))
+        view[name_offset: name_offset + len(bone_name)] = bone_name
+
+    return node
+
+
+def packInterpolatedKeyframes(keyframes, step: float, base: float,
+                              format: str) -> bytes:
+    """
+    Packs interpolated AxisKeyframes, or a list of (frame, value, tangent)
+    tuples, into i4 or i6 keyframes.
+    step and base are the header values of the frame data structure. An
+    OverflowError is raised if any keyframe cannot be represented in the
+    format. Uses NumPy to pack all keyframes at once when available.
+    """
+    value_bits, tangent_scale, frame_scale, word_size = \
+        CHR0_INTERPOLATED_PACKING[format]
+
+    if np is not None and len(keyframes) >= VECTORIZE_MIN_KEYFRAMES:
+        return _packInterpolatedKeyframesNumpy(
+            keyframes, step, base, value_bits, tangent_scale, frame_scale,
+            word_size)
+
+    value_max = 2**value_bits - 1
+    frame_bits = word_size * 8 - 2 * value_bits
+    packed = bytearray()
+    for frame, value, tangent in keyframes:
+
+        value = (value - base) / step if step else 0
+        value = value_max if value == value_max + 1 else int(value)
+
+        packed += (
+            to_bits(frame * frame_scale, frame_bits) << 2 * value_bits  # frame of keyframe
+            | to_bits(value, value_bits) << value_bits
+            | to_bits(int(tangent * tangent_scale), value_bits, signed=True)
+        ).to_bytes(word_size, byteorder='big')
+
+    return packed
+
+
+def _packInterpolatedKeyframesNumpy(keyframes, step: float, base: float,
+                                    value_bits: int, tangent_scale: int,
+                                    frame_scale: int, word_size: int) -> bytes:
+    """
+    Vectorised equivalent of the loop in packInterpolatedKeyframes. The
+    arithmetic is done in float64, as it is by Python floats, so the output is
+    identical.
+    """
+    frames, values, tangents = getKeyframeColumns(keyframes)
+    value_max = 2**value_bits - 1
+
+    frames = frames.astype(np.int64) * frame_scale
+
+    if step:
+        values = (values - base) / step
+        values = np.where(values == value_max + 1, value_max, np.trunc(values))
+    else:
+        values = np.zeros(len(frames))
+    values = values.astype(np.int64)
+
+    tangents = np.trunc(tangents * tangent_scale).astype(np.int64)
+
+    # check the whole axis before packing
+    frame_bits = word_size * 8 - 2 * value_bits
+    for array, bits, signed in ((frames, frame_bits, False),
+                                (values, value_bits, False),
+                                (tangents, value_bits, True)):
+        low = -2**(bits - 1) if signed else 0
+        outside = (array < low) | (array >= low + 2**bits)
+        if outside.any():
+            to_bits(int(array[outside.argmax()]), bits, signed)
+
+    words = (frames.astype(np.uint64) << np.uint64(2 * value_bits)
+             | values.astype(np.uint64) << np.uint64(value_bits)
+             | (tangents & value_max).astype(np.uint64))
+
+    # keep the lowest 'word_size' bytes of each big-endian 64 bit word
+    packed = words.astype('>u8').view(np.uint8).reshape(-1, 8)
+    return packed[:, 8 - word_size:].tobytes()
+
+
+@functools.lru_cache(maxsize=256)
+def get_float_struct(value_count: int) -> struct.Struct:
+    """
+    Returns a compiled struct for 'value_count' big-endian floats.
+    """
+    return struct.Struct('>%sf' % value_count)
+
+
+def packFloats(buffer: bytearray, offset: int, value_count: int, values) -> None:
+    """
+    Packs 'value_count' values from the given iterable into the buffer as
+    big-endian floats in one call. Arrays of doubles are converted by NumPy
+    when available, without creating a Python float for each value.
+    """
+    if (np is not None and value_count >= VECTORIZE_MIN_KEYFRAMES
+            and isinstance(values, array)):
+        packFloatArray(buffer, offset, np.frombuffer(values, dtype=np.float64))
+    else:
+        get_float_struct(value_count).pack_into(buffer, offset, *values)
+
+
+def packFloatArray(buffer: bytearray, offset: int, values) -> None:
+    """
+    Packs a NumPy array into the buffer as big-endian floats. Values are
+    rounded as struct rounds them, and an OverflowError is raised, as by
+    struct, if a finite value is too large for a float.
+    """
+    with np.errstate(over='ignore'):
+        packed = values.astype('>f4')
+    overflow = np.isinf(packed)
+    if overflow.any() and np.isfinite(values[overflow]).any():
+        raise OverflowError("float too large to pack with f format")
+    buffer[offset: offset + packed.nbytes] = packed.tobytes()
+
+
+def packKeyframes(buffer: bytearray, offset: int, keyframes,
+                  factor: float = 1) -> None:
+    """
+    Packs interpolated AxisKeyframes, or a list of (frame, value, tangent)
+    tuples, into the buffer as big-endian float triples in one call. Values
+    and tangents are multiplied by 'factor' in the same pass.
+    """
+    if (np is not None and len(keyframes) >= VECTORIZE_MIN_KEYFRAMES
+            and not isinstance(keyframes, list)):
+        columns = np.empty((len(keyframes), 3))
+        for i, column in enumerate(keyframes.getColumns()):
+            columns[:, i] = column
+        if factor != 1:
+            columns[:, 1:] *= factor
+        packFloatArray(buffer, offset, columns)
+        return
+
+    if factor == 1:
+        values = itertools.chain.from_iterable(keyframes)
+    else:
+        values = itertools.chain.from_iterable(
+            (frame, value * factor, tangent * factor)
+            for frame, value, tangent in keyframes)
+
+    packFloats(buffer, offset, 3 * len(keyframes), values)
+
+
+@traced('encoding', node='SRT0')
+def get_srt_node(data_all: list, settings=None,
+                 report: dict = None) -> bytearray:
+    """
+    Returns a SRT0 node. data_all contains the scale X, scale Y, rotation,
+    translation X and translation Y data, each either a list containing one
+    value or a list of (frame, value, tangent) tuples. If settings are given,
+    they decide whether keyframes are reduced, and report is updated as it is
+    by get_chr_node.
+    """
+
+    get_srt = {0: 0, 1: 0, 2: 1, 3: 2, 4: 2}
+
+    if settings is not None and settings.reduce_keyframes:
+        for i in range(5):
+            if len(data_all[i]) > 1:
+                reduced = reduceKeyframes(data_all[i], settings.reduction_tolerance)
+                if report is not None:
+                    removed = len(data_all[i]) - len(reduced)
+                    report['keys_removed'] = report.get('keys_removed', 0) + removed
+                    report['bytes_saved'] = report.get('bytes_saved', 0) + 12 * removed
+                data_all[i] = reduced
+
+    for i in range(5):
+        constant = get_fixed(data_all[i], get_srt[i])
+        if constant:
+            data_all[i] = constant
+
+    scale_x_fixed = len(data_all[0]) == 1
+    scale_y_fixed = len(data_all[1]) == 1
+    rotation_fixed = len(data_all[2]) == 1
+    translation_x_fixed = len(data_all[3]) == 1
+    translation_y_fixed = len(data_all[4]) == 1
+
+    scale_isotropic = data_all[0] == data_all[1]
+    scale_has = not (scale_x_fixed and data_all[0][0] == 1
+                     and scale_isotropic)
+    rotation_has = bool(data_all[2][0])
+    translation_has = bool(data_all[3][0]) or bool(data_all[4][0])
+
+    # first pass: list the data stored in the node with the factor its values
+    # and tangents are multiplied by (sign and conversion to degrees), then
+    # calculate the size of the node and the offset of every data block
+    entries = []
+    if scale_has:
+        entries.append((data_all[0], 1))
+        if not scale_isotropic:
+            entries.append((data_all[1], 1))
+    if rotation_has:
+        entries.append((data_all[2], -180 / math.pi))
+    if translation_has:
+        entries.append((data_all[3], -1))
+        entries.append((data_all[4], -1))
+
+    size = 4 + 4 * len(entries)
+    offsets = []
+    for data, sign in entries:
+        if len(data) == 1:
+            offsets.append(None)
+        else:
+            offsets.append(size)
+            size += 8 + 12 * len(data)
+
+    # second pass: write the node into a single buffer
+    node = bytearray(size)
+
+    struct.pack_into('>I', node, 0, (
+        1
+        | (not scale_has) << 0x01
+        | (not rotation_has) << 0x02
+        | (not translation_has) << 0x03
+        | scale_isotropic << 0x04
+        | scale_x_fixed << 0x05
+        | scale_y_fixed << 0x06
+        | rotation_fixed << 0x07
+        | translation_x_fixed << 0x08
+        | translation_y_fixed << 0x09
+    ))
+
+    slot_offset = 4
+    for (data, factor), offset in zip(entries, offsets):
+
+        if offset is None:
+            struct.pack_into('>f', node, slot_offset, data[0] * factor)
+        else:
+            struct.pack_into('>I', node, slot_offset, offset - slot_offset)
+            struct.pack_into('>HHf', node, offset,
+                             len(data),  # frame count
+                             0x0000,  # unknown
+                             1)  # frame scale
+
+            # (frame index, value, tangent)
+            packKeyframes(node, offset + 8, data, factor)
+
+        slot_offset += 4
+
+    return node
+
+
+def get_chr_node(keyframes: list, formats: list, settings,
+                 bone_name: str, report: dict = None) -> bytearray:
+    """
+    Returns a CHR0 node for one bone. See encodeChrBone for the arguments.
+    """
+    return combineSRT(*encodeChrBone(keyframes, formats, settings, report),
+                      bone_name)
+
+
+def encodeChrBone(keyframes: list, formats: list, settings,
+                  report: dict = None, transform: ChrTransform = None) -> list:
+    """
+    Returns the scale, rotation and translation ChrAnimData of one bone,
+    formatted and ready to be written.
+    keyframes: scale, rotation and translation data, each a list of three
+    lists (X, Y and Z axis). An axis list is empty if the axis is not animated,
+    contains one value if the axis is constant, contains values for every
+    frame for linear formats, or contains (frame, value, tangent) tuples for
+    interpolated formats.
+    formats: the requested format of scale, rotation and translation data.
+    report: if given, the number of keyframes removed by keyframe reduction
+    and the bytes saved are added to its 'keys_removed' and 'bytes_saved'.
+    transform: the ChrTransform of the settings, made from them if not given.
+    """
+    if transform is None:
+        transform = ChrTransform(settings)
+
+    srt = ("Scale", "Rotation", "Translation")
+    anim_data_list = [ChrAnimData(), ChrAnimData(), ChrAnimData()]
+    removed = [0, 0, 0]
+
+    for i in range(3):
+        for j in range(3):
+            data = keyframes[i][j]
+            if len(data) > 1:
+                anim_data_list[i].updateFormat(formats[i])
+                if settings.reduce_keyframes:
+                    reduced = reduceKeyframes(data, settings.reduction_tolerance)
+                    removed[i] += len(data) - len(reduced)
+                    data = reduced
+            anim_data_list[i].updateData(j, data)
+
+        anim_data_list[i].updateFlags()
+        anim_data_list[i].formatData(i, settings, transform)
+
+        if report is not None and removed[i]:
+            report['keys_removed'] = report.get('keys_removed', 0) + removed[i]
+            report['bytes_saved'] = (report.get('bytes_saved', 0) + removed[i]
+                                     * CHR0_KEYFRAME_SIZES.get(anim_data_list[i].format(), 0))
+
+    return anim_data_list
+
+
+@traced('encoding', node='CLR0')
+def get_clr_node(data_all: list, mask: list, frame_count: int) -> bytearray:
+    """
+    Returns a CLR0 node. data_all contains a list of colour values (floats in
+    the range [0, 1]) for each of the red, green, blue and alpha channels. A
+    list containing one value represents a constant channel. Otherwise, the
+    list contains one value per frame. mask contains four floats in the range
+    [0, 1].
+    """
+    node = bytearray(12 + frame_count * 4)
+
+    # mask, unknown, count
+    struct.pack_into('>BBBBII', node, 0,
+                     *(scaleColourValue(mask[i]) for i in range(4)),
+                     0x08,
+                     frame_count
+                     )
+
+    node[12:] = get_clr_colours(
+        [scaleColourValues(data_all[rgba]) for rgba in range(4)], frame_count)
+
+    return node
+
+
+def get_clr_colours(channels: list, frame_count: int) -> bytearray:
+    """
+    Returns 'frame_count' RGBA colours. channels contains the quantised values of the
+    red, green, blue and alpha channels (bytes), each either one value or one
+    value per colour.
+    """
+    colours = bytearray(frame_count * 4)
+
+    # interleaved as RGBA by assigning every fourth byte
+    for rgba in range(4):
+        channel = channels[rgba]
+        if len(channel) == 1:
+            channel *= frame_count
+        colours[rgba::4] = channel
+
+    return colours
+
+
+def remove_non_ascii(s: str, sub=""):
+    return "".join(c if ord(c) < 128 else sub for c in s)
+
+
+def scaleColourValue(value: float) -> int:
+    value *= 256.0
+    if value >= 255.5:
+        return 255
+    elif value <= 0:
+        return 0
+    else:
+        return math.floor(value)
+
+
+def scaleColourValues(values: list) -> bytes:
+    """
+    Applies scaleColourValue to every value in the list. Uses NumPy to quantise
+    all values at once when available.
+    """
+    if np is not None and len(values) >= VECTORIZE_MIN_KEYFRAMES:
+        # equivalent to scaleColourValue for every value
+        scaled = np.floor(np.asarray(values, dtype=np.float64) * 256.0)
+        return np.clip(scaled, 0, 255).astype(np.uint8).tobytes()
+    else:
+        return bytes(scaleColourValue(value) for value in values)
+
+
+def to_bits(integer: int, length: int, signed=False) -> int:
+    """
+    Overflow error raised if integer cannot be represented with 'length' bits.
+    Assumes length is a positive integer.
+    Returned integer is always positive.
+    """
+    if signed:
+        edge = 2**(length - 1)
+        if integer in range(-edge, edge):
+            if integer < 0:
+                return (edge << 1) + integer
+            else:
+                return integer
+        else:
+            raise OverflowError("%s not in range(%s, %s)" % (integer, -edge, edge))
+    else:
+        if integer in range(0, 2**length):
+            return integer
+        else:
+            raise OverflowError("%s not in range(0, %s)" % (integer, 2**length))
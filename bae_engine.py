@@ -0,0 +1,275 @@
+#  ***** GPL LICENSE BLOCK *****
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#  ***** GPL LICENSE BLOCK *****
+
+# <pep8 compliant>
+
+import concurrent.futures
+import functools
+import importlib
+import itertools
+import multiprocessing
+import os
+import pickle
+import struct
+import sys
+
+# This module must not import bpy, as worker processes import it without
+# Blender. When it is not loaded as part of the add-on package, fall back to
+# importing its siblings from the same directory.
+try:
+    from .bae_globals import *
+    from .bae_encoder import *
+    from .bae_trace import span
+except ImportError:
+    from bae_globals import *
+    from bae_encoder import *
+    from bae_trace import span
+
+
+def encodeChrTask(payload: tuple) -> tuple:
+    """
+    Encodes one bone. payload is (keyframes, formats, settings), as taken by
+    encodeChrBone, with settings as returned by getSettingsPayload. Returns
+    (anim_data, report, error), where anim_data is None and error a message
+    if the bone cannot be encoded.
+    """
+    keyframes, formats, settings = payload
+    settings, transform = getEncoderSettings(settings)
+    report = {'keys_removed': 0, 'bytes_saved': 0}
+    try:
+        return (encodeChrBone(keyframes, formats, settings, report, transform),
+                report, None)
+    except OverflowError as error:
+        return None, report, "Error: %s" % error
+
+
+def encodeSrtTask(payload: tuple) -> tuple:
+    """
+    Encodes one SRT0 texture entry. payload is (data_all, settings), as taken
+    by get_srt_node, with settings as returned by getSettingsPayload. Returns
+    (node, report, error), where node is None and error a message if the
+    texture entry cannot be encoded.
+    """
+    data_all, settings = payload
+    settings, transform = getEncoderSettings(settings)
+    report = {'keys_removed': 0, 'bytes_saved': 0}
+    try:
+        return get_srt_node(data_all, settings, report), report, None
+    except (OverflowError, struct.error) as error:
+        return None, report, "Error: %s" % error
+
+
+def getSettingsPayload(settings) -> dict:
+    """
+    Returns the encoding settings of any object with the attributes of
+    EncoderSettings as a dictionary, which worker processes can unpickle
+    without importing the add-on package.
+    """
+    return vars(EncoderSettings.fromSettings(settings))
+
+
+def getEncoderSettings(settings: dict) -> tuple:
+    """
+    Returns the EncoderSettings and ChrTransform of settings returned by
+    getSettingsPayload. Every payload of an export carries the same settings,
+    so each process makes them once per export rather than once per payload.
+    """
+    return _getEncoderSettings(tuple(sorted(settings.items())))
+
+
+@functools.lru_cache(maxsize=8)
+def _getEncoderSettings(items: tuple) -> tuple:
+    settings = EncoderSettings(**dict(items))
+    return settings, ChrTransform(settings)
+
+
+# Tasks the engine can run, by name. Tasks are passed to worker processes by
+# name, as the functions of the add-on package cannot be pickled by reference
+# in a process that does not have bpy.
+TASKS = {
+    'chr0': encodeChrTask,
+    'srt0': encodeSrtTask
+}
+
+
+def runTask(task: str, payload: tuple) -> tuple:
+    return TASKS[task](payload)
+
+
+def runTasks(task: str, payloads: list) -> list:
+    return [TASKS[task](payload) for payload in payloads]
+
+
+def runToEnd(generator):
+    """
+    Runs a generator that reports its progress, such as EncodingEngine.run,
+    to completion and returns its return value.
+    """
+    while True:
+        try:
+            next(generator)
+        except StopIteration as stop:
+            return stop.value
+
+
+def trackProgress(stage: str, generator, total: int):
+    """
+    Generator that yields (stage, done, total) for every number of finished
+    items yielded by the given generator, and returns its return value.
+    """
+    try:
+        while True:
+            yield stage, next(generator), total
+    except StopIteration as stop:
+        return stop.value
+    finally:
+        generator.close()
+
+
+def getWorkerCount(workers: int) -> int:
+    """
+    Returns the number of processes used for the given worker setting, where 0
+    means one per core.
+    """
+    return workers if workers > 0 else os.cpu_count() or 1
+
+
+def canStartWorkers() -> bool:
+    """
+    Returns whether worker processes can be started. Before Blender 2.92,
+    sys.executable is Blender itself rather than its Python interpreter.
+    """
+    name = os.path.basename(sys.executable or '').lower()
+    return bool(name) and not name.startswith('blender')
+
+
+class EncodingEngine():
+    """
+    Encodes nodes from keyframes that have already been taken out of Blender,
+    spreading them across a pool of worker processes. Results are returned in
+    the order of the payloads, whichever process finishes first. If there are
+    too few payloads, only one worker, or the pool cannot be used, the
+    payloads are encoded in this process instead.
+    The workers import this module from the add-on directory rather than from
+    the add-on package, so ChrAnimData and AxisKeyframes returned by them are
+    instances of the classes of that module. They are read the same way, as
+    long as the encoder does not check them with isinstance.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = getWorkerCount(workers)
+        self.__executor = None
+        self.__module = None
+
+    def __getExecutor(self):
+        if self.__executor is None:
+            # Make the workers import this module without the add-on package,
+            # which would import bpy. Worker processes are started with the
+            # same sys.path as this process.
+            directory = os.path.dirname(os.path.abspath(__file__))
+            if directory not in sys.path:
+                sys.path.insert(0, directory)
+            self.__module = importlib.import_module('bae_engine')
+
+            # Forking Blender is unsafe, so always start fresh interpreters
+            self.__executor = concurrent.futures.ProcessPoolExecutor(
+                self.workers, multiprocessing.get_context('spawn'))
+        return self.__executor
+
+    def run(self, task: str, payloads: list):
+        """
+        Generator that runs the named task (see TASKS) on every payload. Yields
+        the number of payloads finished so far while it works, and returns the
+        results in the order of the payloads. Closing the generator cancels
+        the payloads that have not started. See runToEnd.
+        """
+        if (self.workers > 1 and len(payloads) >= PARALLEL_MIN_PAYLOADS
+                and canStartWorkers()):
+            try:
+                executor = self.__getExecutor()
+                chunksize = max(1, len(payloads) // (4 * self.workers))
+                chunks = [payloads[i: i + chunksize]
+                          for i in range(0, len(payloads), chunksize)]
+                futures = [executor.submit(self.__module.runTasks, task, chunk)
+                           for chunk in chunks]
+            except (concurrent.futures.BrokenExecutor, OSError) as error:
+                self.__fail(error)
+            else:
+                try:
+                    with span('encoding', task=task, payloads=len(payloads),
+                              workers=self.workers):
+                        pending = set(futures)
+                        while pending:
+                            done, pending = concurrent.futures.wait(
+                                pending, ENGINE_POLL_INTERVAL,
+                                concurrent.futures.FIRST_COMPLETED)
+                            yield sum(len(chunk) for chunk, future
+                                      in zip(chunks, futures) if future.done())
+                    return [result for future in futures
+                            for result in future.result()]
+                except (concurrent.futures.BrokenExecutor, OSError,
+                        pickle.PicklingError) as error:
+                    self.__fail(error)
+                finally:
+                    for future in futures:
+                        future.cancel()
+
+        results = []
+        for payload in payloads:
+            results.append(runTask(task, payload))
+            yield len(results)
+        return results
+
+    def map(self, task: str, payloads: list) -> list:
+        """
+        Runs the named task (see TASKS) on every payload and returns the
+        results in the same order.
+        """
+        return runToEnd(self.run(task, payloads))
+
+    def __fail(self, error):
+        print("Encoding in one process, worker processes failed: %s" % error)
+        self.shutdown()
+
+    def shutdown(self):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False)
+            self.__executor = None
+
+
+# The pool is kept between exports, so starting the worker processes is only
+# paid for once.
+_engine = None
+
+
+def getEncodingEngine(workers: int) -> EncodingEngine:
+    """
+    Returns the shared encoding engine, replacing it if the number of workers
+    has changed.
+    """
+    global _engine
+    if _engine is None or _engine.workers != getWorkerCount(workers):
+        shutdownEncodingEngine()
+        _engine = EncodingEngine(workers)
+    return _engine
+
+
+def shutdownEncodingEngine():
+    global _engine
+    if _engine is not None:
+        _engine.shutdown()
+        _engine = None
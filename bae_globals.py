@@ -23,6 +23,48 @@
 CHR0_INTERPOLATED_FORMATS = ["i4", "i6", "i12"]
 CHR0_LINEAR_FORMATS = ["l1", "l4"]
 
+# Size of the header and version of complete CHR0 files. Version 4 (used by
+# Brawl) has no user data offset, so its header is 0x28 bytes; version 5
+# headers are 0x2C bytes.
+CHR0_HEADER_SIZE = 0x28
+CHR0_FILE_VERSION = 4
+
+# Folders of a BRRES file containing each type of animation, and the alignment
+# of data appended to BRRES files.
+BRRES_FOLDERS = {
+    b'CHR0': b'AnmChr(NW4R)',
+    b'SRT0': b'AnmTexSrt(NW4R)',
+    b'CLR0': b'AnmClr(NW4R)'
+}
+BRRES_ALIGNMENT = 0x20
+
+# Size of the header and version of complete SRT0 and CLR0 files. These are
+# the versions used by Brawl, which have no user data offset; SRT0 version 5
+# and CLR0 version 4 headers are 4 bytes longer.
+SRT0_HEADER_SIZE = 0x28
+SRT0_FILE_VERSION = 4
+CLR0_HEADER_SIZE = 0x24
+CLR0_FILE_VERSION = 3
+
+# Each CLR0 material entry has two flag bits per target (such as the diffuse
+# colour), which state whether the target is animated and whether its colour
+# is stored as a single constant colour.
+CLR0_TARGET_EXISTS = 1
+CLR0_TARGET_CONSTANT = 3
+CLR0_TARGET_DIFFUSE = 0
+
+# Inputs of Blender's Mapping node exported as the scale X, scale Y, rotation,
+# translation X and translation Y of an SRT0 texture entry, as (input index,
+# array index). Inputs 1, 2 and 3 are the location, rotation and scale.
+SRT0_MAPPING_INPUTS = ((3, 0), (3, 1), (2, 2), (1, 0), (1, 1))
+
+# Largest number of textures an SRT0 material entry can animate.
+SRT0_MAX_TEXTURES = 8
+
+# Properties of pose bones exported as the scale, rotation and translation of
+# CHR0 nodes.
+CHR0_BONE_CHANNELS = ('scale', 'rotation_euler', 'location')
+
 # Blender supports keyframes with vertical tangents, BRRES CHR0 and STR0 files
 # do not. Hence, a large value is used to approximate vertical gradients.
 # Note: >= 64 upgrades file to i6
@@ -33,6 +75,13 @@ VERTICAL_TANGENT_GRADIENT = 1000
 # will be stored as two distinct points in CHR0 and STR0 nodes.
 DISTINCT_TANGENTS_THRESHOLD = 0.00001
 
+# Keyframe interpolation types that are exported, and their indexes as stored
+# in a KeyframeSnapshot.
+INTERPOLATION_TYPES = ['CONSTANT', 'LINEAR', 'BEZIER']
+INTERPOLATION_CONSTANT = 0
+INTERPOLATION_LINEAR = 1
+INTERPOLATION_BEZIER = 2
+
 # Dictionary of CHR0 curve formats and their representative index stored in the
 # file.
 CHR0_FORMAT_INDEXES = {
@@ -44,5 +93,65 @@ CHR0_FORMAT_INDEXES = {
     'l4':   6
 }
 
-# Whether debugging information is printed to Blender's console.
-PRINT_TO_CONSOLE = False
+# Size in bytes of the header of a CHR0 frame data structure, and of each
+# keyframe stored in it, by format.
+CHR0_FRAME_HEADER_SIZES = {
+    'i4':  16,
+    'i6':  16,
+    'i12': 8,
+    'l1':  8,
+    'l4':  0
+}
+CHR0_KEYFRAME_SIZES = {
+    'i4':  4,
+    'i6':  6,
+    'i12': 12,
+    'l1':  4,
+    'l4':  4
+}
+
+# Parameters used to pack interpolated CHR0 keyframes, by format:
+# (bits per value and tangent, tangent scale, frame scale, bytes per keyframe).
+# Frames are stored in the remaining high bits of each keyframe.
+CHR0_INTERPOLATED_PACKING = {
+    'i4': (12, 32, 1, 4),
+    'i6': (16, 256, 32, 6)
+}
+
+# Lists with fewer keyframes than this are packed in pure Python when NumPy is
+# available, as the cost of creating arrays outweighs the benefit.
+VECTORIZE_MIN_KEYFRAMES = 16
+
+# Keyframe reduction never creates a curve segment longer than this many
+# frames. This bounds the cost of checking long runs of removable keyframes.
+REDUCTION_MAX_SPAN = 255
+
+# Batch exports with fewer nodes than this are encoded in the exporting
+# process, as starting worker processes would take longer than encoding them.
+PARALLEL_MIN_PAYLOADS = 8
+
+# Seconds the encoding engine waits for a worker process to finish before
+# reporting its progress.
+ENGINE_POLL_INTERVAL = 0.01
+
+# Version of the encoder's output. Results in the export cache are only
+# reused if they were stored by the same version, so increase it whenever a
+# change to the encoder changes the bytes written for the same input, or the
+# objects (such as ChrAnimData) its tasks return.
+ENCODER_VERSION = 4
+
+# Name of the export cache's directory in Blender's user data files directory,
+# and the number of bytes its results may take before the least recently
+# written are deleted.
+EXPORT_CACHE_DIRECTORY = "brres_animation_exporter_cache"
+EXPORT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Interval in seconds of the timer driving modal exports, and how long each
+# timer event may work before returning control to Blender's UI.
+MODAL_EXPORT_INTERVAL = 0.02
+MODAL_EXPORT_TIME_SLICE = 0.05
+
+# Path of a file the timing spans and counters of each export are saved to, in
+# the Chrome trace format (see bae_trace), or None. Tracing can also be
+# enabled with the BAE_TRACE environment variable.
+TRACE_FILE = None
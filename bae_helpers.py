@@ -18,1054 +18,542 @@
 # <pep8 compliant>
 
 import bpy
-import struct
-import math
 import os
+import re
 from .bae_globals import *
+from .bae_encoder import *
+from .bae_keyframes import *
+from .bae_output import *
+from .bae_brres import *
+from .bae_patch import *
+from .bae_engine import *
+from .bae_cache import *
+from .bae_trace import *
 
 
-class ChrAnimData():
-
-    def __init__(self):
-        self.__format = 'none'
-        self.__has = False
-        self.__data_x = []
-        self.__fixed_x = True
-        self.__data_y = []
-        self.__fixed_y = True
-        self.__data_z = []
-        self.__fixed_z = True
-        self.__isotropic = True
-
-    def __str__(self):
-        data_list = [
-            self.__data_x,
-            self.__fixed_x,
-            self.__data_y,
-            self.__fixed_y,
-            self.__data_z,
-            self.__fixed_z
-        ]
-
-        def __format_data(axis):
-
-            if data_list[axis * 2]:
-                if self.__format in CHR0_LINEAR_FORMATS or data_list[axis*2 + 1]:
-                    return ["%07.3f" % frame for frame in data_list[axis * 2]]
-                else:
-                    return ["(%04s, %07.3f, %07.3f)"
-                            % tuple for tuple in data_list[axis * 2]]
-            else:
-                return []
-
-        lines = [
-            "Format: %s" % self.__format,
-            "Has data: %s" % self.__has,
-            "Is isotropic: %s\n" % self.__isotropic,
-
-            "X axis has: %s" % bool(self.__data_x),
-            "X axis constant: %s" % self.__fixed_x,
-            *__format_data(0), "\n",
-
-            "Y axis has: %s" % bool(self.__data_y),
-            "Y axis constant: %s" % self.__fixed_y,
-            *__format_data(1), "\n",
-
-            "Z axis has: %s" % bool(self.__data_z),
-            "Z axis constant: %s" % self.__fixed_z,
-            *__format_data(2)
-        ]
-
-        return '\n'.join(lines)
-
-    def updateData(self, axis: int, data: list):
-        """
-        'axis' should take values 0, 1 or 2 corresponding
-        to the X, Y or Z axis, respectively.
-        """
-        if axis not in range(3):
-            raise ValueError("'axis' must be in range(0, 3)")
-
-        elif not type(data) == list:
-            raise ValueError("'data' must be a list")
-
-        else:
-            if axis == 2:
-                self.__data_z = data
-
-            elif axis == 1:
-                self.__data_y = data
-
-            else:
-                self.__data_x = data
-
-    def updateFormat(self, format):
-        self.__format = format
-
-    def updateFlags(self):
-        self.__isotropic = self.__data_x == self.__data_y and self.__data_y == self.__data_z
-
-        self.__fixed_x = not self.__data_x or len(self.__data_x) == 1
-        self.__fixed_y = not self.__data_y or len(self.__data_y) == 1
-        self.__fixed_z = not self.__data_z or len(self.__data_z) == 1
-
-        self.__has = bool(self.__data_x) or bool(self.__data_y) or bool(self.__data_z)
-
-    def formatData(self, srt):
-
-        settings = bpy.context.scene.brres_animation_exporter_properties
-        xyz_to_xzy = settings.xyz_to_xzy
-        scale = settings.scale_translation
-        convert_to_degrees = settings.convert_to_degrees
-        deg_per_rad = 180 / math.pi if convert_to_degrees else 1
-
-        if xyz_to_xzy:
-
-            data_y_temp = self.__data_y
-            fixed_y_temp = self.__fixed_y
-
-            self.__data_y = self.__data_z
-            self.__fixed_y = self.__fixed_z
-
-            self.__data_z = data_y_temp
-            self.__fixed_z = fixed_y_temp
-
-        data = [self.__data_x, self.__data_y, self.__data_z]
-
-        for i in range(3):
-            if data[i]:
-                new_list = []
-                sign = -1 if i == 2 and xyz_to_xzy else 1
-
-                # scale
-                if srt == 0:
-
-                    if len(data[i]) == 1:
-
-                        new_list.append(data[i][0])
-
-                    else:
-
-                        for tuple in data[i]:
-                            new_list.append((
-
-                                # frame
-                                int(tuple[0]),
-
-                                # value
-                                tuple[1],
-
-                                # tangent
-                                tuple[2]
-                            ))
-
-                # rotation
-                elif srt == 1:
-
-                    if self.__format in CHR0_LINEAR_FORMATS or len(data[i]) == 1:
-
-                        for value in data[i]:
-
-                            new_list.append(value * deg_per_rad * sign)
-
-                    else:
-
-                        for tuple in data[i]:
-                            new_list.append((
-
-                                # frame
-                                int(tuple[0]),
-
-                                # value
-                                tuple[1] * deg_per_rad * sign,
-
-                                # tangent
-                                tuple[2] * deg_per_rad * sign
-                            ))
-
-                # translation
-                else:
-
-                    if len(data[i]) == 1:
-
-                        new_list.append(data[i][0] * scale * sign)
-
-                    else:
-
-                        for tuple in data[i]:
-                            new_list.append((
-
-                                # frame
-                                int(tuple[0]),
-
-                                # value
-                                tuple[1] * scale * sign,
-
-                                # tangent
-                                tuple[2] * scale * sign
-                            ))
-                if i == 0:
-                    self.__data_x = new_list
-                elif i == 1:
-                    self.__data_y = new_list
-                else:
-                    self.__data_z = new_list
-
-        self.__update_format(srt)
-
-    def __update_format(self, srt):
-
-        if self.__has:
-
-            const_x = get_fixed(self.__data_x, srt)
-            const_y = get_fixed(self.__data_y, srt)
-            const_z = get_fixed(self.__data_z, srt)
-
-            if const_x and len(self.__data_x) != 1:
-                self.__data_x = const_x
-                self.__fixed_x = True
-
-            if const_y and len(self.__data_y) != 1:
-                self.__data_y = const_y
-                self.__fixed_y = True
-
-            if const_z and len(self.__data_z) != 1:
-                self.__data_z = const_z
-                self.__fixed_z = True
-
-            if self.__fixed_x and self.__fixed_y and self.__fixed_z:
-
-                self.__format = 'none'
-
-                if (self.__data_x[0] == self.__data_y[0] and
-                        self.__data_y[0] == self.__data_z[0]):
-
-                    self.__isotropic = True
-
-                    if self.__data_x[0] == (1 if srt == 1 else 0):
-
-                        self.__has = False
-
-            else:
-                if self.__format == 'i4' or self.__format == 'i6':
-
-                    largest_frame_count = 0
-                    largest_frame_index = 0
-                    largest_tangent = 0
-                    smallest_tangent = 0
-
-                    data_info = [self.__data_x, self.__fixed_x,
-                                 self.__data_y, self.__fixed_y,
-                                 self.__data_z, self.__fixed_z]
-
-                    for i in range(3):
-                        if not data_info[2*i + 1]:
-                            if largest_frame_count < len(data_info[2 * i]):
-                                largest_frame_count = len(data_info[2 * i])
-                            if largest_frame_index < data_info[2 * i][-1][0]:
-                                largest_frame_index = data_info[2 * i][-1][0]
-                            min, max = getDataMaxima(data_info[2 * i], 2)
-                            if min < smallest_tangent:
-                                smallest_tangent = min
-                            if largest_tangent < max:
-                                largest_tangent = max
-
-                    if PRINT_TO_CONSOLE:
-                        print(("largest_frame_count: %s\n"
-                               "largest_frame_index: %s\n"
-                               "largest_tangent: %s\n"
-                               "smallest_tangent: %s"
-                               ) % (largest_frame_count,
-                                    largest_frame_index,
-                                    largest_tangent,
-                                    smallest_tangent))
-
-                    if (largest_frame_count > 65535 or
-                        largest_frame_index > 2047 or
-                        256 * smallest_tangent < -32768 or
-                            256 * largest_tangent >= 32768):
-
-                        if PRINT_TO_CONSOLE:
-                            print("Increased format from %s to i12" % self.__format)
-                        self.__format = 'i12'
-
-                    elif self.__format == 'i4':
-                        if (largest_frame_index > 255 or
-                            32 * smallest_tangent < -2048 or
-                                32 * largest_tangent >= 2048):
-
-                            if PRINT_TO_CONSOLE:
-                                print("Increased format from %s to i6" % self.__format)
-                            self.__format = 'i6'
-
-    def size(self) -> int:
-        if self.__has:
-            if self.__isotropic:
-                return 4
-            else:
-                return 12
-        else:
-            return 0
-
-    def has(self) -> bool:
-        return self.__has
-
-    def xFixed(self) -> bool:
-        return self.__fixed_x
-
-    def yFixed(self) -> bool:
-        return self.__fixed_y
-
-    def zFixed(self) -> bool:
-        return self.__fixed_z
-
-    def isotropic(self) -> bool:
-        return self.__isotropic
-
-    def format(self) -> str:
-        return self.__format
-
-    def xData(self) -> list:
-        return self.__data_x
-
-    def yData(self) -> list:
-        return self.__data_y
-
-    def zData(self) -> list:
-        return self.__data_z
-
-
-def get_fixed(data: list, srt: int) -> list:
+def getFileHead(name: str, prepend_blend_filename=True) -> (str, str):
     """
-    Return a list constaining a constant if the given list is null, empty,
-    contains only one element, or containes one unique element. Otherwise,
-    return an empty list indicating the given list is not constant.
+    Returns the directory of the blend file and a cleaned version of the passed
+    string, with the name of the blend file prepended by default. The
+    directory is None if the blend file has not been saved.
     """
-    if not data:
-        return [0] if srt else [1]
-    elif len(data) == 1:
-        return [data[0]]
-    elif type(data[0]) == tuple:
-        for tuple_data in data:
-            if tuple_data[1] != data[0][1]:
-                return []
-        return [data[0][1]]
+    if bpy.data.is_saved:
+        if prepend_blend_filename:
+            root_and_ext = os.path.splitext(bpy.data.filepath)
+            name_without_ext = os.path.basename(root_and_ext[0])
+            name = name_without_ext + name
+        return os.path.split(bpy.data.filepath)[0], bpy.path.clean_name(name)
     else:
-        for value in data:
-            if value != data[0]:
-                return []
-        return [data[0]]
-
-
-def combineSRT(s: ChrAnimData, r: ChrAnimData, t: ChrAnimData) -> bytearray:
-
-    def get_header_values(data: list, bit_length: int) -> (int, int):
-        """
-        Used for I4, I6 and L1 interpolation formats. These formats store the
-        value of each keyframe as an integer* using 'bit_length' bits. The
-        actual value is obtained by step_header * step_frame + base_header,
-        where step_header and base_header are stored in the header and
-        step_frame is the value stored in each frame.
-        Returns (step_header, base_header).
-        Note: step_header and base_header are calculated such that the range of
-        values in the list are normalised to the range of an unsigned integer
-        represented in bit_length bits.
-        *step_frame is actually a float for the L1 format.
-        Assumes list contains at least two elements.
-        """
-
-        min, max = getDataMaxima(data, 1)
-
-        step_header = (max - min) / (2**bit_length - 1)
-        base_header = min
-        return step_header, base_header
-
-    def get_frame_value(step_header: float, base_header: float,
-                        value: float) -> float:
-
-        if step_header:
-            return (value - base_header) / step_header
-        else:
-            return 0
-
-    node = bytearray(4)
-
-    # type code
-    node += struct.pack('>I', (
-        s.isotropic() << 0x04
-        | r.isotropic() << 0x05
-        | t.isotropic() << 0x06
-        | s.xFixed() << 0x0D
-        | s.yFixed() << 0x0E
-        | s.zFixed() << 0x0F
-        | r.xFixed() << 0x10
-        | r.yFixed() << 0x11
-        | r.zFixed() << 0x12
-        | t.xFixed() << 0x13
-        | t.yFixed() << 0x14
-        | t.zFixed() << 0x15
-        | s.has() << 0x16
-        | r.has() << 0x17
-        | t.has() << 0x18
-        | CHR0_FORMAT_INDEXES[s.format()] << 0x19
-        | CHR0_FORMAT_INDEXES[r.format()] << 0x1B
-        | CHR0_FORMAT_INDEXES[t.format()] << 0x1E
-    ))
-
-    offset = 4
-    node += bytearray(s.size() + r.size() + t.size())
-
-    srt = -1
-    for chr_anim_data in [s, r, t]:
-        srt += 1
-        if chr_anim_data.has():
-
-            axes_info = [
-                chr_anim_data.xFixed(), chr_anim_data.xData(),
-                chr_anim_data.yFixed(), chr_anim_data.yData(),
-                chr_anim_data.zFixed(), chr_anim_data.zData()
-            ]
-
-            for xyz in range(0, 1 if chr_anim_data.isotropic() else 3):
-
-                offset += 4
-
-                # if axis does not need a frame data structure
-                if axes_info[2 * xyz]:
-
-                    fixed_value = axes_info[2*xyz + 1][0]
-                    node[offset: offset + 4] = struct.pack('>f', fixed_value)
-
-                # if axis needs a frame data structure
-                else:
-                    node[offset: offset + 4] = struct.pack('>I', len(node))
-
-                    if PRINT_TO_CONSOLE:
-                        print("Format for SRT(%s): %s" % (srt, chr_anim_data.format()))
-
-                    # Interpolated 4
-                    if chr_anim_data.format() == 'i4':
-
-                        frame_scale = 1.0  # often 0x3C381703
-                        step, base = get_header_values(axes_info[2*xyz + 1], 12)
-
-                        # header
-                        node += struct.pack('>HHfff',
-                                            len(axes_info[2*xyz + 1]),  # frame count
-                                            0x0000,  # unknown
-                                            frame_scale,
-                                            step,
-                                            base
-                                            )
-
-                        # keyframes
-                        for frame, value, tangent in axes_info[2*xyz + 1]:
-
-                            value = get_frame_value(step, base, value)
-                            value = 4095 if value == 4096 else int(value)
-
-                            node += (
-                                to_bits(frame, 8) << 24  # frame of keyframe
-                                | to_bits(value, 12) << 12
-                                | to_bits(int(tangent * 32), 12, signed=True)
-                            ).to_bytes(4, byteorder='big')
-
-                    # Interpolated 6
-                    elif chr_anim_data.format() == 'i6':
-
-                        frame_scale = 1.0  # often 0x3C381703
-                        step, base = get_header_values(
-                            axes_info[2*xyz + 1], 16)
-
-                        # header
-                        node += struct.pack('>HHfff',
-                                            len(axes_info[2*xyz + 1]),  # frame count
-                                            0x0000,  # unknown
-                                            frame_scale,
-                                            step,
-                                            base
-                                            )
-
-                        # keyframes
-                        for frame, value, tangent in axes_info[2*xyz + 1]:
-
-                            value = get_frame_value(step, base, value)
-                            value = 65535 if value == 65536 else int(value)
-
-                            node += (
-                                to_bits(frame * 32, 16) << 32  # frame of keyframe
-                                | to_bits(value, 16) << 16
-                                | to_bits(int(tangent * 256), 16, signed=True)
-                            ).to_bytes(6, byteorder='big')
+        return None, bpy.path.clean_name(name)
 
-                    # Interpolated 12
-                    elif chr_anim_data.format() == 'i12':
 
-                        frame_scale = 1.0  # often 0x3C381703
-
-                        # header
-                        node += struct.pack('>HHf',
-                                            len(axes_info[2*xyz + 1]),  # frame count
-                                            0x0000,  # unknown
-                                            frame_scale
-                                            )
-
-                        # keyframes
-                        for tuple in axes_info[2*xyz + 1]:
-                            node += struct.pack('>fff', *tuple)
-
-                    # Linear 1
-                    elif chr_anim_data.format() == 'l1':
-
-                        step, base = get_header_values(
-                            axes_info[2*xyz + 1], 16)
-
-                        # header
-                        node += struct.pack('>ff', step, base)
-
-                        # keyframes
-                        for value in axes_info[2*xyz + 1]:
-                            value = get_frame_value(step, base, value)
-                            node += struct.pack('>f', value)
-
-                    # Linear 4
-                    else:
-
-                        # keyframes
-                        for value in axes_info[2*xyz + 1]:
-                            node += struct.pack('>f', value)
-
-    return node
-
-
-def get_srt_node(data_all: list) -> bytearray:
-
-    get_srt = {0: 0, 1: 0, 2: 1, 3: 2, 4: 2}
-
-    for i in range(5):
-        constant = get_fixed(data_all[i], get_srt[i])
-        if constant:
-            data_all[i] = constant
+def getUniqueFilename(name: str, prepend_blend_filename=True,
+                      include_tail=False, extension='') -> str:
+    """
+    If the blend file has not been saved, the function returns a cleaned version
+    of the passed string. Otherwise, if a file with the passed name already
+    exists in the directory of the blend file, make the name unique. By default,
+    the name of the blend file is prepended to the passed name. 'extension' is
+    appended to the cleaned name.
+    """
+    tail, head = getFileHead(name, prepend_blend_filename)
 
-    scale_x_fixed = len(data_all[0]) == 1
-    scale_y_fixed = len(data_all[1]) == 1
-    rotation_fixed = len(data_all[2]) == 1
-    translation_x_fixed = len(data_all[3]) == 1
-    translation_y_fixed = len(data_all[4]) == 1
+    if tail is not None:
+        # Make 'head' a unique filename if not already.
+        head = getDirectoryNameIndex(tail).getUniqueName(head, extension)
+        return os.path.join(tail, head) if include_tail else head
+    else:
+        return head + extension
 
-    scale_isotropic = data_all[0] == data_all[1]
-    scale_has = not (scale_x_fixed and data_all[0][0] == 1
-                     and scale_isotropic)
-    rotation_has = bool(data_all[2][0])
-    translation_has = bool(data_all[3][0]) or bool(data_all[4][0])
 
-    if rotation_has:
-        if rotation_fixed:
-            data_all[2][0] = math.degrees(data_all[2][0])
-        else:
-            new_rot_data = []
-            for frame, value, tangent in data_all[2]:
-                new_rot_data.append((frame, math.degrees(value), math.degrees(tangent)))
-            data_all[2] = new_rot_data
+def writeExportFile(settings, name: str, file_data: bytes,
+                    extension: str = '') -> str:
+    """
+    Writes an exported node or file to a new file next to the blend file,
+    named as by getUniqueFilename, and returns its path. If
+    settings.reuse_identical_files is set and a file written earlier by the
+    add-on under the same name (or a numbered version of it) has the same
+    contents, nothing is written and the path of that file is returned.
+    """
+    tail, head = getFileHead(name)
+    cache = None
 
-    node = bytearray()
+    if settings.reuse_identical_files and tail is not None:
+        cache = openExportCache()
+    if cache is not None:
+        filename = cache.findFile(tail, head, extension, file_data)
+        if filename is not None:
+            return filename
 
-    node += struct.pack('>I', (
-        1
-        | (not scale_has) << 0x01
-        | (not rotation_has) << 0x02
-        | (not translation_has) << 0x03
-        | scale_isotropic << 0x04
-        | scale_x_fixed << 0x05
-        | scale_y_fixed << 0x06
-        | rotation_fixed << 0x07
-        | translation_x_fixed << 0x08
-        | translation_y_fixed << 0x09
-    ))
+    with span('file write', bytes=len(file_data)):
+        filename = writeUniqueFile(os.curdir if tail is None else tail, head,
+                                   extension, file_data)
 
-    node += bytearray(4*(scale_has + (not scale_isotropic) + rotation_has
-                           + 2 * translation_has))
+    if cache is not None:
+        cache.addFile(filename, file_data)
+    return filename
 
-    offset = 0
 
-    def append_data(data: list, node: bytearray, srt: int):
+def getExportCacheDirectory() -> str:
+    return bpy.utils.user_resource('DATAFILES', path=EXPORT_CACHE_DIRECTORY)
 
-        sign = -1 if srt else 1
 
-        if len(data) == 1:
-            node[offset: offset + 4] = struct.pack('>f', data[0] * sign)
-        else:
-            node[offset: offset + 4] = struct.pack('>I', len(node) - offset)
-            node += struct.pack('>HHf',
-                                len(data),  # frame count
-                                0x0000,  # unknown
-                                1)  # frame scale
-
-            for frame, value, tangent in data:
-                node += struct.pack('>3f',
-                                    frame,  # frame index
-                                    value * sign,  # value
-                                    tangent * sign  # tangent
-                                    )
-
-    if scale_has:
-        offset += 4
-        append_data(data_all[0], node, 0)
-        if not scale_isotropic:
-            offset += 4
-            append_data(data_all[1], node, 0)
-
-    if rotation_has:
-        offset += 4
-        append_data(data_all[2], node, 1)
-
-    if translation_has:
-        offset += 4
-        append_data(data_all[3], node, 2)
-        offset += 4
-        append_data(data_all[4], node, 2)
-
-    return node
+def openExportCache():
+    """
+    Returns the export cache, or None if its directory cannot be used (see
+    bae_cache.getExportCache), in which case nothing is cached.
+    """
+    try:
+        return getExportCache(getExportCacheDirectory())
+    except OSError as error:
+        print("Export cache not used: %s" % error)
+        return None
 
 
-def getUniqueFilename(name: str, prepend_blend_filename=True,
-                      include_tail=False) -> str:
+def runEncodingTasks(settings, task: str, payloads: list):
     """
-    If the blend file has not been saved, the function returns a cleaned version
-    of the passed string. Otherwise, if a file with the passed name already
-    exists in the directory of the blend file, make the name unique. By default,
-    the name of the blend file is prepended to the passed name.
+    Generator that runs the named task of the encoding engine (see
+    bae_engine.TASKS) on every payload, reusing results from the export cache
+    if it is enabled. Yields the number of payloads finished so far and
+    returns the results. See EncodingEngine.run.
     """
-    if bpy.data.is_saved:
-        # Clean name and prepend blend filename.
-        if prepend_blend_filename:
-            root_and_ext = os.path.splitext(bpy.data.filepath)
-            name_without_ext = os.path.basename(root_and_ext[0])
-            head = bpy.path.clean_name(name_without_ext + name)
-        else:
-            head = bpy.path.clean_name(name)
-
-        # Make 'head' a unique filename if not already.
-        tail = os.path.split(bpy.data.filepath)[0]
-        if os.path.exists(os.path.join(tail, head)):
-            i = 1
-            while os.path.exists(os.path.join(tail, ('%s(%s)' % (head, i)))):
-                i += 1
-            head = '%s(%s)' % (head, i)
-            return os.path.join(tail, head) if include_tail else head
-        else:
-            return os.path.join(tail, head) if include_tail else head
+    engine = getEncodingEngine(settings.encode_workers)
+    cache = openExportCache() if settings.use_export_cache else None
+    if cache is not None:
+        return (yield from cache.run(engine, task, payloads))
     else:
-        return bpy.path.clean_name(suffix)
+        return (yield from engine.run(task, payloads))
 
 
-def getFilename() -> str:
+def getFilename(node_name: str = None, settings=None) -> str:
     """
     Returns a name for the file containing meaningful information, including the
-    user's name for the node, the type of node and duration of the animation in
-    frames.
+    user's name for the node (or 'node_name' if given), the type of node and
+    duration of the animation in frames, taken from 'settings' (the scene
+    properties if not given).
     """
-    settings = bpy.context.scene.brres_animation_exporter_properties
+    if settings is None:
+        settings = bpy.context.scene.brres_animation_exporter_properties
     frame_diff = settings.end_frame - settings.start_frame
     return '_%sNode_%sf_%s' % (settings.node_type,
-                               (frame_diff + 1 if frame_diff > -1 else 0), settings.node_name)
-
+                               (frame_diff + 1 if frame_diff > -1 else 0),
+                               settings.node_name if node_name is None else node_name)
 
-def remove_non_ascii(s: str, sub=""):
-    return "".join(c if ord(c) < 128 else sub for c in s)
 
-
-def analyseKeyframeList(FCurve: bpy.types.FCurve, user_left: int,
-                        user_right: int, to_be_sampled: bool) -> (int, int, int):
+def sampleFCurve(FCurve: bpy.types.FCurve, user_left: int,
+                 user_right: int) -> list:
     """
-    Analyses the keyframe list in the given FCurve. If to_be_sampled is True,
-    keyframes are added to each frame on the interval specified by the user. For
-    each endpoint, the keyframe closest to the interval (but outside it or on
-    its boundary) is found. If no such keyframe exists, a keyframe is added on
-    the boundary of that side of the interval. These two keyframes are selected
-    and the curve is sampled. Returns a tuple containing the indexes of the
-    endpoint keyframes. If to_be_sampled is False, instead finds and returns the
-    index of the leftmost and rightmost keyframes on the given interval. The
-    tuple (0, 0, 0) is returned if the F-Curve is None, empty, or if
-    to_be_sampled is False and there are no keyframes on the given interval. If
-    to_be_sampled is False, the tuple (#, #, 1) is returned if and only if there
-    is exactly one keyframe on the given interval.
+    Returns the value of the given F-Curve at every frame on the interval
+    specified by the user, without modifying the F-Curve. The curve is
+    evaluated as Blender displays it, including its extrapolation outside the
+    range of its keyframes. Returns an empty list if the F-Curve is None or
+    empty, and a list containing the value of the keyframe if the F-Curve has
+    exactly one keyframe.
     """
+    if FCurve is None or FCurve.is_empty:
+        return []
 
-    if FCurve is None:
-        return 0, 0, 0
-
-    elif FCurve.is_empty:
-        return 0, 0, 0
+    elif len(FCurve.keyframe_points) == 1:
+        return [FCurve.keyframe_points[0].co[1]]
 
     else:
-        data_left, data_right = FCurve.range()
+        evaluate = FCurve.evaluate
+        return [evaluate(frame) for frame in range(user_left, user_right + 1)]
 
-        if to_be_sampled:
-            if len(FCurve.keyframe_points) == 1:
-                return 0, 0, 1
-            else:
-                if user_left < data_left:
-                    # Create new keyframe on left boundary
-                    FCurve.keyframe_points.insert(user_left, FCurve.keyframe_points[0].co[1])
-                    data_left = user_left
-                    FCurve.update()
-                    index_start = 0
-
-                elif data_left < user_left:
-                    # Get index of keyframe closer to left boundary
-                    index_start = optimiseKeyframeIndex(FCurve, user_left, data_left)
 
-                else:
-                    index_start = 0
-
-                if data_right < user_right:
-                    # Create new keyframe on right boundary
-                    FCurve.keyframe_points.insert(user_right, FCurve.keyframe_points[-1].co[1])
-                    data_right = user_right
-                    FCurve.update()
-                    index_end = len(FCurve.keyframe_points)-1
+def getAxisKeyframes(FCurve: bpy.types.FCurve, format: str, user_left: int,
+                     user_right: int, label: str) -> (list, str):
+    """
+    Returns the data of one CHR0 axis in the form expected by get_chr_node,
+    taken from the given F-Curve on the interval specified by the user, and an
+    error message (None if there is no error). 'label' names the axis in error
+    messages, e.g. "Scale X".
+    """
+    with span('snapshot'):
+        snapshot = takeSnapshot(FCurve)
+
+    if not allFramesAreIntegers(snapshot):
+        return [], ("Error: At least one keyframe point in the F-Curve used "
+                    "for %s is not an integer") % label
+
+    # sample the F-Curve on every frame for l1, l4 formats
+    if format in CHR0_LINEAR_FORMATS:
+        with span('sampling', axis=label):
+            data = sampleFCurve(FCurve, user_left, user_right)
+        if not data:
+            return [], "Error: F-Curve used for %s is None or empty." % label
+        return data, None
+
+    # one span covers the analysis and the extraction of the keyframes
+    with span('extraction', axis=label) as extraction_span:
+        keyframe_info = analyseKeyframeList(snapshot, user_left, user_right)
+        extraction_span.set(left=keyframe_info[0], right=keyframe_info[1],
+                            keyframes=keyframe_info[2])
+
+        if not keyframe_info[2]:
+            return [], ("Error: F-Curve used for %s is None or contains 0 "
+                        "keyframes within the specified interval.") % label
+
+        # if F-Curve has 1 keyframe point
+        elif keyframe_info[2] == 1:
+            return [snapshot.values[keyframe_info[0]]], None
+
+        # get list of tuples for i4, i6, i12 formats
+        else:
+            return extractKeyframes(keyframe_info[0], keyframe_info[1],
+                                    snapshot, user_left, user_right), None
 
-                elif user_right < data_right:
-                    # Get index of keyframe closer to right boundary
-                    index_end = optimiseKeyframeIndex(FCurve, user_right, data_right)
 
-                else:
-                    index_end = len(FCurve.keyframe_points)-1
+# Matches the data path of a pose bone's F-Curve, capturing the (escaped) name
+# of the bone and the name of the property.
+BONE_DATA_PATH = re.compile(r'pose\.bones\["((?:[^"\\]|\\.)*)"\]\.(\w+)$')
 
-                bpy.ops.graph.select_all(action='DESELECT')
-                FCurve.keyframe_points[index_start].select_control_point = True
-                FCurve.keyframe_points[index_end].select_control_point = True
-                bpy.ops.graph.sample()  # Create keyframes on each frame between two selected keyframes
-                FCurve.update()  # Ensures keyframe list is chronological
 
-                new_index_start = index_start + \
-                    (user_left - int(FCurve.keyframe_points[index_start].co[0]))
-                new_index_end = new_index_start + (user_right - user_left)
+def groupBoneFCurves(action: bpy.types.Action) -> (dict, set):
+    """
+    Groups the F-Curves of an action by bone. Returns a dictionary mapping the
+    name of each bone to a list containing a list of three F-Curves (X, Y and
+    Z, None if missing) for each of scale, rotation and translation, in the
+    order the bones first appear in the action. Also returns the names of the
+    bones animated with quaternion or axis-angle rotation, which CHR0 nodes
+    cannot store.
+    """
+    bones = {}
+    unsupported_rotation = set()
 
-                return new_index_start, new_index_end, user_right - user_left + 1
+    for FCurve in action.fcurves:
+        match = BONE_DATA_PATH.match(FCurve.data_path)
+        if match is None:
+            continue
 
-        else:  # to_be_sampled = False
-            size = len(FCurve.keyframe_points)
-            new_left_index = getKeyframeIndex(FCurve.keyframe_points, user_left, 0, size-1)
-            if FCurve.keyframe_points[new_left_index].co[0] < user_left:
-                new_left_index += 1
-            new_right_index = getKeyframeIndex(FCurve.keyframe_points, user_right, 0, size-1)
-            if user_right < FCurve.keyframe_points[new_right_index].co[0]:
-                new_right_index -= 1
+        name = re.sub(r'\\(.)', r'\1', match.group(1))
+        channel = match.group(2)
 
-            if new_right_index < new_left_index:
-                # Indicates no keyframes in range
-                return 0, 0, 0  # Evaluates as False
+        if channel in CHR0_BONE_CHANNELS:
+            if FCurve.array_index < 3:
+                FCurves = bones.setdefault(name, [[None] * 3 for i in range(3)])
+                FCurves[CHR0_BONE_CHANNELS.index(channel)][FCurve.array_index] = FCurve
 
-            elif new_left_index == new_right_index:
-                # Indicates exactly one keyframe in range. Returns index of single keyframe.
-                return new_left_index, new_left_index, 1  # Evaluates as False
+        elif channel in ('rotation_quaternion', 'rotation_axis_angle'):
+            bones.setdefault(name, [[None] * 3 for i in range(3)])
+            unsupported_rotation.add(name)
 
-            else:
-                # Indicates at least two keyframes in range.
-                # Returns index of single keyframe.
-                return new_left_index, new_right_index, new_right_index-new_left_index + 1
+    return bones, unsupported_rotation
 
 
-def optimiseKeyframeIndex(FCurve: bpy.types.FCurve, user_frame: int,
-                          data_frame: int) -> int:
-    """
-    Takes user_frame as the left or right boundary, data_frame as some frame
-    that falls outside the region defined by the two boundaries. If a keyframe
-    on a frame closer or on the boundary (but not inside it) exists, return its
-    index within the list, else return the index of the keyframe at data_frame.
-    Knowing the keyframes closest to the boundaries will optimise the
-    'Sample Keyframes' operation later.
-    """
-    new_index = getKeyframeIndex(FCurve.keyframe_points, user_frame,
-                                 0, len(FCurve.keyframe_points)-1)
-    if data_frame < user_frame:
-        if user_frame < FCurve.keyframe_points[new_index].co[0]:
-            # There will always be at least data_frame to the left of new_index, so new_index-1>=0
-            new_index -= 1
-    else:  # user_frame > data_frame
-        if FCurve.keyframe_points[new_index].co[0] < user_frame:
-            # There will always be at least data_frame to the right of new_index, so new_index+1<=len(list)-1
-            new_index += 1
-    return new_index
-
-
-def getKeyframeIndex(keyframe_points: bpy.types.FCurveKeyframePoints,
-                     frame: int, min: int, max: int) -> int:
+def getMaterials(objects) -> list:
     """
-    Calls getKeyframeIndexRec and clamps the returned integer to a valid index.
+    Returns the materials of the given objects, each once, in the order of
+    the objects and their material slots.
     """
-    i = getKeyframeIndexRec(keyframe_points, frame, min, max)
-    if i < min:
-        return min
-    elif i > max:
-        return max
-    else:
-        return i
+    materials = []
+    for obj in objects:
+        for slot in getattr(obj, 'material_slots', ()):
+            if slot.material is not None and slot.material not in materials:
+                materials.append(slot.material)
+    return materials
 
 
-def getKeyframeIndexRec(keyframe_points: bpy.types.FCurveKeyframePoints,
-                        frame: int, min: int, max: int) -> int:
+def getColourFCurves(material: bpy.types.Material) -> list:
     """
-    Recursive binary search for a keyframe point with the given frame. If the
-    given list contains a keyframe point with the given frame, returns the index
-    of the keyframe point in the list. Otherwise, returns the index of the
-    keyframe point left or right of where the absent keyframe point would be.
+    Returns the F-Curves animating the red, green, blue and alpha channels of
+    the material's viewport display colour (None if missing).
     """
-    mid = (max + min)//2
-    value = int(keyframe_points[mid].co[0])
-    if min > max or value == frame:
-        return mid
-    elif value > frame:
-        return getKeyframeIndex(keyframe_points, frame, min, mid-1)
-    else:
-        return getKeyframeIndex(keyframe_points, frame, mid+1, max)
+    FCurves = [None] * 4
+    if material.animation_data is not None and material.animation_data.action is not None:
+        for FCurve in material.animation_data.action.fcurves:
+            if FCurve.data_path == 'diffuse_color' and FCurve.array_index < 4:
+                FCurves[FCurve.array_index] = FCurve
+    return FCurves
 
 
-def scaleColourValue(value: float) -> int:
-    value *= 256.0
-    if value >= 255.5:
-        return 255
-    elif value <= 0:
-        return 0
-    else:
-        return math.floor(value)
-
-
-def allFramesAreIntegers(keyframe_points: bpy.types.FCurveKeyframePoints) -> bool:
-    """
-    Returns whether all keyframe points in the given list have integer frames.
-    """
-    if keyframe_points:
-        i = 0
-        while i < len(keyframe_points) and keyframe_points[i].co[0].is_integer():
-            i += 1
-        return i == len(keyframe_points)
-
-    else:
-        return True
+# Matches the data path of an F-Curve animating a node input, capturing the
+# (escaped) name of the node and the index of the input.
+NODE_INPUT_DATA_PATH = re.compile(
+    r'nodes\["((?:[^"\\]|\\.)*)"\]\.inputs\[(\d+)\]\.default_value$')
 
 
-def getDataMaxima(data: list, fvt: int) -> (int, int):
+def groupMappingFCurves(material: bpy.types.Material) -> list:
     """
-    fvt is an integer in range(3) corresponding to the frame, value, tangent
-    in a tuple.
+    Returns a list of (node, F-Curves) for each animated Mapping node in the
+    material's node tree, sorted by node name. F-Curves contains the F-Curves
+    of the scale X, scale Y, rotation, translation X and translation Y of an
+    SRT0 texture entry (None if missing). See SRT0_MAPPING_INPUTS.
     """
-    if type(data[0]) == tuple:
+    node_tree = material.node_tree
+    if (node_tree is None or node_tree.animation_data is None
+            or node_tree.animation_data.action is None):
+        return []
 
-        if fvt not in range(3):
-            raise ValueError("fvt not in range(3)")
+    nodes = {}
+    for FCurve in node_tree.animation_data.action.fcurves:
+        match = NODE_INPUT_DATA_PATH.match(FCurve.data_path)
+        if match is None:
+            continue
 
-        minimum = data[0][fvt]
-        maximum = data[0][fvt]
+        name = re.sub(r'\\(.)', r'\1', match.group(1))
+        node = node_tree.nodes.get(name)
+        channel = (int(match.group(2)), FCurve.array_index)
 
-        for i in range(1, len(data)):
-            if data[i][fvt] > maximum:
-                maximum = data[i][fvt]
-            elif data[i][fvt] < minimum:
-                minimum = data[i][fvt]
+        if node is not None and node.type == 'MAPPING' and channel in SRT0_MAPPING_INPUTS:
+            FCurves = nodes.setdefault(name, (node, [None] * 5))[1]
+            FCurves[SRT0_MAPPING_INPUTS.index(channel)] = FCurve
 
-    else:
-        minimum = min(data)
-        maximum = max(data)
-
-    return minimum, maximum
-
-
-def getTangent(x1: float, y1: float, x2: float, y2: float) -> float:
-
-    if x2 - x1 == 0:
-        if y2 - y1 >= 0:
-            return VERTICAL_TANGENT_GRADIENT
-        else:
-            return -VERTICAL_TANGENT_GRADIENT
-    else:
-        return (y2 - y1) / (x2 - x1)
+    return [nodes[name] for name in sorted(nodes)]
 
 
-def to_bits(integer: int, length: int, signed=False) -> int:
+def encodeArmature(settings, obj, bone_names: list = None) -> (list, list, int):
     """
-    Overflow error raised if integer cannot be represented with 'length' bits.
-    Assumes length is a positive integer.
-    Returned integer is always positive.
+    Encodes every animated bone of the action of an armature object, or only
+    the bones named in bone_names. 'settings' is any object with the
+    attributes of the add-on's scene properties. Returns a list of (bone name,
+    (s, r, t)) for each bone encoded, a list of lines summarising the export
+    of each bone, and the number of bones that failed to encode.
     """
-    if signed:
-        edge = 2**(length - 1)
-        if integer in range(-edge, edge):
-            if integer < 0:
-                return (edge << 1) + integer
-            else:
-                return integer
-        else:
-            raise OverflowError("%s not in range(%s, %s)" % (integer, -edge, edge))
-    else:
-        if integer in range(0, 2**length):
-            return integer
-        else:
-            raise OverflowError("%s not in range(0, %s)" % (integer, 2**length))
+    return runToEnd(iterEncodeArmature(settings, obj, bone_names))
 
 
-def extractKeyframes(
-    index_start: int,
-    index_end: int,
-    keyframe_points: bpy.types.FCurveKeyframePoints,
-    frame_start: int,
-    frame_end: int
-) -> list:
+def iterEncodeArmature(settings, obj, bone_names: list = None):
     """
-    Converts keyframe points on the user-defined F-Curve interval to a list of
-    tuples. The number of keyframe points is not necessarily the number of
-    tuples in the returned list. Each tuple contains (frame, value, tangent).
-    keyframe_points: list of F-Curve keyframe points
-    index_start, index_end: mark subset of keyframe_points to analyse
-    frame_start, frame_end: first and last frame of user-defined interval
-    Features:
-    - A maximum of two tuples will have the same frame
-    - Frames are 0-indexed from frame_start
-    - Tangents are calculated using keyframe and keyframe handle coordinates
-    - Represents keyframe points with 'CONSTANT', 'LINEAR' and 'BEZIER'
-      interpolation.
-    - For keyframe_points that have 'CONSTANT' or 'LINEAR' interpolation and are
-      not on endpoints of the user-defined interval but are the first or last
-      keyframe point of the interval:
-          - a tuple will be added to represent a keyframe point with frame =
-            frame_start or frame_end and calculated values for value and tangent
-          - this is done in an effort to best represent the F-Curve displayed
-            to the user,
-          - this is not attempted for similar keyframe points with 'BEZIER'
-            interpolation
-    - "Easing Type" is represented
-    - A first or last keyframe point will be represented by two tuples if and
-      only if it is not on a boundary of the user-defined interval and it
-      has 'BEZIER' interpolation and the left and right handles are not
-      straight, which prevents adding redundant tuples
-    Notes:
-    - "Left Handle Type" and "Right Handle Type" are always ignored
-    - Vertical handles (handles with Frame = Keyframe), which are supported in,
-      Blender, and would otherwise produce undefined tangents, are represented
-      by tangents with a large, hardcoded value.
+    Generator version of encodeArmature, which yields (stage, done, total)
+    after reading each bone and while the bones are encoded.
     """
+    start = settings.start_frame
+    end = settings.end_frame
+
+    srt = ("Scale", "Rotation", "Translation")
+    axes = ("X", "Y", "Z")
+    enabled = (settings.scale, settings.rotation, settings.translation)
+    formats = (settings.scale_format,
+               settings.rotation_format,
+               settings.translation_format)
+
+    bones, unsupported_rotation = groupBoneFCurves(obj.animation_data.action)
+
+    # Export bones in the order of the armature, followed by any bones in the
+    # action that the armature does not have.
+    names = [bone.name for bone in obj.data.bones if bone.name in bones]
+    names += sorted(set(bones) - set(names))
+    if bone_names is not None:
+        names = [name for name in names if name in bone_names]
+
+    encoded = []
+    summary = []
+    failed = 0
+
+    # Take the keyframes of every bone out of Blender first, then encode the
+    # bones together. summary holds None in place of each bone to encode.
+    payloads = []
+    extracted = []
+    settings_payload = getSettingsPayload(settings)
+
+    for index, name in enumerate(names):
+        yield "Reading bones", index, len(names)
+        FCurves = bones[name]
+        keyframes = [[[], [], []], [[], [], []], [[], [], []]]
+        errors = []
 
-    keyframes = []
-
-    keyframe_start = keyframe_points[index_start]
-    if (keyframe_start.co[0] == frame_start or not index_start
-            or keyframe_points[index_start - 1].interpolation == 'BEZIER'):
-        keyframe_at_next = False
-
-    elif keyframe_points[index_start - 1].interpolation == 'LINEAR':
-        x1, y1 = keyframe_points[index_start - 1].co
-        x2, y2 = keyframe_points[index_start].co
-        tangent = getTangent(x1, y1, x2, y2)
-
-        # find the value of the curve at frame_start
-        value = keyframe_points[index_start - 1].co[1] + tangent*(frame_start - x1)
-
-        keyframes.append((0, value, tangent))
-        keyframes.append((x2 - frame_start, y1, tangent))
-
-        keyframe_at_next = True
-
-    else:
-        x1, y1 = keyframe_points[index_start - 1].co
-        keyframes.append((0, y1, 0))
-        keyframes.append((keyframe_points[index_start].co[0] - frame_start, y1, 0))
-        keyframe_at_next = True
-
-    for i in range(index_start, index_end+1):
-        frame_graph_editor = keyframe_points[i].co[0]
-        frame = frame_graph_editor - frame_start
-        value = keyframe_points[i].co[1]
-
-        interpolation = keyframe_points[i].interpolation
+        for i in range(3):
+            if enabled[i]:
+                for j in range(3):
+                    if FCurves[i][j] is not None:
+                        keyframes[i][j], error = getAxisKeyframes(
+                            FCurves[i][j],
+                            formats[i],
+                            start,
+                            end,
+                            "%s %s" % (srt[i], axes[j]))
 
-        # if linear, keyframe_at_next will be True,
-        # so adding a keyframe at frame_end is redundant
-        if interpolation == 'LINEAR' and frame_graph_editor != frame_end:
+                        if error:
+                            errors.append(error)
 
-            # if last keyframe on interval
-            if i == index_end:
+        if enabled[1] and name in unsupported_rotation and not any(FCurves[1]):
+            errors.append("Error: Rotation is not Euler rotation")
 
-                # if last keyframe in list
-                if i == len(keyframe_points) - 1:
+        if not errors and not any(any(axis) for axis in keyframes):
+            summary.append("%s: skipped, no enabled channels are animated" % name)
 
-                    # final keyframe is constant
-                    keyframes.append((frame, value, 0))
-                    keyframes.append((frame_end - frame_start, value, 0))
+        elif errors:
+            summary.append("%s: failed\n  %s" % (name, '\n  '.join(errors)))
+            failed += 1
 
-                # if last keyframe on interval, but not last on list
-                else:
-                    x1, y1 = keyframe_points[i].co
-                    x2, y2 = keyframe_points[i + 1].co
-                    tangent = getTangent(x1, y1, x2, y2)
-                    keyframes.append((frame, value, tangent))
+        else:
+            payloads.append((keyframes, formats, settings_payload))
+            extracted.append((name, len(summary)))
+            summary.append(None)
 
-                    # find the value of the curve at frame_end
-                    value = value + tangent*(frame_end - x1)
+    results = yield from trackProgress(
+        "Encoding bones", runEncodingTasks(settings, 'chr0', payloads),
+        len(payloads))
 
-                    keyframes.append((frame_end - frame_start, value, tangent))
+    for (name, line), (keyframes, formats, settings_payload), (
+            anim_data, report, error) in zip(extracted, payloads, results):
+        if error:
+            summary[line] = "%s: failed\n  %s" % (name, error)
+            failed += 1
+            continue
 
-            # if not last keyframe on interval
-            else:
-                # add two keyframes to create a linear segment of the curve
-                x1, y1 = keyframe_points[i].co
-                x2, y2 = keyframe_points[i + 1].co
-                tangent = getTangent(x1, y1, x2, y2)
-                keyframes.append((frame, value, tangent))
-                keyframes.append((x2 - frame_start, y2, tangent))
-                keyframe_at_next = True
+        encoded.append((name, anim_data))
 
-        # if linear, keyframe_at_next will be True,
-        # so adding a keyframe at frame_end is redundant
-        elif interpolation == 'CONSTANT' and frame_graph_editor != frame_end:
+        keyframe_counts = ', '.join(
+            "%s %s" % (srt[i], '/'.join(str(len(axis)) for axis in keyframes[i]))
+            for i in range(3) if any(keyframes[i]))
 
-            keyframes.append((frame, value, 0))
+        summary[line] = "%s: %s bytes, keyframes %s%s" % (
+            name,
+            get_chr_node_layout(*anim_data)[0],
+            keyframe_counts,
+            (", removed %s keyframes (%s bytes)" % (report['keys_removed'],
+                                                    report['bytes_saved'])
+             if report['keys_removed'] else "")
+        )
 
-            # if last keyframe on interval
-            if i == index_end:
+    return encoded, summary, failed
 
-                # doesn't matter if keyframe last in list in this case
-                keyframes.append((frame_end - frame_start, value, 0))
 
-            # if not last keyframe on interval
-            else:
-                x2 = keyframe_points[i + 1].co[0]
-                keyframes.append((x2 - frame_start, value, 0))
-                keyframe_at_next = True
+def encodeMaterials(settings, materials: list) -> (list, list, int):
+    """
+    Encodes the animation of the given materials as SRT0 or CLR0 material
+    entries, depending on settings.node_type. Returns a list of (material
+    name, textures or targets) for each material encoded, as expected by
+    get_srt0_file and get_clr0_file, a list of lines summarising the export
+    of each material, and the number of materials that failed to encode.
+    """
+    return runToEnd(iterEncodeMaterials(settings, materials))
 
-        elif interpolation == 'BEZIER':
 
-            x1, y1 = keyframe_points[i].handle_left
-            x2, y2 = keyframe_points[i].co
-            left_tangent = getTangent(x1, y1, x2, y2)
+def iterEncodeMaterials(settings, materials: list):
+    """
+    Generator version of encodeMaterials, which yields (stage, done, total)
+    after reading each material and while the texture entries are encoded.
+    """
+    start = settings.start_frame
+    end = settings.end_frame
+
+    srt = ("Scale X", "Scale Y", "Rotation", "Translation X", "Translation Y")
+    channels = ('red', 'green', 'blue', 'alpha')
+
+    entries = []
+    lines = []  # line of the summary reporting each entry
+    summary = []
+    failed = 0
+    report = {'keys_removed': 0, 'bytes_saved': 0}
+    settings_payload = getSettingsPayload(settings)
+
+    for index, material in enumerate(materials):
+        yield "Reading materials", index, len(materials)
+        errors = []
+
+        # Create CLR0 material entry from the viewport display colour
+        if settings.node_type == 'CLR0':
+            FCurves = getColourFCurves(material)
+            if not any(FCurves):
+                summary.append("%s: skipped, colour is not animated" % material.name)
+                continue
+
+            data_all = []
+            for rgba in range(4):
+                if FCurves[rgba] is None:
+                    data_all.append([material.diffuse_color[rgba]])
+
+                elif not allFramesAreIntegers(takeSnapshot(FCurves[rgba])):
+                    errors.append(("Error: F-Curve of %s channel has at least "
+                                   "one keyframe point that is not an integer")
+                                  % channels[rgba])
 
-            # if keyframe is at right boundary of interval
-            if frame_graph_editor == frame_end:
+                else:
+                    data = sampleFCurve(FCurves[rgba], start, end)
+                    if not data:
+                        errors.append("Error: F-Curve of %s channel is empty."
+                                      % channels[rgba])
+                    data_all.append(data)
 
-                if not keyframe_at_next:
-                    keyframes.append((frame, value, left_tangent))
+            if not errors:
+                entries.append((material.name, [
+                    (CLR0_TARGET_DIFFUSE, data_all, settings.mask)]))
 
+        # Create SRT0 material entry with a texture entry per Mapping node
+        else:
+            mappings = groupMappingFCurves(material)
+            if not mappings:
+                summary.append("%s: skipped, no Mapping node is animated" % material.name)
+                continue
+
+            textures = []
+            for index, (node, FCurves) in enumerate(mappings[:SRT0_MAX_TEXTURES]):
+                data_all = []
+                for i in range(5):
+                    if FCurves[i] is None:
+                        input_index, array_index = SRT0_MAPPING_INPUTS[i]
+                        data_all.append([node.inputs[input_index].default_value[array_index]])
+                    else:
+                        # SRT0 keyframes are stored like i12 keyframes
+                        data, error = getAxisKeyframes(
+                            FCurves[i], 'i12', start, end,
+                            "%s %s" % (node.name, srt[i]))
+                        data_all.append(data)
+                        if error:
+                            errors.append(error)
+
+                # texture entries are encoded once every material is read
+                if not errors:
+                    textures.append((index, node.name, (data_all, settings_payload)))
+
+            if len(mappings) > SRT0_MAX_TEXTURES:
+                errors.append("Error: More than %s Mapping nodes are animated"
+                              % SRT0_MAX_TEXTURES)
+
+            if not errors:
+                entries.append((material.name, textures))
+
+        if errors:
+            summary.append("%s: failed\n  %s" % (material.name, '\n  '.join(errors)))
+            failed += 1
+        else:
+            lines.append(len(summary))
+            summary.append("%s: exported" % material.name)
+
+    if settings.node_type == 'SRT0':
+        payloads = [payload for name, textures in entries
+                    for index, node_name, payload in textures]
+        results = iter((yield from trackProgress(
+            "Encoding textures", runEncodingTasks(settings, 'srt0', payloads),
+            len(payloads))))
+
+        # A material with a texture entry that cannot be encoded is reported
+        # as failed in place of its "exported" line, and left out of the file
+        encoded = []
+        for (name, textures), line in zip(entries, lines):
+            errors = []
+            for t, (index, node_name, payload) in enumerate(textures):
+                node, node_report, error = next(results)
+                textures[t] = (index, node)
+                for key in report:
+                    report[key] += node_report[key]
+                if error:
+                    errors.append("%s (Mapping node %s)" % (error, node_name))
+
+            if errors:
+                summary[line] = "%s: failed\n  %s" % (name, '\n  '.join(errors))
+                failed += 1
             else:
-                x3, y3 = keyframe_points[i].handle_right
-                right_tangent = getTangent(x2, y2, x3, y3)
+                encoded.append((name, textures))
+        entries = encoded
 
-                # add keyframe for left tangent if different to right tangent
-                if not keyframe_at_next and frame and abs(right_tangent - left_tangent) > DISTINCT_TANGENTS_THRESHOLD:
-                    keyframes.append((frame, value, left_tangent))
+    if report['keys_removed']:
+        summary.append("Removed %s keyframes (%s bytes)" % (
+            report['keys_removed'], report['bytes_saved']))
 
-                keyframes.append((frame, value, right_tangent))
+    return entries, summary, failed
 
-                # if not last keyframe on interval and next keyframe not Bezier
-                if i < index_end and keyframe_points[i + 1].interpolation != 'BEZIER':
 
-                    x1, y1 = keyframe_points[i + 1].handle_left
-                    x2, y2 = keyframe_points[i + 1].co
-                    next_left_tangent = getTangent(x1, y1, x2, y2)
-                    keyframes.append((x2 - frame_start, y2, next_left_tangent))
-                    keyframe_at_next = True
-
-                else:
-                    keyframe_at_next = False
-
-    return keyframes
+def getMaterialFile(settings, entries: list) -> bytearray:
+    """
+    Returns the complete SRT0 or CLR0 file, depending on settings.node_type,
+    containing the material entries returned by encodeMaterials.
+    """
+    count = settings.end_frame - settings.start_frame + 1
+    if settings.node_type == 'CLR0':
+        return get_clr0_file(settings.node_name, entries, count, settings.loop)
+    else:
+        return get_srt0_file(settings.node_name, entries, count, settings.loop)
@@ -0,0 +1,320 @@
+#  ***** GPL LICENSE BLOCK *****
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#  ***** GPL LICENSE BLOCK *****
+
+# <pep8 compliant>
+
+from array import array
+import bisect
+
+# This module must not import bpy, so that keyframes can be analysed outside of
+# Blender. When it is not loaded as part of the add-on package, fall back to
+# importing its siblings from the same directory.
+try:
+    from .bae_globals import *
+except ImportError:
+    from bae_globals import *
+
+
+class KeyframeSnapshot():
+    """
+    The keyframe points of an F-Curve, copied into flat arrays. Reading every
+    property of a keyframe point through the Python API is slow, so
+    fromKeyframePoints copies each property for all keyframe points with a
+    single foreach_get call. Interpolation is stored as the index of its
+    enum item in INTERPOLATION_TYPES (see INTERPOLATION_CONSTANT etc.), or -1
+    for the interpolation types that are not exported.
+    """
+
+    __slots__ = ('frames', 'values', 'left_x', 'left_y', 'right_x', 'right_y',
+                 'interpolation')
+
+    def __init__(self, frames=(), values=(), left_x=(), left_y=(), right_x=(),
+                 right_y=(), interpolation=()):
+        self.frames = frames
+        self.values = values
+        self.left_x = left_x
+        self.left_y = left_y
+        self.right_x = right_x
+        self.right_y = right_y
+        self.interpolation = interpolation
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    @classmethod
+    def fromKeyframePoints(cls, keyframe_points):
+        """
+        Copies the co, handle_left, handle_right and interpolation
+        properties of all keyframe points in a bpy FCurveKeyframePoints
+        collection.
+        """
+        size = len(keyframe_points)
+
+        coordinates = []
+        for name in ('co', 'handle_left', 'handle_right'):
+            # keyframe points store single precision floats
+            buffer = array('f', bytes(8 * size))
+            keyframe_points.foreach_get(name, buffer)
+            coordinates.append(buffer)
+
+        # foreach_get does not support enum properties, so the interpolation
+        # of each keyframe point is read on purpose, as its identifier
+        indexes = {name: i for i, name in enumerate(INTERPOLATION_TYPES)}
+        interpolation = [indexes.get(keyframe_point.interpolation, -1)
+                         for keyframe_point in keyframe_points]
+
+        co, handle_left, handle_right = coordinates
+
+        return cls(co[0::2], co[1::2],
+                   handle_left[0::2], handle_left[1::2],
+                   handle_right[0::2], handle_right[1::2],
+                   interpolation)
+
+
+def takeSnapshot(FCurve) -> KeyframeSnapshot:
+    """
+    Returns a KeyframeSnapshot of the keyframe points of the given F-Curve, or
+    None if the F-Curve is None.
+    """
+    if FCurve is None:
+        return None
+    else:
+        return KeyframeSnapshot.fromKeyframePoints(FCurve.keyframe_points)
+
+
+def analyseKeyframeList(snapshot: KeyframeSnapshot, user_left: int,
+                        user_right: int) -> (int, int, int):
+    """
+    Analyses the keyframe points in the given snapshot. Finds and returns the
+    index of the leftmost and rightmost keyframes on the given interval, and
+    the number of keyframes on it. The tuple (0, 0, 0) is returned if the
+    snapshot is None, empty, or if there are no keyframes on the given
+    interval. The tuple (#, #, 1) is returned if and only if there is exactly
+    one keyframe on the given interval.
+    """
+
+    if snapshot is None or not len(snapshot):
+        return 0, 0, 0
+
+    else:
+        new_left_index = bisect.bisect_left(snapshot.frames, user_left)
+        new_right_index = bisect.bisect_right(snapshot.frames, user_right) - 1
+
+        if new_right_index < new_left_index:
+            # Indicates no keyframes in range
+            return 0, 0, 0  # Evaluates as False
+
+        elif new_left_index == new_right_index:
+            # Indicates exactly one keyframe in range. Returns index of single keyframe.
+            return new_left_index, new_left_index, 1  # Evaluates as False
+
+        else:
+            # Indicates at least two keyframes in range.
+            # Returns index of single keyframe.
+            return new_left_index, new_right_index, new_right_index-new_left_index + 1
+
+
+def allFramesAreIntegers(snapshot: KeyframeSnapshot) -> bool:
+    """
+    Returns whether all keyframe points in the given snapshot have integer
+    frames.
+    """
+    if snapshot is None:
+        return True
+
+    return all(frame.is_integer() for frame in snapshot.frames)
+
+
+def getTangent(x1: float, y1: float, x2: float, y2: float) -> float:
+
+    if x2 - x1 == 0:
+        if y2 - y1 >= 0:
+            return VERTICAL_TANGENT_GRADIENT
+        else:
+            return -VERTICAL_TANGENT_GRADIENT
+    else:
+        return (y2 - y1) / (x2 - x1)
+
+
+def extractKeyframes(
+    index_start: int,
+    index_end: int,
+    snapshot: KeyframeSnapshot,
+    frame_start: int,
+    frame_end: int
+) -> list:
+    """
+    Converts keyframe points on the user-defined F-Curve interval to a list of
+    tuples. The number of keyframe points is not necessarily the number of
+    tuples in the returned list. Each tuple contains (frame, value, tangent).
+    snapshot: keyframe points of an F-Curve
+    index_start, index_end: mark subset of keyframe points to analyse
+    frame_start, frame_end: first and last frame of user-defined interval
+    Features:
+    - A maximum of two tuples will have the same frame
+    - Frames are 0-indexed from frame_start
+    - Tangents are calculated using keyframe and keyframe handle coordinates
+    - Represents keyframe points with 'CONSTANT', 'LINEAR' and 'BEZIER'
+      interpolation.
+    - For keyframe points that have 'CONSTANT' or 'LINEAR' interpolation and are
+      not on endpoints of the user-defined interval but are the first or last
+      keyframe point of the interval:
+          - a tuple will be added to represent a keyframe point with frame =
+            frame_start or frame_end and calculated values for value and tangent
+          - this is done in an effort to best represent the F-Curve displayed
+            to the user,
+          - this is not attempted for similar keyframe points with 'BEZIER'
+            interpolation
+    - "Easing Type" is represented
+    - A first or last keyframe point will be represented by two tuples if and
+      only if it is not on a boundary of the user-defined interval and it
+      has 'BEZIER' interpolation and the left and right handles are not
+      straight, which prevents adding redundant tuples
+    Notes:
+    - "Left Handle Type" and "Right Handle Type" are always ignored
+    - Vertical handles (handles with Frame = Keyframe), which are supported in,
+      Blender, and would otherwise produce undefined tangents, are represented
+      by tangents with a large, hardcoded value.
+    """
+
+    keyframes = []
+
+    frames = snapshot.frames
+    values = snapshot.values
+    left_x, left_y = snapshot.left_x, snapshot.left_y
+    right_x, right_y = snapshot.right_x, snapshot.right_y
+    interpolations = snapshot.interpolation
+
+    if (frames[index_start] == frame_start or not index_start
+            or interpolations[index_start - 1] == INTERPOLATION_BEZIER):
+        keyframe_at_next = False
+
+    elif interpolations[index_start - 1] == INTERPOLATION_LINEAR:
+        x1, y1 = frames[index_start - 1], values[index_start - 1]
+        x2, y2 = frames[index_start], values[index_start]
+        tangent = getTangent(x1, y1, x2, y2)
+
+        # find the value of the curve at frame_start
+        value = values[index_start - 1] + tangent*(frame_start - x1)
+
+        keyframes.append((0, value, tangent))
+        keyframes.append((x2 - frame_start, y1, tangent))
+
+        keyframe_at_next = True
+
+    else:
+        x1, y1 = frames[index_start - 1], values[index_start - 1]
+        keyframes.append((0, y1, 0))
+        keyframes.append((frames[index_start] - frame_start, y1, 0))
+        keyframe_at_next = True
+
+    for i in range(index_start, index_end+1):
+        frame_graph_editor = frames[i]
+        frame = frame_graph_editor - frame_start
+        value = values[i]
+
+        interpolation = interpolations[i]
+
+        # if linear, keyframe_at_next will be True,
+        # so adding a keyframe at frame_end is redundant
+        if interpolation == INTERPOLATION_LINEAR and frame_graph_editor != frame_end:
+
+            # if last keyframe on interval
+            if i == index_end:
+
+                # if last keyframe in list
+                if i == len(snapshot) - 1:
+
+                    # final keyframe is constant
+                    keyframes.append((frame, value, 0))
+                    keyframes.append((frame_end - frame_start, value, 0))
+
+                # if last keyframe on interval, but not last on list
+                else:
+                    x1, y1 = frames[i], values[i]
+                    x2, y2 = frames[i + 1], values[i + 1]
+                    tangent = getTangent(x1, y1, x2, y2)
+                    keyframes.append((frame, value, tangent))
+
+                    # find the value of the curve at frame_end
+                    value = value + tangent*(frame_end - x1)
+
+                    keyframes.append((frame_end - frame_start, value, tangent))
+
+            # if not last keyframe on interval
+            else:
+                # add two keyframes to create a linear segment of the curve
+                x1, y1 = frames[i], values[i]
+                x2, y2 = frames[i + 1], values[i + 1]
+                tangent = getTangent(x1, y1, x2, y2)
+                keyframes.append((frame, value, tangent))
+                keyframes.append((x2 - frame_start, y2, tangent))
+                keyframe_at_next = True
+
+        # if linear, keyframe_at_next will be True,
+        # so adding a keyframe at frame_end is redundant
+        elif interpolation == INTERPOLATION_CONSTANT and frame_graph_editor != frame_end:
+
+            keyframes.append((frame, value, 0))
+
+            # if last keyframe on interval
+            if i == index_end:
+
+                # doesn't matter if keyframe last in list in this case
+                keyframes.append((frame_end - frame_start, value, 0))
+
+            # if not last keyframe on interval
+            else:
+                x2 = frames[i + 1]
+                keyframes.append((x2 - frame_start, value, 0))
+                keyframe_at_next = True
+
+        elif interpolation == INTERPOLATION_BEZIER:
+
+            x1, y1 = left_x[i], left_y[i]
+            x2, y2 = frames[i], values[i]
+            left_tangent = getTangent(x1, y1, x2, y2)
+
+            # if keyframe is at right boundary of interval
+            if frame_graph_editor == frame_end:
+
+                if not keyframe_at_next:
+                    keyframes.append((frame, value, left_tangent))
+
+            else:
+                x3, y3 = right_x[i], right_y[i]
+                right_tangent = getTangent(x2, y2, x3, y3)
+
+                # add keyframe for left tangent if different to right tangent
+                if not keyframe_at_next and frame and abs(right_tangent - left_tangent) > DISTINCT_TANGENTS_THRESHOLD:
+                    keyframes.append((frame, value, left_tangent))
+
+                keyframes.append((frame, value, right_tangent))
+
+                # if not last keyframe on interval and next keyframe not Bezier
+                if i < index_end and interpolations[i + 1] != INTERPOLATION_BEZIER:
+
+                    x1, y1 = left_x[i + 1], left_y[i + 1]
+                    x2, y2 = frames[i + 1], values[i + 1]
+                    next_left_tangent = getTangent(x1, y1, x2, y2)
+                    keyframes.append((x2 - frame_start, y2, next_left_tangent))
+                    keyframe_at_next = True
+
+                else:
+                    keyframe_at_next = False
+
+    return keyframes
@@ -52,6 +52,50 @@ class BrresAnimationExporterProperties(bpy.types.PropertyGroup):
         default="MyAnimationNode"
     )
 
+    loop: BoolProperty(
+        name="Loop",
+        description="Mark complete animation files as looping",
+        default=False
+    )
+
+    inject_brres: BoolProperty(
+        name="Write Into BRRES File",
+        description=("Write complete animation files into an existing BRRES "
+                     "file, replacing the animation with the same name, instead "
+                     "of next to the blend file"),
+        default=False
+    )
+
+    brres_path: StringProperty(
+        name="BRRES File",
+        description="BRRES file to write complete animation files into",
+        default="",
+        subtype='FILE_PATH'
+    )
+
+    encode_workers: IntProperty(
+        name="Worker Processes",
+        description=("Number of processes encoding nodes at the same time when "
+                     "exporting all bones or materials. 0 uses one per core"),
+        default=0,
+        min=0
+    )
+
+    use_export_cache: BoolProperty(
+        name="Export Cache",
+        description=("Reuse bones and texture entries encoded by earlier "
+                     "exports with the same keyframes and settings, stored in "
+                     "Blender's user data files folder"),
+        default=False
+    )
+
+    reuse_identical_files: BoolProperty(
+        name="Reuse Identical Files",
+        description=("Do not write a new numbered file if a file exported "
+                     "earlier under the same name has the same contents"),
+        default=False
+    )
+
     # CHR0 node settings
     i4 = ("i4", "Interpolated 4", "4 bytes per key frame, tangents stored as integers, select if unsure")
     i6 = ("i6", "Interpolated 6", "6 bytes per key frame, tangents stored as integers")
@@ -61,6 +105,14 @@ class BrresAnimationExporterProperties(bpy.types.PropertyGroup):
 
     advanced: BoolProperty(name="Show Advanced Options", default=False)
 
+    chr0_file: BoolProperty(
+        name="Single CHR0 File",
+        description=("Write every bone exported with 'Export All Bones' to one "
+                     "complete CHR0 file named after the node, instead of one "
+                     "node per bone"),
+        default=True
+    )
+
     scale: BoolProperty(name="Include Scale Data")
     scale_format: EnumProperty(
         name="Scale Data Format",
@@ -116,6 +168,41 @@ class BrresAnimationExporterProperties(bpy.types.PropertyGroup):
         description="Keep True unless F-Curves animate a bone"
     )
 
+    error_bounded_format: BoolProperty(
+        name="Error-Bounded Format",
+        default=False,
+        description=("Ignore the chosen interpolated formats and use the "
+                     "smallest format that keeps each curve within the "
+                     "tolerance")
+    )
+
+    format_tolerance: FloatProperty(
+        name="Tolerance",
+        description=("Largest difference allowed between the exported and the "
+                     "original curve, in exported units (degrees for rotation, "
+                     "scaled units for translation)"),
+        default=0.01,
+        min=0.0,
+        precision=4
+    )
+
+    # CHR0 and SRT0 node settings
+    reduce_keyframes: BoolProperty(
+        name="Reduce Keyframes",
+        default=False,
+        description=("Remove keyframes that can be left out without the curve "
+                     "changing by more than the tolerance")
+    )
+
+    reduction_tolerance: FloatProperty(
+        name="Tolerance",
+        description=("Largest change allowed in the curve when removing "
+                     "keyframes, in F-Curve units"),
+        default=0.001,
+        min=0.0,
+        precision=4
+    )
+
     # CLR0 node settings
     red_source: EnumProperty(
         name="Red Channel",
@@ -18,9 +18,52 @@
 # <pep8 compliant>
 
 import bpy
-import struct
+import os
+import time
+import traceback
 from .bae_helpers import *
 from .bae_globals import *
+from .bae_panels import invalidatePanelState
+
+
+def saveFile(settings, file_data: bytes) -> str:
+    """
+    Saves a complete CHR0, SRT0 or CLR0 file, either next to the blend file or,
+    if enabled in the settings, into the BRRES file chosen by the user. Returns
+    a line for the export summary. Raises OSError or ValueError if the BRRES
+    file cannot be patched.
+    """
+    magic = bytes(file_data[:4]).decode('ascii')
+
+    if settings.inject_brres:
+        path = bpy.path.abspath(settings.brres_path)
+        with BrresPatcher(path) as patcher:
+            in_place = patcher.replaceSubfile(file_data)
+        return "%s file (%s bytes) %s %s" % (
+            magic, len(file_data),
+            "written over the old one in" if in_place else "appended to", path)
+
+    filename = writeExportFile(settings, getFilename(settings=settings),
+                               file_data, '.' + magic.lower())
+    return "%s file (%s bytes): %s" % (magic, len(file_data), filename)
+
+
+def startExportTrace() -> str:
+    """
+    Starts tracing an export if a trace file is set (see bae_trace.getTraceFile)
+    and returns its absolute path, or None.
+    """
+    path = getTraceFile()
+    if path:
+        path = bpy.path.abspath(path)
+        startTracing()
+    return path
+
+
+def stopExportTrace(path: str):
+    if path and isTracing():
+        stopTracing(path)
+        print("Export trace saved to %s" % path)
 
 
 class BRRESANIMATIONEXPORTER_OT_All(bpy.types.Operator):
@@ -30,11 +73,19 @@ class BRRESANIMATIONEXPORTER_OT_All(bpy.types.Operator):
     bl_options = {'REGISTER', 'UNDO'}
 
     def execute(self, context):
+        trace_file = startExportTrace()
+        try:
+            return self.export(context)
+        finally:
+            stopExportTrace(trace_file)
+
+    def export(self, context):
         settings = context.scene.brres_animation_exporter_properties
         FCurves = bpy.context.selected_editable_fcurves
         i_fcurve = -1
         hints = []
         errors = []
+        report = {'keys_removed': 0, 'bytes_saved': 0}
         start = settings.start_frame
         end = settings.end_frame
         count = end - start + 1
@@ -63,7 +114,10 @@ class BRRESANIMATIONEXPORTER_OT_All(bpy.types.Operator):
             srt = ("Scale", "Rotation", "Translation")
             axes = ("X", "Y", "Z")
 
-            anim_data_list = [ChrAnimData(), ChrAnimData(), ChrAnimData()]
+            keyframes = [[[], [], []], [[], [], []], [[], [], []]]
+            formats = (settings.scale_format,
+                       settings.rotation_format,
+                       settings.translation_format)
 
             # increment through srt
             for i in range(3):
@@ -77,83 +131,28 @@ class BRRESANIMATIONEXPORTER_OT_All(bpy.types.Operator):
                         # if user enabled axis
                         if panel_options[i * 5 + j + 2]:
                             i_fcurve += 1
-                            format = panel_options[i * 5 + 1]
 
-                            if not allFramesAreIntegers(FCurves[i_fcurve].keyframe_points):
-                                errors.append(("Error: At least one keyframe "
-                                               "point in the F-Curve used for %s %s is not an "
-                                               "integer") % (srt[i], axes[j]))
-                                break
-
-                            keyframe_info = analyseKeyframeList(
+                            keyframes[i][j], error = getAxisKeyframes(
                                 FCurves[i_fcurve],
+                                formats[i],
                                 start,
                                 end,
-                                format in CHR0_LINEAR_FORMATS)
-
-                            if PRINT_TO_CONSOLE:
-                                print(("F-Curve at index %s:\n"
-                                       " - Index of left keyframe point: %s\n"
-                                       " - Index of right keyframe point: %s\n"
-                                       " - Number of keyframe points on interval: "
-                                       "%s\n") % (i_fcurve, *keyframe_info))
-
-                            if not keyframe_info[2]:
-                                errors.append((
-                                    "Error: F-Curve used for %s %s is None or "
-                                    "contains 0 keyframes within the specified "
-                                    "interval.") % (srt[i], axes[j]))
+                                "%s %s" % (srt[i], axes[j]))
 
-                            # if F-Curve has 1 keyframe point
-                            elif keyframe_info[2] == 1:
-                                value = FCurves[i_fcurve].keyframe_points[keyframe_info[0]].co[1]
-                                anim_data_list[i].updateData(j, [value])
-
-                            else:
-                                anim_data_list[i].updateFormat(format)
-
-                                if format in CHR0_LINEAR_FORMATS:
-                                    keyframes = []
-                                    for i_keyframe in range(keyframe_info[0], keyframe_info[1]+1):
-                                        keyframes.append(
-                                            FCurves[i_fcurve].keyframe_points[i_keyframe].co[1])
-                                    anim_data_list[i].updateData(j, keyframes)
-
-                                # get list of tuples for i4, i6, i12 formats
-                                else:
-                                    keyframes = extractKeyframes(
-                                        keyframe_info[0],
-                                        keyframe_info[1],
-                                        FCurves[i_fcurve].keyframe_points,
-                                        start,
-                                        end)
-
-                                    anim_data_list[i].updateData(j, keyframes)
-
-                    anim_data_list[i].updateFlags()
-
-                    if PRINT_TO_CONSOLE:
-                        print("\n%s data (before format):\n%s" % (srt[i], anim_data_list[i]))
-
-                    anim_data_list[i].formatData(i)
-
-                    if PRINT_TO_CONSOLE:
-                        print("\n%s data (after format):\n%s" % (srt[i], anim_data_list[i]))
+                            if error:
+                                errors.append(error)
 
             if errors:
 
                 self.report({'ERROR'}, '\n'.join(errors))
 
             else:
-                node = combineSRT(*anim_data_list)
-
-                # add bone name to node
-                bone_name = settings.node_name  # get bone name
-                bone_name = remove_non_ascii(bone_name)
-                node += len(bone_name).to_bytes(4, 'big')
-                node[:4] = len(node).to_bytes(4, 'big')
-                node += bone_name.encode('ascii')
-                node += bytearray((4 - len(node) % 4) % 4)
+                try:
+                    node = get_chr_node(keyframes, formats, settings,
+                                        settings.node_name, report)
+                except OverflowError as error:
+                    errors.append("Error: %s" % error)
+                    self.report({'ERROR'}, '\n'.join(errors))
 
         # Create CLR0 node
         elif settings.node_type == 'CLR0':
@@ -178,61 +177,33 @@ class BRRESANIMATIONEXPORTER_OT_All(bpy.types.Operator):
                 if sources[rgba] == 'FCURVE':
                     i_fcurve += 1
 
-                    if not allFramesAreIntegers(FCurves[i_fcurve].keyframe_points):
+                    if not allFramesAreIntegers(takeSnapshot(FCurves[i_fcurve])):
                         errors.append(("Error: F-Curve selected for %s channel "
                                        "has at least one keyframe point that is not an integer"
                                        ) % channels[rgba])
                         break
 
-                    keyframe_info = analyseKeyframeList(
-                        FCurves[i_fcurve],
-                        start,
-                        end,
-                        True)
+                    data = sampleFCurve(FCurves[i_fcurve], start, end)
 
-                    if not keyframe_info[2]:
+                    if not data:
                         data_all.append(0)
                         errors.append(("Error: F-Curve selected for %s channel"
                                        " is None or empty.") % channels[rgba])
 
-                    elif keyframe_info[2] == 1:
-                        data_all.append([FCurves[i_fcurve].keyframe_points[0].co[1]])
-                        hints.append(("Hint: F-Curve selected for %s channel is"
-                                      " constant.") % channels[rgba])
-
                     else:
-                        data = []
-                        for i_keyframe in range(keyframe_info[0], keyframe_info[1] + 1):
-                            data.append(scaleColourValue(
-                                FCurves[i_fcurve].keyframe_points[i_keyframe].co[1]))
+                        if len(data) == 1:
+                            hints.append(("Hint: F-Curve selected for %s channel is"
+                                          " constant.") % channels[rgba])
 
                         data_all.append(data)
                 else:
-                    data_all.append([scaleColourValue(constants[rgba])])
+                    data_all.append([constants[rgba]])
 
             if errors:
                 self.report({'ERROR'}, '\n'.join(errors))
 
             else:
-                node = bytearray(12 + count * 4)
-
-                # mask, unknown, count
-                node[:12] = struct.pack('>BBBBII',
-                                        *(scaleColourValue(settings.mask[i]) for i in range(4)),
-                                        0x08,
-                                        count
-                                        )
-
-                # colours
-                for rgba in range(4):
-                    if len(data_all[rgba]) == 1:
-                        constant = bytearray(data_all[rgba])
-                        for row in range(12, 12 + count * 4, 4):
-                            node[row + rgba] = constant[0]
-                    else:
-                        rgba_data = bytearray(data_all[rgba])
-                        for i in range(count):
-                            node[12 + 4 * i + rgba] = rgba_data[i]
+                node = get_clr_node(data_all, settings.mask, count)
 
         # Create SRT0 node
         else:
@@ -256,55 +227,35 @@ class BRRESANIMATIONEXPORTER_OT_All(bpy.types.Operator):
                 if sources[i]:
                     i_fcurve += 1
 
-                    if not allFramesAreIntegers(FCurves[i_fcurve].keyframe_points):
-                        errors.append((
-                            "Error: At least one keyframe point in the F-Curve used"
-                            " for %s is not an integer") % names[i])
-                        break
-
-                    keyframe_info = analyseKeyframeList(
-                        FCurves[i_fcurve], start, end, False)
-
-                    if PRINT_TO_CONSOLE:
-                        print(("F-Curve at index %s:\n"
-                               " - Index of left keyframe point: %s\n"
-                               " - Index of right keyframe point: %s\n"
-                               " - Number of keyframe points on interval: "
-                               "%s\n") % (i_fcurve, *keyframe_info))
+                    # SRT0 keyframes are stored like i12 keyframes
+                    data, error = getAxisKeyframes(FCurves[i_fcurve], 'i12',
+                                                   start, end, names[i])
+                    data_all.append(data)
 
-                    if not keyframe_info[2]:
-                        errors.append(("Error: F-Curve used for %s is None or "
-                                       "contains 0 keyframes within the specified interval.")
-                                      % names[i])
-
-                    # if F-Curve has 1 keyframe point
-                    elif keyframe_info[2] == 1:
-                        data_all.append([FCurves[i_fcurve].keyframe_points[keyframe_info[0]].co[1]])
-
-                    else:
-                        data_all.append(extractKeyframes(
-                            keyframe_info[0],
-                            keyframe_info[1],
-                            FCurves[i_fcurve].keyframe_points,
-                            start,
-                            end))
+                    if error:
+                        errors.append(error)
 
                 else:
                     data_all.append([1 if i in range(2) else 0])
 
-            node = get_srt_node(data_all)
+            if errors:
+                self.report({'ERROR'}, '\n'.join(errors))
+
+            else:
+                node = get_srt_node(data_all, settings, report)
 
         # Write node to file
         if not errors:
-            filename = getUniqueFilename(getFilename(), include_tail=True)
-
-            with open(filename, 'wb') as file:
-                file.write(node)
+            filename = writeExportFile(settings, getFilename(), node)
+            invalidatePanelState()
 
             self.report({'INFO'},
-                        "Successfully exported %s node to %s%s" % (
+                        "Successfully exported %s node to %s%s%s" % (
                 settings.node_type,
                 filename,
+                (". Removed %s keyframes (%s bytes)" % (report['keys_removed'],
+                                                        report['bytes_saved'])
+                 if report['keys_removed'] else ""),
                 ". Check console for hints" if hints else ""
             )
             )
@@ -313,3 +264,231 @@ class BRRESANIMATIONEXPORTER_OT_All(bpy.types.Operator):
             print("\nHints:\n%s" % ("\n".join(hints)))
 
         return {'FINISHED'}
+
+
+class SettingsSnapshot():
+    """
+    A copy of the add-on's scene properties, with the same attributes, taken
+    when an export starts. Modal exports read it rather than the scene, so
+    settings changed in the UI while the export runs do not apply to part of
+    it.
+    """
+
+    def __init__(self, settings):
+        for name in type(settings).__annotations__:
+            value = getattr(settings, name)
+            if not isinstance(value, (bool, int, float, str)):
+                # vector properties (the CLR0 mask) are views of the scene
+                value = tuple(value)
+            setattr(self, name, value)
+
+
+class ModalExport():
+    """
+    Base of operators that export in steps. Subclasses define
+    exportSteps(context, settings), a generator that yields (stage, done,
+    total) between steps and returns (report type, message). settings is a
+    SettingsSnapshot of the scene properties. When invoked from the UI, the
+    steps run from a timer, each timer event working for at most
+    MODAL_EXPORT_TIME_SLICE seconds, so Blender stays responsive. The progress
+    and an estimate of the time left are shown in the status bar, and Esc
+    cancels the export. An error raised by a step stops the export and is
+    reported. execute runs every step at once, as scripts expect.
+    """
+
+    def startSteps(self, context):
+        settings = SettingsSnapshot(context.scene.brres_animation_exporter_properties)
+        self._trace_file = startExportTrace()
+        return self.exportSteps(context, settings)
+
+    def fail(self, error: Exception) -> set:
+        traceback.print_exc()
+        self.report({'ERROR'}, "Error: Export failed: %s" % error)
+        return {'CANCELLED'}
+
+    def finish(self, result: tuple) -> set:
+        stopExportTrace(self._trace_file)
+        report_type, message = result
+        self.report(report_type, message)
+        return {'CANCELLED'} if 'ERROR' in report_type else {'FINISHED'}
+
+    def execute(self, context):
+        steps = self.startSteps(context)
+        try:
+            result = runToEnd(steps)
+        except BaseException:
+            stopExportTrace(self._trace_file)
+            raise
+        return self.finish(result)
+
+    def invoke(self, context, event):
+        # Run up to the first step while the context passed to invoke is
+        # valid. exportSteps must read all it needs from it before then.
+        self._steps = self.startSteps(context)
+        try:
+            next(self._steps)
+        except StopIteration as stop:
+            return self.finish(stop.value)
+        except Exception as error:
+            self._steps.close()
+            stopExportTrace(self._trace_file)
+            return self.fail(error)
+
+        self._stage = None
+        self._stage_started = time.monotonic()
+
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(MODAL_EXPORT_INTERVAL,
+                                         window=context.window)
+        wm.progress_begin(0, 1)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self.stop(context)
+            self.report({'WARNING'}, "Export cancelled")
+            return {'CANCELLED'}
+
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        deadline = time.monotonic() + MODAL_EXPORT_TIME_SLICE
+        try:
+            while True:
+                stage, done, total = next(self._steps)
+                if time.monotonic() >= deadline:
+                    break
+        except StopIteration as stop:
+            self.stop(context)
+            return self.finish(stop.value)
+        except ReferenceError as error:
+            # the data being exported was removed while the export ran
+            self.stop(context)
+            self.report({'ERROR'}, "Error: Export cancelled: %s" % error)
+            return {'CANCELLED'}
+        except Exception as error:
+            self.stop(context)
+            return self.fail(error)
+
+        now = time.monotonic()
+        if stage != self._stage:
+            self._stage = stage
+            self._stage_started = now
+
+        fraction = done / total if total else 1
+        text = "%s: %s/%s" % (stage, done, total)
+        if 0 < fraction < 1:
+            text += ", about %.0f s left" % (
+                (now - self._stage_started) * (1 - fraction) / fraction)
+
+        context.window_manager.progress_update(fraction)
+        context.workspace.status_text_set(text + " (Esc to cancel)")
+        return {'RUNNING_MODAL'}
+
+    def stop(self, context):
+        self._steps.close()
+        stopExportTrace(self._trace_file)
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+
+
+class BRRESANIMATIONEXPORTER_OT_Armature(ModalExport, bpy.types.Operator):
+    bl_idname = "brresanimationexporter.armature"
+    bl_description = ("Converts the action of the active armature to a CHR0 "
+                      "node for every animated bone")
+    bl_label = "Export All Bones"
+    bl_options = {'REGISTER'}
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.active_object
+        return (bpy.data.is_saved and obj is not None and obj.type == 'ARMATURE'
+                and obj.animation_data is not None
+                and obj.animation_data.action is not None)
+
+    def exportSteps(self, context, settings):
+        obj = context.active_object
+
+        if settings.end_frame < settings.start_frame:
+            return {'ERROR'}, "Error: Invalid range"
+
+        encoded, summary, failed = yield from iterEncodeArmature(settings, obj)
+
+        if encoded and settings.chr0_file:
+            yield "Writing", 0, 1
+            try:
+                file_data = get_chr0_file(settings.node_name, encoded,
+                                          settings.end_frame - settings.start_frame + 1,
+                                          settings.loop)
+                summary.append(saveFile(settings, file_data))
+            except (OSError, ValueError, OverflowError) as error:
+                summary.append("Error: %s" % error)
+                failed += len(encoded)
+                encoded = []
+
+        elif encoded:
+            # A bone that cannot be written is reported, and the other bones
+            # are still written
+            written = []
+            for index, (name, anim_data) in enumerate(encoded):
+                yield "Writing", index, len(encoded)
+                try:
+                    filename = writeExportFile(settings, getFilename(name, settings),
+                                               combineSRT(*anim_data, name))
+                except (OSError, OverflowError) as error:
+                    summary.append("%s: failed\n  Error: %s" % (name, error))
+                    failed += 1
+                    continue
+                written.append((name, anim_data))
+                summary.append("%s -> %s" % (name, os.path.basename(filename)))
+            encoded = written
+
+        invalidatePanelState()
+
+        print("\nCHR0 export of %s:\n%s" % (obj.name, '\n'.join(summary)))
+
+        return ({'WARNING'} if failed else {'INFO'},
+                "Exported %s bones, %s failed. Check console for summary" % (
+                    len(encoded), failed))
+
+
+class BRRESANIMATIONEXPORTER_OT_Materials(ModalExport, bpy.types.Operator):
+    bl_idname = "brresanimationexporter.materials"
+    bl_description = ("Converts the animation of every material of the selected "
+                      "objects to one SRT0 or CLR0 file")
+    bl_label = "Export All Materials"
+    bl_options = {'REGISTER'}
+
+    @classmethod
+    def poll(cls, context):
+        settings = context.scene.brres_animation_exporter_properties
+        return (bpy.data.is_saved and settings.node_type in ('SRT0', 'CLR0')
+                and bool(context.selected_objects))
+
+    def exportSteps(self, context, settings):
+        if settings.end_frame < settings.start_frame:
+            return {'ERROR'}, "Error: Invalid range"
+
+        materials = getMaterials(context.selected_objects)
+        entries, summary, failed = yield from iterEncodeMaterials(settings, materials)
+
+        if entries:
+            yield "Writing", 0, 1
+            try:
+                summary.append(saveFile(settings, getMaterialFile(settings, entries)))
+            except (OSError, ValueError) as error:
+                summary.append("Error: %s" % error)
+                failed += len(entries)
+                entries = []
+
+        invalidatePanelState()
+
+        print("\n%s export of selected materials:\n%s" % (settings.node_type,
+                                                          '\n'.join(summary)))
+
+        return ({'WARNING'} if failed else {'INFO'},
+                "Exported %s materials, %s failed. Check console for summary" % (
+                    len(entries), failed))
@@ -0,0 +1,122 @@
+#  ***** GPL LICENSE BLOCK *****
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#  ***** GPL LICENSE BLOCK *****
+
+# <pep8 compliant>
+
+import os
+
+
+class DirectoryNameIndex():
+    """
+    The names of the entries in a directory, used to find unused filenames
+    without probing the filesystem once per candidate. The index is built with
+    a single scan of the directory and rebuilt whenever the modification time
+    of the directory changes. Files written by the add-on are added with
+    addName, so writing them does not trigger a rebuild.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.__mtime = None
+        self.__names = set()
+        # Lowest suffix that may be free, by head. Suffixes below it are taken.
+        self.__next_suffix = {}
+
+    def __getMtime(self):
+        try:
+            return os.stat(self.directory).st_mtime_ns
+        except OSError:
+            return None
+
+    def refresh(self):
+        """
+        Rebuilds the index if the directory has changed since it was built.
+        """
+        mtime = self.__getMtime()
+        if mtime is not None and mtime == self.__mtime:
+            return
+        self.__mtime = mtime
+        self.__names = set()
+        self.__next_suffix = {}
+        if mtime is not None:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    self.__names.add(os.path.normcase(entry.name))
+
+    def contains(self, name: str) -> bool:
+        return os.path.normcase(name) in self.__names
+
+    def getUniqueName(self, head: str, extension: str = '') -> str:
+        """
+        Returns 'head' followed by 'extension' if no entry in the directory has
+        that name. Otherwise returns 'head(i)' followed by 'extension' for the
+        lowest positive integer i not in use.
+        """
+        self.refresh()
+        if not self.contains(head + extension):
+            return head + extension
+        i = self.__next_suffix.get((head, extension), 1)
+        while self.contains('%s(%s)%s' % (head, i, extension)):
+            i += 1
+        self.__next_suffix[(head, extension)] = i
+        return '%s(%s)%s' % (head, i, extension)
+
+    def addName(self, name: str):
+        """
+        Records that an entry named 'name' was created in the directory,
+        without scanning it again.
+        """
+        self.__names.add(os.path.normcase(name))
+        # Creating the entry changed the modification time of the directory,
+        # which would otherwise trigger a rebuild. An index not built yet is
+        # left to be built by the next refresh.
+        if self.__mtime is not None:
+            self.__mtime = self.__getMtime()
+
+
+_indices = {}
+
+
+def getDirectoryNameIndex(directory: str) -> DirectoryNameIndex:
+    key = os.path.normcase(os.path.abspath(directory))
+    index = _indices.get(key)
+    if index is None:
+        index = _indices[key] = DirectoryNameIndex(directory)
+    return index
+
+
+def writeUniqueFile(directory: str, head: str, extension: str,
+                    data: bytes) -> str:
+    """
+    Writes 'data' to a new file in 'directory', named as by getUniqueName of
+    the directory's index, and returns its path. The file is created
+    exclusively, so a file that appeared since the index was built (written
+    within the resolution of the directory's modification time, or by another
+    process) is never overwritten; the next free name is tried instead.
+    """
+    index = getDirectoryNameIndex(directory)
+    while True:
+        name = index.getUniqueName(head, extension)
+        path = os.path.join(directory, name)
+        try:
+            with open(path, 'xb') as file:
+                file.write(data)
+        except FileExistsError:
+            index.addName(name)
+            continue
+        index.addName(name)
+        return path
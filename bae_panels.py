@@ -18,11 +18,212 @@
 # <pep8 compliant>
 
 import bpy
+from bpy.app.handlers import persistent
+from .bae_globals import *
+from .bae_main import BrresAnimationExporterProperties
 from .bae_helpers import (
     getUniqueFilename,
-    getFilename,
-    scaleColourValue
+    getFilename
 )
+from .bae_encoder import scaleColourValue
+
+
+class PanelState():
+    """
+    Hints and validation results displayed by the panel. These depend on the
+    settings, the frame interval, the F-Curve selection and the files on disk,
+    and are reused across redraws until one of those changes.
+    """
+    __slots__ = ('key', 'frame_count', 'path', 'fps', 'fcurve_hint',
+                 'colour_hint', 'enable_button')
+
+    def __init__(self, context, key: tuple):
+        settings = context.scene.brres_animation_exporter_properties
+        self.key = key
+        self.enable_button = True
+
+        frame_diff = settings.end_frame - settings.start_frame
+        if frame_diff < 0:
+            self.frame_count = None
+            self.enable_button = False
+        else:
+            self.frame_count = frame_diff + 1
+
+        if bpy.data.is_saved:
+            self.path = getUniqueFilename(getFilename(settings=settings),
+                                          include_tail=True)
+        else:
+            self.path = None
+            self.enable_button = False
+
+        fps = context.scene.render.fps
+        self.fps = fps if fps != 60 else None
+
+        FCurves = context.selected_editable_fcurves
+        given_fcurves = len(FCurves) if FCurves else 0
+
+        if settings.node_type == 'CHR0':
+            required_fcurves = 0
+            for group in ('scale', 'rotation', 'translation'):
+                if getattr(settings, group):
+                    for axis in 'xyz':
+                        if getattr(settings, '%s_%s' % (group, axis)):
+                            required_fcurves += 1
+            none_hint = "Hint: Must make use of at least 1 F-Curve"
+
+        elif settings.node_type == 'CLR0':
+            required_fcurves = [settings.red_source, settings.green_source,
+                                settings.blue_source,
+                                settings.alpha_source].count('FCURVE')
+            none_hint = "Hint: All Channels Constant"
+
+        else:
+            required_fcurves = sum(1 for source in (
+                settings.srt_scale_x,
+                settings.srt_scale_y,
+                settings.srt_rotation,
+                settings.srt_translation_x,
+                settings.srt_translation_y) if source)
+            none_hint = "Hint: Must make use of at least 1 F-Curve"
+
+        if required_fcurves:
+            missing_fcurves = required_fcurves - given_fcurves
+            if missing_fcurves > 0:
+                self.fcurve_hint = (
+                    "Hint: Select, unhide, or unlock %s more F-Curve%s"
+                    % (missing_fcurves, ('s' if missing_fcurves > 1 else '')))
+            elif missing_fcurves < 0:
+                self.fcurve_hint = ("Hint: Deselect %s F-Curve%s"
+                                    % (-missing_fcurves,
+                                       ('s' if -missing_fcurves > 1 else '')))
+            else:
+                self.fcurve_hint = None
+        else:
+            self.fcurve_hint = none_hint
+
+        if self.fcurve_hint is not None:
+            self.enable_button = False
+
+        self.colour_hint = (settings.node_type == 'CLR0' and
+                            context.scene.view_settings.view_transform != 'Standard')
+
+
+_panel_state = None
+
+# Incremented by invalidatePanelState, so a panel state made before a change
+# reported by a msgbus subscription or an application handler is not reused.
+_panel_generation = 0
+
+
+def getPanelStateKey(context) -> tuple:
+    """
+    Returns the inputs of the panel state that are cheap to read on every
+    redraw: the scene, the active object, the name of its action and the
+    number of times the panel state has been invalidated. Changes to the
+    settings, the F-Curve selection and the blend file are not read here, but
+    reported by the msgbus subscriptions and handlers that invalidate the
+    panel state. Selecting F-Curves with an operator publishes no msgbus
+    notification, so such a change is displayed on the next invalidation.
+    """
+    scene = context.scene
+    obj = context.active_object
+    animation_data = obj.animation_data if obj is not None else None
+    action = animation_data.action if animation_data is not None else None
+
+    return (scene.as_pointer(),
+            obj.as_pointer() if obj is not None else None,
+            action.name if action is not None else None,
+            _panel_generation)
+
+
+def getPanelState(context) -> PanelState:
+    """
+    Returns the cached panel state, recomputing it if any input in its key
+    (see getPanelStateKey) has changed.
+    """
+    global _panel_state
+    key = getPanelStateKey(context)
+    state = _panel_state
+    if state is None or state.key != key:
+        state = _panel_state = PanelState(context, key)
+    return state
+
+
+def invalidatePanelState(*args):
+    """
+    Discards the cached panel state. Accepts and ignores any arguments so it
+    can be used directly as a msgbus callback or an application handler.
+    """
+    global _panel_state, _panel_generation
+    _panel_state = None
+    _panel_generation += 1
+
+
+# Owner of the msgbus subscriptions, used to clear them all at once.
+_msgbus_owner = object()
+
+
+def subscribePanelState():
+    """
+    Subscribes to changes of every property the panel state depends on.
+    """
+    bpy.msgbus.clear_by_owner(_msgbus_owner)
+    keys = [(BrresAnimationExporterProperties, name)
+            for name in BrresAnimationExporterProperties.__annotations__]
+    keys += [
+        (bpy.types.FCurve, "select"),
+        (bpy.types.FCurve, "hide"),
+        (bpy.types.FCurve, "lock"),
+        (bpy.types.RenderSettings, "fps"),
+        (bpy.types.ColorManagedViewSettings, "view_transform")
+    ]
+    for key in keys:
+        bpy.msgbus.subscribe_rna(key=key, owner=_msgbus_owner, args=(),
+                                 notify=invalidatePanelState)
+
+
+@persistent
+def onLoadPost(*args):
+    # Loading a file clears all msgbus subscriptions.
+    invalidatePanelState()
+    subscribePanelState()
+
+
+@persistent
+def onSavePost(*args):
+    invalidatePanelState()
+
+
+@persistent
+def onDepsgraphUpdatePost(scene, depsgraph=None):
+    # Playback and scrubbing update objects every frame; only updates to
+    # actions and scenes can change what the panel displays.
+    if depsgraph is None or any(
+            isinstance(update.id, (bpy.types.Action, bpy.types.Scene))
+            for update in depsgraph.updates):
+        invalidatePanelState()
+
+
+_handlers = (
+    (bpy.app.handlers.load_post, onLoadPost),
+    (bpy.app.handlers.save_post, onSavePost),
+    (bpy.app.handlers.depsgraph_update_post, onDepsgraphUpdatePost)
+)
+
+
+def registerPanelState():
+    subscribePanelState()
+    for handler_list, handler in _handlers:
+        if handler not in handler_list:
+            handler_list.append(handler)
+
+
+def unregisterPanelState():
+    invalidatePanelState()
+    bpy.msgbus.clear_by_owner(_msgbus_owner)
+    for handler_list, handler in _handlers:
+        if handler in handler_list:
+            handler_list.remove(handler)
 
 
 class BRRESANIMATIONEXPORTER_PT_All(bpy.types.Panel):
@@ -36,9 +237,7 @@ class BRRESANIMATIONEXPORTER_PT_All(bpy.types.Panel):
     def draw(self, context):
         layout = self.layout
         settings = context.scene.brres_animation_exporter_properties
-        enable_button = True
-        FCurves = bpy.context.selected_editable_fcurves
-        given_fcurves = len(FCurves) if FCurves else 0
+        state = getPanelState(context)
 
         layout.prop(settings, "node_type")
 
@@ -47,25 +246,22 @@ class BRRESANIMATIONEXPORTER_PT_All(bpy.types.Panel):
         box_meta.label(text="Timeline Interval to Export From")
         box_meta.prop(settings, "start_frame")
         box_meta.prop(settings, "end_frame")
-        frame_diff = settings.end_frame - settings.start_frame
-        if frame_diff < 0:
+        if state.frame_count is None:
             box_meta.label(text="Invalid range", icon='ERROR')
-            enable_button = False
         else:
-            box_meta.label(text="Number of Frames: %s" % (frame_diff + 1))
+            box_meta.label(text="Number of Frames: %s" % state.frame_count)
 
-        if bpy.data.is_saved:
+        if state.path is not None:
             box_meta.prop(settings, "node_name")
-            box_meta.label(text="Path: %s" % getUniqueFilename(getFilename(),
-                                                               include_tail=True))
+            box_meta.prop(settings, "reuse_identical_files")
+            box_meta.label(text="Path: %s" % state.path)
         else:
             box_meta.label(text="Save Blend Before Export", icon='ERROR')
-            enable_button = False
 
-        if bpy.context.scene.render.fps != 60:
+        if state.fps is not None:
             box_meta.label(text=("Hint: Frame Rate set to %s fps. Change to 60"
                                  " fps to match BRRES animation speed.")
-                           % bpy.context.scene.render.fps, icon='PLAY')
+                           % state.fps, icon='PLAY')
 
         # Draw CHR0 node settings
         if settings.node_type == 'CHR0':
@@ -107,44 +303,18 @@ class BRRESANIMATIONEXPORTER_PT_All(bpy.types.Panel):
                 box_xyz_to_xzy = box_chr0.box()
                 box_xyz_to_xzy.prop(settings, "xyz_to_xzy")
 
-            included_data_list = [
-                settings.scale,
-                settings.scale_x,
-                settings.scale_y,
-                settings.scale_z,
-                settings.rotation,
-                settings.rotation_x,
-                settings.rotation_y,
-                settings.rotation_z,
-                settings.translation,
-                settings.translation_x,
-                settings.translation_y,
-                settings.translation_z
-            ]
+                box_error_bounded = box_chr0.box()
+                box_error_bounded.prop(settings, "error_bounded_format")
+                if settings.error_bounded_format:
+                    box_error_bounded.prop(settings, "format_tolerance")
 
-            required_fcurves = 0
-            for i in range(3):
-                if included_data_list[i * 4]:
-                    for j in range(1, 4):
-                        if included_data_list[i * 4 + j]:
-                            required_fcurves += 1
+                box_reduce = box_chr0.box()
+                box_reduce.prop(settings, "reduce_keyframes")
+                if settings.reduce_keyframes:
+                    box_reduce.prop(settings, "reduction_tolerance")
 
-            if required_fcurves:
-                frame_diff = required_fcurves - given_fcurves
-                if frame_diff > 0:
-                    box_chr0.label(
-                        text="Hint: Select, unhide, or unlock %s more F-Curve%s"
-                        % (frame_diff, ('s' if frame_diff > 1 else '')),
-                        icon='ERROR')
-                    enable_button = False
-                elif frame_diff < 0:
-                    box_chr0.label(text="Hint: Deselect %s F-Curve%s" %
-                                   (-frame_diff, ('s' if -frame_diff > 1 else '')), icon='ERROR')
-                    enable_button = False
-            else:
-                box_chr0.label(text="Hint: Must make use of at least 1 F-Curve",
-                               icon='ERROR')
-                enable_button = False
+            if state.fcurve_hint is not None:
+                box_chr0.label(text=state.fcurve_hint, icon='ERROR')
 
         # Draw CLR0 node settings
         elif settings.node_type == 'CLR0':
@@ -181,33 +351,10 @@ class BRRESANIMATIONEXPORTER_PT_All(bpy.types.Panel):
 
             box_clr0.prop(settings, "mask")
 
-            sources = [
-                settings.red_source,
-                settings.green_source,
-                settings.blue_source,
-                settings.alpha_source
-            ]
-
-            required_fcurves = sources.count('FCURVE')
-
-            if required_fcurves:
-                missing_fcurves = required_fcurves - given_fcurves
-                if missing_fcurves > 0:
-                    box_clr0.label(
-                        text="Hint: Select, unhide, or unlock %s more F-Curve%s"
-                        % (missing_fcurves, ("s" if missing_fcurves > 1 else "")),
-                        icon='ERROR')
-                    enable_button = False
-                elif missing_fcurves < 0:
-                    box_clr0.label(text="Hint: Deselect %s F-Curve%s" %
-                                   (-missing_fcurves, ("s" if -missing_fcurves > 1 else "")),
-                                   icon='ERROR')
-                    enable_button = False
-            else:
-                box_clr0.label(text="Hint: All Channels Constant", icon='ERROR')
-                enable_button = False
+            if state.fcurve_hint is not None:
+                box_clr0.label(text=state.fcurve_hint, icon='ERROR')
 
-            if bpy.context.scene.view_settings.view_transform != 'Standard':
+            if state.colour_hint:
                 box_clr0.label(text=("Hint: Change 'View Transform' to 'Standard'"
                                      " to display colours more accurately."), icon='COLOR')
 
@@ -220,38 +367,45 @@ class BRRESANIMATIONEXPORTER_PT_All(bpy.types.Panel):
             box_srt0.prop(settings, "srt_translation_x")
             box_srt0.prop(settings, "srt_translation_y")
 
-            sources = [
-                settings.srt_scale_x,
-                settings.srt_scale_y,
-                settings.srt_rotation,
-                settings.srt_translation_x,
-                settings.srt_translation_y]
+            box_reduce = box_srt0.box()
+            box_reduce.prop(settings, "reduce_keyframes")
+            if settings.reduce_keyframes:
+                box_reduce.prop(settings, "reduction_tolerance")
 
-            required_fcurves = 0
-            for source in sources:
-                if source:
-                    required_fcurves += 1
-
-            if required_fcurves:
-                frame_diff = required_fcurves - given_fcurves
-                if frame_diff > 0:
-                    box_srt0.label(
-                        text="Hint: Select, unhide, or unlock %s more F-Curve%s"
-                        % (frame_diff, ("s" if frame_diff > 1 else "")),
-                        icon='ERROR')
-                    enable_button = False
-                elif frame_diff < 0:
-                    box_srt0.label(text="Hint: Deselect %s F-Curve%s" %
-                                   (-frame_diff, ("s" if -frame_diff > 1 else "")),
-                                   icon='ERROR')
-                    enable_button = False
-            else:
-                box_srt0.label(text="Hint: Must make use of at least 1 F-Curve",
-                               icon='ERROR')
-                enable_button = False
+            if state.fcurve_hint is not None:
+                box_srt0.label(text=state.fcurve_hint, icon='ERROR')
 
         # Draw export button (calls BRRESANIMATIONEXPORTER_OT_All operator)
         export_btn_row = layout.row()
         export_btn_row.operator("brresanimationexporter.all",
                                 text="Export as %s node" % settings.node_type)
-        export_btn_row.enabled = enable_button
+        export_btn_row.enabled = state.enable_button
+
+        # Draw batch export button (calls BRRESANIMATIONEXPORTER_OT_Armature
+        # operator), which ignores the F-Curve selection
+        if settings.node_type == 'CHR0':
+            box_batch = layout.box()
+            box_batch.prop(settings, "chr0_file")
+            if settings.chr0_file:
+                box_batch.prop(settings, "loop")
+                box_batch.prop(settings, "inject_brres")
+                if settings.inject_brres:
+                    box_batch.prop(settings, "brres_path")
+            box_batch.prop(settings, "encode_workers")
+            box_batch.prop(settings, "use_export_cache")
+            box_batch.operator("brresanimationexporter.armature",
+                               text="Export All Bones of Active Armature")
+
+        # Draw material batch export button (calls
+        # BRRESANIMATIONEXPORTER_OT_Materials operator)
+        else:
+            box_batch = layout.box()
+            box_batch.prop(settings, "loop")
+            box_batch.prop(settings, "inject_brres")
+            if settings.inject_brres:
+                box_batch.prop(settings, "brres_path")
+            if settings.node_type == 'SRT0':
+                box_batch.prop(settings, "encode_workers")
+                box_batch.prop(settings, "use_export_cache")
+            box_batch.operator("brresanimationexporter.materials",
+                               text="Export Materials of Selected Objects")
@@ -0,0 +1,215 @@
+#  ***** GPL LICENSE BLOCK *****
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#  ***** GPL LICENSE BLOCK *****
+
+# <pep8 compliant>
+
+import mmap
+import struct
+
+# This module must not import bpy, so that archives can be patched outside of
+# Blender. When it is not loaded as part of the add-on package, fall back to
+# importing its siblings from the same directory.
+try:
+    from .bae_globals import *
+    from .bae_brres import *
+except ImportError:
+    from bae_globals import *
+    from bae_brres import *
+
+
+class BrresPatcher():
+    """
+    Replaces animation sub-files of an existing BRRES file. The file is
+    memory-mapped, and only the dictionaries leading to the replaced data are
+    read. Raises a ValueError if an offset read from the file points outside
+    of it, as happens with corrupt files. New data is written over the old
+    data if it fits, otherwise it is appended to the file and the offsets
+    pointing to the old data are changed to point to it. The old data is left
+    in the file, unreferenced.
+    Use as a context manager, or call close when done.
+    """
+
+    def __init__(self, path: str):
+        self.__file = open(path, 'r+b')
+        try:
+            self.__map = mmap.mmap(self.__file.fileno(), 0)
+        except ValueError:
+            self.__file.close()
+            raise ValueError("'%s' is empty" % path)
+
+        if (len(self.__map) < 0x10 or self.__map[:4] != b'bres'
+                or self.__map[4:6] != b'\xfe\xff'):
+            self.close()
+            raise ValueError("'%s' is not a big-endian BRRES file" % path)
+
+        root_offset = self.__unpack('>H', 0x0C)
+        self.__root_group = root_offset + 8
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.__map is not None:
+            self.__map.flush()
+            self.__map.close()
+            self.__map = None
+        self.__file.close()
+
+    def __checkRange(self, offset: int, size: int):
+        if offset < 0 or offset + size > len(self.__map):
+            raise ValueError("The BRRES file is corrupt: %d bytes at offset %s "
+                             "are outside of the file" % (size, hex(offset)))
+
+    def __unpack(self, format: str, offset: int):
+        self.__checkRange(offset, struct.calcsize(format))
+        return struct.unpack_from(format, self.__map, offset)[0]
+
+    def __readName(self, offset: int) -> bytes:
+        length = self.__unpack('>I', offset - 4)
+        self.__checkRange(offset, length)
+        return self.__map[offset: offset + length]
+
+    def __findEntry(self, group_offset: int, name: bytes) -> int:
+        """
+        Returns the offset of the index group entry with the given name, or
+        None if there is no such entry.
+        """
+        def entry(index):
+            return group_offset + 8 + 16 * index
+
+        current = entry(0)
+        next_index = self.__unpack('>H', current + 4)
+        while self.__unpack('>H', current) > self.__unpack('>H', entry(next_index)):
+            current = entry(next_index)
+            id = self.__unpack('>H', current)
+            next_index = self.__unpack('>H', current + (6 if getBrresIdBit(name, id) else 4))
+
+        if next_index:
+            found = entry(next_index)
+            if self.__readName(group_offset + self.__unpack('>i', found + 8)) == name:
+                return found
+        return None
+
+    def __readEntries(self, group_offset: int) -> list:
+        """
+        Returns (name, absolute name offset, absolute data offset) for every
+        entry of the index group.
+        """
+        entries = []
+        for i in range(1, self.__unpack('>I', group_offset + 4) + 1):
+            name_offset = self.__unpack('>i', group_offset + 16 * i + 16)
+            data_offset = self.__unpack('>i', group_offset + 16 * i + 20)
+            entries.append((self.__readName(group_offset + name_offset),
+                            group_offset + name_offset,
+                            group_offset + data_offset))
+        return entries
+
+    def __append(self, data: bytes) -> int:
+        """
+        Appends data to the file, aligned to BRRES_ALIGNMENT bytes, and
+        updates the size of the file. Returns the offset of the data.
+        """
+        size = len(self.__map)
+        offset = align(size, BRRES_ALIGNMENT)
+
+        self.__map.flush()
+        self.__map.close()
+        self.__file.seek(size)
+        self.__file.write(bytes(offset - size))
+        self.__file.write(data)
+        self.__file.flush()
+        self.__map = mmap.mmap(self.__file.fileno(), 0)
+
+        struct.pack_into('>I', self.__map, 0x08, len(self.__map))
+        return offset
+
+    def __getFolder(self, magic: bytes) -> int:
+        folder = BRRES_FOLDERS.get(magic)
+        if folder is None:
+            raise ValueError("Unsupported sub-file type %s" % magic)
+        entry = self.__findEntry(self.__root_group, folder)
+        if entry is None:
+            raise ValueError("The BRRES file has no %s folder"
+                             % folder.decode('ascii'))
+        return entry
+
+    def findSubfile(self, magic: bytes, name: str) -> int:
+        """
+        Returns the offset of the sub-file of the given type and name, or
+        None if there is no such sub-file.
+        """
+        folder_entry = self.__getFolder(magic)
+        group_offset = self.__root_group + self.__unpack('>i', folder_entry + 12)
+        entry = self.__findEntry(group_offset, encodeName(name))
+        if entry is None:
+            return None
+        return group_offset + self.__unpack('>i', entry + 12)
+
+    def replaceSubfile(self, subfile: bytes) -> bool:
+        """
+        Replaces the sub-file with the same type and name as 'subfile' (a
+        complete CHR0, SRT0 or CLR0 file), or adds it if there is none.
+        Returns True if it was written over the old sub-file.
+        """
+        subfile = bytearray(subfile)
+        magic = bytes(subfile[:4])
+        name_offset = struct.unpack_from('>i', subfile, 0x14)[0]
+        name = subfile[name_offset: name_offset + struct.unpack_from(
+            '>I', subfile, name_offset - 4)[0]]
+
+        folder_entry = self.__getFolder(magic)
+        group_offset = self.__root_group + self.__unpack('>i', folder_entry + 12)
+        entry = self.__findEntry(group_offset, bytes(name))
+
+        if entry is not None:
+            offset = group_offset + self.__unpack('>i', entry + 12)
+            if len(subfile) <= self.__unpack('>I', offset + 4):
+                struct.pack_into('>i', subfile, 0x0C, -offset)
+                self.__map[offset: offset + len(subfile)] = subfile
+                return True
+
+            offset = align(len(self.__map), BRRES_ALIGNMENT)
+            struct.pack_into('>i', subfile, 0x0C, -offset)
+            self.__append(subfile)
+            struct.pack_into('>i', self.__map, entry + 12, offset - group_offset)
+            return False
+
+        # The index group cannot grow in place, so append a copy of it with
+        # an entry for the new sub-file, followed by the sub-file
+        entries = self.__readEntries(group_offset)
+        new_group_offset = align(len(self.__map), BRRES_ALIGNMENT)
+        group_size = get_index_group_size(len(entries) + 1)
+        offset = align(new_group_offset + group_size, BRRES_ALIGNMENT)
+
+        data = bytearray(offset - new_group_offset) + subfile
+        struct.pack_into('>i', data, offset - new_group_offset + 0x0C, -offset)
+        writeIndexGroup(
+            data, 0,
+            [entry_name for entry_name, string, child in entries] + [bytes(name)],
+            [child - new_group_offset for entry_name, string, child in entries]
+            + [offset - new_group_offset],
+            [string - new_group_offset for entry_name, string, child in entries]
+            + [offset + name_offset - new_group_offset])
+
+        self.__append(data)
+        struct.pack_into('>i', self.__map, folder_entry + 12,
+                         new_group_offset - self.__root_group)
+        struct.pack_into('>H', self.__map, 0x0E, self.__unpack('>H', 0x0E) + 1)
+        return False
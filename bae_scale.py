@@ -0,0 +1,406 @@
+#  ***** GPL LICENSE BLOCK *****
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#  ***** GPL LICENSE BLOCK *****
+
+# <pep8 compliant>
+
+import argparse
+import bisect
+import importlib
+import itertools
+import json
+import math
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from array import array
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+USAGE = """
+Export a synthetic armature with the 'Export All Bones' operator at several
+sizes, without Blender, and report how time and memory grow:
+    python bae_scale.py
+    python bae_scale.py --points 1x60 10x600 100x6000 500x20000 --save scale.json
+
+Each point BONESxFRAMES runs in its own process with a fake bpy module. Every
+bone animates scale, rotation and translation on all three axes, with a
+keyframe every --key-step frames. The report lists the wall time, the growth
+of the peak resident set size (RSS) and the tracemalloc peak of each point,
+and flags growth between points that is faster than linear in the number of
+keyframes. Measuring allocations with tracemalloc is slow, so large points
+such as 500x20000 are best run with --no-tracemalloc.
+"""
+
+DEFAULT_POINTS = ('1x60', '5x300', '10x600', '30x2000')
+
+
+def getArguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="bae_scale.py",
+        description="Measure how the export of all bones of an armature scales.",
+        epilog=USAGE,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', nargs='+', default=DEFAULT_POINTS,
+                        help="sizes to export, as BONESxFRAMES")
+    parser.add_argument('--key-step', type=int, default=1,
+                        help="frames between keyframes (1 = baked)")
+    parser.add_argument('--format', default='i4', choices=('i4', 'i6', 'i12'),
+                        help="requested format of all channels")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="encoding worker processes (0 = one per core)")
+    parser.add_argument('--no-tracemalloc', action='store_true',
+                        help="skip the second export measuring allocations")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="growth exponents above 1 + tolerance are "
+                        "flagged as super-linear (default 0.25)")
+    parser.add_argument('--save', help="write the report to this JSON file")
+    parser.add_argument('--point', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+# Fake bpy: just enough of Blender's API for the add-on to import and export
+
+class FakeProperty():
+
+    def __init__(self, default=None, **options):
+        self.default = default
+
+
+def makePropertyFunction(default):
+    def function(**options):
+        return FakeProperty(options.pop('default', default), **options)
+    return function
+
+
+class FakeKeyframePoints():
+    """
+    Keyframe points stored in flat arrays, read with foreach_get like
+    Blender's FCurveKeyframePoints. Iterating gives the keyframe points, which
+    only have the Bezier interpolation, as foreach_get cannot read enums.
+    """
+
+    keyframe_point = types.SimpleNamespace(interpolation='BEZIER')
+
+    def __init__(self, frames: array, values: array, slopes: array):
+        self.frames = frames
+        self.values = values
+        self.slopes = slopes
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def __iter__(self):
+        return itertools.repeat(self.keyframe_point, len(self.frames))
+
+    def foreach_get(self, name: str, buffer):
+        third = 1 / 3
+        if name == 'co':
+            buffer[0::2] = self.frames
+            buffer[1::2] = self.values
+        elif name in ('handle_left', 'handle_right'):
+            sign = -1 if name == 'handle_left' else 1
+            buffer[0::2] = array('f', (frame + sign * third for frame in self.frames))
+            buffer[1::2] = array('f', (value + sign * third * slope for value, slope
+                                       in zip(self.values, self.slopes)))
+        else:
+            raise TypeError("foreach_get of '%s' is not supported" % name)
+
+
+class FakeFCurve():
+
+    def __init__(self, data_path: str, array_index: int, frames: array,
+                 values: array, slopes: array):
+        self.data_path = data_path
+        self.array_index = array_index
+        self.keyframe_points = FakeKeyframePoints(frames, values, slopes)
+        self.is_empty = not len(frames)
+
+    def evaluate(self, frame: float) -> float:
+        frames = self.keyframe_points.frames
+        values = self.keyframe_points.values
+        i = bisect.bisect_right(frames, frame) - 1
+        if i < 0:
+            return values[0]
+        if i >= len(frames) - 1:
+            return values[-1]
+        u = (frame - frames[i]) / (frames[i + 1] - frames[i])
+        return values[i] + u * (values[i + 1] - values[i])
+
+
+def installFakeBpy(directory: str) -> types.ModuleType:
+    """
+    Registers a fake bpy module whose blend file is saved in 'directory'.
+    """
+    bpy = types.ModuleType('bpy')
+
+    class Types(types.ModuleType):
+        def __getattr__(self, name):
+            cls = type(name, (), {'report': lambda self, *args: None})
+            setattr(self, name, cls)
+            return cls
+
+    bpy.types = Types('bpy.types')
+
+    bpy.props = types.ModuleType('bpy.props')
+    for name, default in (('BoolProperty', False), ('IntProperty', 0),
+                          ('FloatProperty', 0.0), ('StringProperty', ""),
+                          ('EnumProperty', None), ('FloatVectorProperty', ()),
+                          ('PointerProperty', None)):
+        setattr(bpy.props, name, makePropertyFunction(default))
+
+    bpy.app = types.ModuleType('bpy.app')
+    bpy.app.handlers = types.ModuleType('bpy.app.handlers')
+    bpy.app.handlers.persistent = lambda function: function
+    for name in ('load_post', 'save_post', 'depsgraph_update_post'):
+        setattr(bpy.app.handlers, name, [])
+
+    bpy.path = types.SimpleNamespace(
+        clean_name=lambda name: re.sub(r'[^\w.-]', '_', name),
+        abspath=lambda path: path)
+    bpy.data = types.SimpleNamespace(
+        is_saved=True, filepath=os.path.join(directory, "scale.blend"))
+    bpy.msgbus = types.SimpleNamespace(clear_by_owner=lambda owner: None,
+                                       subscribe_rna=lambda **options: None)
+    bpy.utils = types.SimpleNamespace(register_class=lambda cls: None,
+                                      unregister_class=lambda cls: None)
+    bpy.context = types.SimpleNamespace()
+
+    sys.modules.update({'bpy': bpy, 'bpy.types': bpy.types,
+                        'bpy.props': bpy.props, 'bpy.app': bpy.app,
+                        'bpy.app.handlers': bpy.app.handlers})
+    return bpy
+
+
+def importAddon():
+    directory = os.path.dirname(os.path.abspath(__file__))
+    if os.path.dirname(directory) not in sys.path:
+        sys.path.insert(0, os.path.dirname(directory))
+    return importlib.import_module(os.path.basename(directory))
+
+
+def makeSettings(addon, arguments: argparse.Namespace, frames: int):
+    """
+    Returns the defaults of the add-on's scene properties, with every channel
+    enabled.
+    """
+    # An instance of the property group, as in Blender, so the settings can be
+    # copied by property name (see bae_ops.SettingsSnapshot)
+    properties = addon.bae_main.BrresAnimationExporterProperties
+    settings = properties()
+    for name, value in properties.__annotations__.items():
+        if isinstance(value, FakeProperty):
+            setattr(settings, name, value.default)
+
+    settings.node_type = 'CHR0'
+    settings.start_frame = 1
+    settings.end_frame = frames
+    for group in ('scale', 'rotation', 'translation'):
+        setattr(settings, group, True)
+        setattr(settings, group + '_format', arguments.format)
+    settings.encode_workers = arguments.workers
+    settings.use_export_cache = False
+    return settings
+
+
+def makeArmature(bones: int, frames: int, key_step: int):
+    """
+    Returns a fake armature object with an action animating every channel of
+    every bone.
+    """
+    fcurves = []
+    key_frames = array('f', range(1, frames + 1, key_step))
+    for bone in range(bones):
+        for channel, default in (('scale', 1), ('rotation_euler', 0),
+                                 ('location', 0)):
+            for axis in range(3):
+                phase = bone + axis / 3
+                values = array('f', (default + 0.5 * math.sin(frame / 30 + phase)
+                                     for frame in key_frames))
+                slopes = array('f', (0.5 / 30 * math.cos(frame / 30 + phase)
+                                     for frame in key_frames))
+                fcurves.append(FakeFCurve('pose.bones["Bone%03d"].%s' % (bone, channel),
+                                          axis, key_frames, values, slopes))
+
+    action = types.SimpleNamespace(fcurves=fcurves)
+    return types.SimpleNamespace(
+        name="Armature", type='ARMATURE',
+        animation_data=types.SimpleNamespace(action=action),
+        data=types.SimpleNamespace(bones=[types.SimpleNamespace(name="Bone%03d" % i)
+                                          for i in range(bones)]))
+
+
+def getRss() -> int:
+    """
+    Returns the resident set size of this process in bytes, or 0 if unknown.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def getPeakRss() -> int:
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def measurePoint(arguments: argparse.Namespace) -> dict:
+    """
+    Runs the export of one point in this process and returns its measurements.
+    """
+    bones, frames = (int(number) for number in arguments.point.split('x'))
+    directory = tempfile.mkdtemp()
+    bpy = installFakeBpy(directory)
+    addon = importAddon()
+
+    settings = makeSettings(addon, arguments, frames)
+    obj = makeArmature(bones, frames, arguments.key_step)
+    bpy.context.scene = types.SimpleNamespace(
+        brres_animation_exporter_properties=settings)
+    context = types.SimpleNamespace(scene=bpy.context.scene, active_object=obj)
+
+    operator = addon.bae_ops.BRRESANIMATIONEXPORTER_OT_Armature()
+    messages = []
+    operator.report = lambda report_type, message: messages.append(message)
+
+    # the console summary is not measured
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        rss_before = getRss()
+        started = time.perf_counter()
+        operator.execute(context)
+        wall = time.perf_counter() - started
+        peak_rss = getPeakRss()
+
+        allocated = None
+        if not arguments.no_tracemalloc:
+            tracemalloc.start()
+            operator.execute(context)
+            allocated = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    written = sum(os.path.getsize(os.path.join(directory, name))
+                  for name in os.listdir(directory))
+    return {
+        'bones': bones,
+        'frames': frames,
+        'keyframes': 9 * bones * len(range(1, frames + 1, arguments.key_step)),
+        'wall': wall,
+        'rss_growth': max(peak_rss - rss_before, 0) if rss_before else None,
+        'peak_rss': peak_rss,
+        'tracemalloc_peak': allocated,
+        'bytes_written': written,
+        'report': messages[-1] if messages else None
+    }
+
+
+def runPoint(arguments: argparse.Namespace, point: str) -> dict:
+    command = [sys.executable, os.path.abspath(__file__), '--point', point,
+               '--key-step', str(arguments.key_step), '--format', arguments.format,
+               '--workers', str(arguments.workers)]
+    if arguments.no_tracemalloc:
+        command.append('--no-tracemalloc')
+    process = subprocess.run(command, stdout=subprocess.PIPE,
+                             universal_newlines=True)
+    if process.returncode:
+        raise RuntimeError("Point %s failed with exit code %s"
+                           % (point, process.returncode))
+    return json.loads(process.stdout.splitlines()[-1])
+
+
+def getGrowthExponent(before: dict, after: dict, name: str) -> float:
+    """
+    Returns k such that 'name' grew like (number of keyframes)^k between two
+    points, or None if it cannot be told.
+    """
+    if not before[name] or not after[name] or after['keyframes'] == before['keyframes']:
+        return None
+    return (math.log(after[name] / before[name])
+            / math.log(after['keyframes'] / before['keyframes']))
+
+
+def report(points: list, tolerance: float) -> list:
+    """
+    Prints a table of the points and returns a line for every measurement that
+    grew faster than linearly between consecutive points.
+    """
+    print("%12s %12s %10s %12s %12s %10s" % (
+        "point", "keyframes", "wall (s)", "RSS (MiB)", "traced (MiB)", "us/key"))
+    for point in points:
+        print("%12s %12s %10.3f %12s %12s %10.3f" % (
+            "%sx%s" % (point['bones'], point['frames']), point['keyframes'],
+            point['wall'],
+            "%.1f" % (point['rss_growth'] / 2**20) if point['rss_growth'] is not None else "-",
+            "%.1f" % (point['tracemalloc_peak'] / 2**20)
+            if point['tracemalloc_peak'] is not None else "-",
+            1e6 * point['wall'] / point['keyframes']))
+
+    flagged = []
+    for before, after in zip(points, points[1:]):
+        for name in ('wall', 'rss_growth', 'tracemalloc_peak'):
+            exponent = getGrowthExponent(before, after, name)
+            if exponent is not None and exponent > 1 + tolerance:
+                flagged.append("%s grew like keyframes^%.2f from %sx%s to %sx%s" % (
+                    name, exponent, before['bones'], before['frames'],
+                    after['bones'], after['frames']))
+    return flagged
+
+
+def main() -> int:
+    arguments = getArguments()
+
+    if arguments.point is not None:
+        print(json.dumps(measurePoint(arguments)))
+        return 0
+
+    points = []
+    for point in arguments.points:
+        points.append(runPoint(arguments, point))
+        print("%s: %.3f s" % (point, points[-1]['wall']), file=sys.stderr)
+
+    flagged = report(points, arguments.tolerance)
+
+    if arguments.save:
+        with open(arguments.save, 'w') as file:
+            json.dump({'arguments': vars(arguments), 'points': points,
+                       'super_linear': flagged}, file, indent=2)
+
+    if flagged:
+        print("\nSuper-linear growth:\n%s" % '\n'.join(flagged))
+        return 1
+    print("\nNo measurement grew faster than keyframes^%.2f" % (1 + arguments.tolerance))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,198 @@
+#  ***** GPL LICENSE BLOCK *****
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#  ***** GPL LICENSE BLOCK *****
+
+# <pep8 compliant>
+
+import functools
+import json
+import os
+import threading
+import time
+
+# This module must not import bpy, so that exports can be traced outside of
+# Blender. When it is not loaded as part of the add-on package, fall back to
+# importing its siblings from the same directory.
+try:
+    from .bae_globals import *
+except ImportError:
+    from bae_globals import *
+
+
+class Span():
+    """
+    A named, timed region of an export, recorded when the 'with' block exits.
+    Values added with set are stored as the arguments of the span.
+    """
+    __slots__ = ('tracer', 'name', 'args', 'started')
+
+    def __init__(self, tracer, name: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.addSpan(self.name, self.started, time.perf_counter(), self.args)
+
+    def set(self, **args):
+        self.args.update(args)
+
+
+class NullSpan():
+    """
+    Span returned while tracing is disabled, which records nothing.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def set(self, **args):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer():
+    """
+    Spans and counters of one or more exports, saved in the Chrome trace event
+    format, which chrome://tracing and https://ui.perfetto.dev can display.
+    Only the process that started tracing is traced; work done by encoding
+    worker processes appears as the span of the encoding stage.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+
+    def __timestamp(self, seconds: float) -> float:
+        # microseconds since tracing started
+        return (seconds - self.origin) * 1e6
+
+    def addSpan(self, name: str, started: float, ended: float, args: dict):
+        self.events.append({
+            'name': name, 'ph': 'X', 'pid': self.pid,
+            'tid': threading.get_ident(),
+            'ts': self.__timestamp(started),
+            'dur': (ended - started) * 1e6,
+            'args': args
+        })
+
+    def addCounter(self, name: str, values: dict):
+        self.events.append({
+            'name': name, 'ph': 'C', 'pid': self.pid,
+            'ts': self.__timestamp(time.perf_counter()),
+            'args': values
+        })
+
+    def getTotals(self) -> dict:
+        """
+        Returns the total time in seconds spent in spans of each name, and the
+        sum of every counter, by name.
+        """
+        totals = {}
+        for event in self.events:
+            if event['ph'] == 'X':
+                totals[event['name']] = totals.get(event['name'], 0) + event['dur'] / 1e6
+            else:
+                for key, value in event['args'].items():
+                    name = '%s.%s' % (event['name'], key)
+                    totals[name] = totals.get(name, 0) + value
+        return totals
+
+    def save(self, path: str):
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': self.events,
+                       'displayTimeUnit': 'ms'}, file)
+
+
+_tracer = None
+
+
+def span(name: str, **args):
+    """
+    Returns a context manager timing the named stage of an export, or a shared
+    span that does nothing if tracing is disabled.
+    """
+    tracer = _tracer
+    if tracer is None:
+        return NULL_SPAN
+    return Span(tracer, name, args)
+
+
+def traced(name: str, **args):
+    """
+    Decorator timing every call of a function as a span with the given name
+    and arguments.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*positional, **keywords):
+            tracer = _tracer
+            if tracer is None:
+                return function(*positional, **keywords)
+            with Span(tracer, name, dict(args)):
+                return function(*positional, **keywords)
+        return wrapper
+    return decorator
+
+
+def count(name: str, **values):
+    """
+    Records the values of a counter, such as the keyframes and bytes of an
+    axis, if tracing is enabled.
+    """
+    tracer = _tracer
+    if tracer is not None:
+        tracer.addCounter(name, values)
+
+
+def isTracing() -> bool:
+    return _tracer is not None
+
+
+def getTraceFile() -> str:
+    """
+    Returns the path exports are traced to, from TRACE_FILE or the BAE_TRACE
+    environment variable, or None if tracing is disabled.
+    """
+    return TRACE_FILE or os.environ.get('BAE_TRACE') or None
+
+
+def startTracing() -> Tracer:
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def stopTracing(path: str = None) -> Tracer:
+    """
+    Stops tracing and returns the tracer, after saving it to 'path' if given.
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None and path:
+        tracer.save(path)
+    return tracer
@@ -0,0 +1,314 @@
+#  ***** GPL LICENSE BLOCK *****
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#  ***** GPL LICENSE BLOCK *****
+
+# <pep8 compliant>
+
+"""
+Tests of the bpy-free encoder, run without Blender:
+    python -m pytest tests
+    python -m unittest discover tests
+
+Fixed keyframes are encoded through the pure Python and NumPy paths, and the
+SHA-256 of the output compared to that of the nodes written by the encoder
+before its optimisations (and of the files written since the file versions
+changed), so any change to the bytes written is caught. Values and tangents
+are exact binary fractions, so the expected bytes do not depend on the
+platform's maths library.
+"""
+
+import hashlib
+import os
+import struct
+import sys
+import tempfile
+import unittest
+
+# The encoder modules import their siblings from the same directory when not
+# loaded as part of the add-on package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bae_encoder  # noqa: E402
+from bae_encoder import *  # noqa: E402
+from bae_brres import *  # noqa: E402
+from bae_cache import ExportCache, packResult, unpackResult  # noqa: E402
+from bae_engine import EncodingEngine, encodeChrTask, getSettingsPayload  # noqa: E402
+
+
+def makeKeyframes(count: int, seed: int) -> list:
+    """
+    Returns 'count' (frame, value, tangent) keyframes, one every two frames.
+    Some tangents are the integer 0, as for constant segments, and some
+    values and tangents are 0.0.
+    """
+    keyframes = []
+    for i in range(count):
+        k = 7 * i + seed
+        tangent = 0 if k % 5 == 0 else (k % 11 - 5) / 16
+        keyframes.append((2 * i, (k % 13 - 6) / 8, tangent))
+    return keyframes
+
+
+def makeValues(count: int, seed: int) -> list:
+    return [((5 * i + seed) % 17 - 8) / 4 for i in range(count)]
+
+
+def makeBone(formats: list, count: int) -> list:
+    """
+    Returns the keyframes of a bone in the given formats: an animated, a
+    constant and an empty axis for each of scale, rotation and translation.
+    """
+    keyframes = []
+    for srt, format in enumerate(formats):
+        if format in CHR0_LINEAR_FORMATS:
+            animated = makeValues(count, srt)
+        else:
+            animated = makeKeyframes(count, srt)
+        axes = [animated, [0.5 * srt], []]
+        # the animated axis is X for scale, Y for rotation, Z for translation
+        keyframes.append(axes[-srt:] + axes[:-srt] if srt else axes)
+    return keyframes
+
+
+# name: (formats, keyframes per axis, EncoderSettings arguments)
+CHR0_CASES = {
+    'i4': (['i4', 'i4', 'i4'], 24, {}),
+    'i6': (['i6', 'i6', 'i6'], 40, {}),
+    'i12': (['i12', 'i12', 'i12'], 40, {}),
+    'short': (['i4', 'i6', 'i12'], 4, {}),
+    'l1': (['i6', 'l1', 'i12'], 30, {}),
+    'l4': (['i4', 'l4', 'i6'], 30, {}),
+    'no swap': (['i6', 'i12', 'i4'], 24, {'xyz_to_xzy': False}),
+    'radians': (['i12', 'i12', 'i12'], 24, {'convert_to_degrees': False}),
+    'radians linear': (['i4', 'l4', 'i6'], 24, {'convert_to_degrees': False}),
+    'scaled': (['i4', 'i6', 'i12'], 24, {'scale_translation': 16.0}),
+}
+
+# Cases of features that did not exist before the optimisations
+CHR0_FEATURE_CASES = {
+    'reduced': (['i12', 'i12', 'i12'], 40, {'reduce_keyframes': True,
+                                            'reduction_tolerance': 0.25}),
+    'error bounded': (['i12', 'i12', 'i12'], 40, {'error_bounded_format': True,
+                                                  'format_tolerance': 0.5}),
+}
+
+GOLDEN_CHR0 = {
+    'i4':
+        '0f8f6531b5f2b284db0a83face71d71ebb2fbf6639f86d5a0120532bd8a4e70e',
+    'i6':
+        '7664d64005f31867790cb41b514ac58b39a9cde88676ef642c65f2070908e29b',
+    'i12':
+        '9a9de7551abf99f5cf073889892ddca549508571e344f291910c5ccfed0fe5b2',
+    'short':
+        '90198d55cb1cc80866f7fc88440c6bdd8dec7c8b9163cdfb5966cc6319edd58f',
+    'l1':
+        '03aa71f1a06faf68b0778dfc1acf625ca2b914e13b2c7ecf50876e1d5c9cf877',
+    'l4':
+        '294dbe2a47a66d5414da7f38a1c1fd2567a3f004a55d820fb636b8cbddf5897e',
+    'no swap':
+        '9abcf98416051732f83dcecdcb001a50a3fd3321cc3ef20cea9e691b73793aa2',
+    'radians':
+        'ee5c1eb4bd019a84ed408f80b41c2fb4cbd927bc8980932080022f0e621c55e2',
+    'radians linear':
+        'e49b285655bd2f0c236ee378af7332fa2e890a7f9604a902924488e2b806d055',
+    'scaled':
+        '9a5024751fa82fda68442c7d2fed654da066291e196a220a0040c012a10708ca',
+    'reduced':
+        'bec0c9296b8709dcada52b91aef34ecfc129f2d4671b0695010d98f8a9a7954d',
+    'error bounded':
+        '3d35ea9a0a9183f42bb98a90b3c43eb4667192ae40cb6472766c43e96f665329',
+}
+
+GOLDEN_SRT0 = '19e8b524b0de79565c899917adc3792f5eb10cb9d98e6828bf267c17311e991f'
+GOLDEN_CLR0 = 'fa4067ae43b0a5d1be55e457f806a275e159a08cc2d8f69cd70c5f520059b19e'
+
+# CHR0 version 4, SRT0 version 4 and CLR0 version 3
+GOLDEN_CHR0_FILE = 'e05a825b8837400d306113660787bac7ddb133c659df5e49165f2967e8eb6a55'
+GOLDEN_SRT0_FILE = 'b09ff2b4246927c96d3116c7e7edbc166471123408729433d5eecf7ed17fa984'
+GOLDEN_CLR0_FILE = '2deb551616d516957a3ebc485edee55de62d4eeafea0914c333e0deac45ca675'
+
+
+def getDigest(data: bytes) -> str:
+    return hashlib.sha256(bytes(data)).hexdigest()
+
+
+def encodeCase(name: str) -> bytearray:
+    formats, count, settings = {**CHR0_CASES, **CHR0_FEATURE_CASES}[name]
+    return get_chr_node(makeBone(formats, count), formats,
+                        EncoderSettings(**settings), "Bone")
+
+
+def makeSrtData(count: int) -> list:
+    return [makeKeyframes(count, i) for i in range(3)] + [[0.25], []]
+
+
+def makeClrData(count: int) -> list:
+    return [[(i % 9) / 8 for i in range(count)], [0.5],
+            [((3 * i) % 5) / 4 for i in range(count)], [1.0]]
+
+
+class EncoderTests():
+    """
+    Tests run through both paths of the encoder. Subclasses set 'numpy'.
+    """
+
+    numpy = False
+
+    def setUp(self):
+        self.np = bae_encoder.np
+        if not self.numpy:
+            bae_encoder.np = None
+        elif bae_encoder.np is None:
+            self.skipTest("NumPy is not installed")
+
+    def tearDown(self):
+        bae_encoder.np = self.np
+
+    def test_chr0_nodes(self):
+        for name in CHR0_CASES:
+            with self.subTest(name):
+                self.assertEqual(getDigest(encodeCase(name)), GOLDEN_CHR0[name])
+
+    def test_chr0_features(self):
+        for name in CHR0_FEATURE_CASES:
+            with self.subTest(name):
+                self.assertEqual(getDigest(encodeCase(name)), GOLDEN_CHR0[name])
+
+    def test_srt0_node(self):
+        self.assertEqual(getDigest(get_srt_node(makeSrtData(40))), GOLDEN_SRT0)
+
+    def test_clr0_node(self):
+        node = get_clr_node(makeClrData(30), [1.0, 1.0, 1.0, 0.0], 30)
+        self.assertEqual(getDigest(node), GOLDEN_CLR0)
+
+    def test_files(self):
+        bones = [(name, encodeChrBone(makeBone(formats, count), formats,
+                                      EncoderSettings(**settings)))
+                 for name, (formats, count, settings) in CHR0_CASES.items()]
+        self.assertEqual(getDigest(get_chr0_file("Walk", bones, 80, True)),
+                         GOLDEN_CHR0_FILE)
+        self.assertEqual(getDigest(get_srt0_file(
+            "Scroll", [("Water", [(0, get_srt_node(makeSrtData(40)))])], 80)),
+            GOLDEN_SRT0_FILE)
+        self.assertEqual(getDigest(get_clr0_file(
+            "Glow", [("Lamp", [(CLR0_TARGET_DIFFUSE, makeClrData(30),
+                                [1.0, 1.0, 1.0, 0.0])])], 30)),
+            GOLDEN_CLR0_FILE)
+
+    def test_packing_matches_lists(self):
+        # Interpolated keyframes pack the same from arrays as from lists
+        for format in ('i4', 'i6'):
+            keyframes = makeKeyframes(40, 3)
+            stats = AxisStats(AxisKeyframes.fromList(keyframes))
+            step, base = 1 / 64, stats.min_value
+            self.assertEqual(
+                packInterpolatedKeyframes(AxisKeyframes.fromList(keyframes),
+                                          step, base, format),
+                packInterpolatedKeyframes(keyframes, step, base, format))
+
+    def test_hermite_matches_pure_python(self):
+        # segments three frames wide, so rounding differs if the arithmetic does
+        keyframes = AxisKeyframes.fromList([
+            (3 * frame // 2, value, tangent)
+            for frame, value, tangent in makeKeyframes(40, 1)])
+        frames = [frame / 7 for frame in range(-7, 900)]
+        values = list(evaluateHermite(keyframes, frames))
+        bae_encoder.np = None
+        self.assertEqual(values, list(evaluateHermite(keyframes, frames)))
+
+    def test_transform_in_place(self):
+        keyframes = AxisKeyframes.fromList(makeKeyframes(40, 2))
+        values = list(keyframes.values)
+        anim_data = ChrAnimData()
+        anim_data.updateFormat('i12')
+        anim_data.updateData(1, keyframes)
+        anim_data.updateFlags()
+        anim_data.formatData(2, EncoderSettings(scale_translation=4.0))
+
+        # Y and Z are swapped by reference, and the values scaled in place
+        self.assertIs(anim_data.zData(), keyframes)
+        self.assertEqual(list(keyframes.values), [-4.0 * value for value in values])
+
+    def test_scale_matches_lists(self):
+        # Integer zeros stay 0 when multiplied by an integer, where 0.0
+        # becomes -0.0, as they did when keyframes were scaled as lists
+        for data in (makeKeyframes(40, 0), makeKeyframes(4, 0),
+                     [0, 0.0, 0.5] * 8, [0, 0.0, 0.5]):
+            for factor in (-1, -4.0, 16):
+                keyframes = AxisKeyframes.fromList(data)
+                keyframes.scale(factor)
+                if keyframes.isInterpolated():
+                    expected = [(frame, float(value * factor),
+                                 float(tangent * factor))
+                                for frame, value, tangent in data]
+                else:
+                    expected = [float(value * factor) for value in data]
+                self.assertEqual(repr(list(keyframes)), repr(expected))
+
+    def test_cache_round_trip(self):
+        payloads = [(makeBone(formats, count), formats,
+                     getSettingsPayload(EncoderSettings(**settings)))
+                    for formats, count, settings in CHR0_CASES.values()]
+        results = [encodeChrTask(payload) for payload in payloads]
+        for result in results:
+            unpacked = unpackResult('chr0', packResult('chr0', result))
+            self.assertEqual(combineSRT(*unpacked[0]), combineSRT(*result[0]))
+            self.assertEqual(unpacked[1:], result[1:])
+
+        with tempfile.TemporaryDirectory() as directory:
+            engine = EncodingEngine(1)
+            ExportCache(directory).map(engine, 'chr0', payloads)
+            cache = ExportCache(directory)
+            cached = cache.map(engine, 'chr0', payloads)
+        self.assertEqual(cache.hits, len(payloads))
+        self.assertEqual([combineSRT(*result[0]) for result in cached],
+                         [combineSRT(*result[0]) for result in results])
+
+    def test_cache_rejects_invalid_entries(self):
+        entry = packResult('chr0', encodeChrTask(
+            (makeBone(['i4', 'i6', 'i12'], 8), ['i4', 'i6', 'i12'],
+             getSettingsPayload(EncoderSettings()))))
+        for invalid in (entry[:len(entry) // 2], entry + b'\0', b'x' + entry[1:]):
+            with self.assertRaises((ValueError, struct.error)):
+                unpackResult('chr0', invalid)
+
+
+class TestPurePython(EncoderTests, unittest.TestCase):
+    numpy = False
+
+
+class TestNumPy(EncoderTests, unittest.TestCase):
+    numpy = True
+
+
+class TestFiles(unittest.TestCase):
+
+    def test_versions(self):
+        # Versions 4, 4 and 3 have no user data offset, as the headers written
+        for file, version in ((get_chr0_file("a", [], 1), 4),
+                              (get_srt0_file("a", [], 1), 4),
+                              (get_clr0_file("a", [], 1), 3)):
+            self.assertEqual(file[8:12], struct.pack('>I', version))
+
+    def test_invalid_names(self):
+        anim_data = encodeChrBone([[[], [], []]] * 3, ['i4'] * 3, EncoderSettings())
+        for names in (["é"], ["Armé", "Arm"]):
+            with self.assertRaises(ValueError):
+                get_chr0_file("a", [(name, anim_data) for name in names], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+#  ***** GPL LICENSE BLOCK *****
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#  ***** GPL LICENSE BLOCK *****
+
+# <pep8 compliant>
+
+"""
+Tests of the unique filenames of written files, run without Blender.
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bae_output  # noqa: E402
+
+
+class TestWriteUniqueFile(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.addCleanup(bae_output._indices.clear)
+        with open(os.path.join(self.directory.name, "Walk.chr0"), 'wb'):
+            pass
+
+    def write(self, head: str) -> str:
+        path = bae_output.writeUniqueFile(self.directory.name, head, '.chr0', b'')
+        return os.path.basename(path)
+
+    def test_names(self):
+        self.assertEqual([self.write("Walk") for i in range(3)],
+                         ["Walk(1).chr0", "Walk(2).chr0", "Walk(3).chr0"])
+        self.assertEqual(self.write("Run"), "Run.chr0")
+
+    def test_directory_scanned_once(self):
+        # Files written by the add-on are added to the index, so the change to
+        # the directory's modification time they cause triggers no rescan
+        with mock.patch.object(bae_output.os, 'scandir',
+                               wraps=os.scandir) as scandir:
+            for i in range(20):
+                self.write("Walk")
+            self.assertEqual(scandir.call_count, 1)
+
+            # A file written by another program is found by a rescan
+            with open(os.path.join(self.directory.name, "Walk(21).chr0"), 'wb'):
+                pass
+            os.utime(self.directory.name, ns=(0, 0))
+            self.assertEqual(self.write("Walk"), "Walk(22).chr0")
+            self.assertEqual(scandir.call_count, 2)
+
+    def test_existing_file_not_overwritten(self):
+        self.write("Walk")
+        directory_stat = os.stat(self.directory.name)
+        # Created within the resolution of the modification time, so the
+        # index is not rebuilt; the exclusive creation finds it
+        with open(os.path.join(self.directory.name, "Walk(2).chr0"), 'wb') as file:
+            file.write(b'other')
+        with mock.patch.object(bae_output.os, 'stat', return_value=directory_stat):
+            self.assertEqual(self.write("Walk"), "Walk(3).chr0")
+        with open(os.path.join(self.directory.name, "Walk(2).chr0"), 'rb') as file:
+            self.assertEqual(file.read(), b'other')
+
+
+if __name__ == '__main__':
+    unittest.main()